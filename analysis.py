@@ -4,6 +4,7 @@ MIT License, see LICENSE file for complete text.
 Copyright (c) 2020 SADA Systems, Inc.
 """
 
+import os
 import glob
 import math
 
@@ -11,7 +12,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-import config, history
+import config, history, utilisation
 
 
 def bq_reserve_cost(dt, slots):
@@ -157,6 +158,62 @@ def plot_dual(df1, df2, y1_label="", y2_label="", drop=None, save_dir=None, suff
     return fig
 
 
+def plot_utilisation(df_times, df_util, metric, y_label=None, save_dir=None, suffix=None,
+                     figsize=(30, 8)):
+    """Plot each query's run time as a bar on the driver timeline with
+    warehouse utilisation on a second axis
+
+    Parameters
+    ----------
+    df_times : Pandas DataFrame, timing data with query_n, seq_n,
+        driver_t0 and driver_t1
+    df_util : Pandas DataFrame, utilisation samples with period_start,
+        see utilisation.read
+    metric : str, column of df_util to plot, i.e. 'slots' or 'avg_running'
+    y_label : str, label for the utilisation axis, if None metric
+    save_dir : str, path to directory to save plot to. If not set, nothing is saved.
+    suffix : str, suffix for save_dir file name
+    figsize : tuple, (w, h) where w = width, h = height in inches
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+    """
+    df_times = df_times.sort_values("driver_t0").reset_index(drop=True)
+    t0 = pd.to_datetime(df_times.driver_t0, utc=True)
+    t1 = pd.to_datetime(df_times.driver_t1, utc=True)
+    df_util = df_util.sort_values("period_start")
+
+    fig, ax1 = plt.subplots(1, 1)
+    fig.set_size_inches(figsize[0], figsize[1], forward=True)
+
+    color_palette = sns.hls_palette(n_colors=12)
+    streams = list(df_times.seq_n.astype(str).unique())
+    colors = [color_palette[streams.index(s) % 12] for s in df_times.seq_n.astype(str)]
+    ax1.barh(y=df_times.index, width=(t1 - t0).dt.total_seconds() / 86400,
+             left=t0.dt.tz_localize(None), color=colors, height=0.8)
+    ax1.set_yticks(df_times.index)
+    ax1.set_yticklabels(df_times.query_n)
+    ax1.set_ylabel("Query Number")
+    ax1.set_xlabel("UTC Time")
+
+    ax2 = ax1.twinx()
+    ax2.step(df_util.period_start.dt.tz_localize(None), df_util[metric],
+             where="post", color="black", alpha=0.6)
+    ax2.set_ylabel(metric if y_label is None else y_label)
+    ax2.set_ylim(bottom=0)
+
+    if save_dir is not None:
+        if suffix is not None:
+            suffix = "_" + suffix
+        else:
+            suffix = ""
+        plot_fp = f"plot_utilisation{suffix}.png"
+        plt.savefig(save_dir + config.sep + plot_fp, bbox_to_anchor='tight')
+
+    return fig
+
+
 class MultiResult:
     def __init__(self):
         self.results_dir = None
@@ -174,6 +231,8 @@ class MultiResult:
         self.df_agg_prelim = None
         self.df_agg = None
 
+        self.df_util = None
+
         self.verbose = True
 
     def local_inventory(self):
@@ -186,7 +245,8 @@ class MultiResult:
         self.df = pd.DataFrame(d, columns=["data_type", "system", "test", "scale", "cid", "desc", "date", "time"])
         self.df["fp"] = self.data_folders
 
-        query_files = glob.glob(self.results_dir + config.sep + "result*" + config.sep + "benchmark_times*")
+        query_files = glob.glob(self.results_dir + config.sep + "result*" + config.sep +
+                                "**" + config.sep + "benchmark_times*", recursive=True)
         query_data = []
         for qf in query_files:
             _df = pd.read_csv(qf)
@@ -194,9 +254,53 @@ class MultiResult:
         self.df_query = pd.concat(query_data)
         self.df_query.drop_duplicates(subset="qid", inplace=True)
 
+    def utilisation_inventory(self):
+        """Load utilisation samples written during query streams, with
+        the result folder each came from in column 'fp'"""
+        util_files = glob.glob(self.results_dir + config.sep + "result*" + config.sep +
+                               "**" + config.sep + "utilisation_*.csv", recursive=True)
+        data = []
+        for uf in util_files:
+            _df = utilisation.read(uf)
+            folder = os.path.relpath(uf, self.results_dir).split(config.sep)[0]
+            _df["fp"] = self.results_dir + config.sep + folder
+            data.append(_df)
+        if len(data) > 0:
+            self.df_util = pd.concat(data, ignore_index=True)
+
+    def utilisation_overlay(self, fp, metric=None, save=True):
+        """Plot the query timeline of one result folder with its
+        utilisation samples, see plot_utilisation
+
+        Parameters
+        ----------
+        fp : str, result folder, a value of self.df.fp
+        metric : str, utilisation column to plot, if None the default
+            for the folder's system, see utilisation.overlay_metric
+        save : bool, save the plot to the result folder
+
+        Returns
+        -------
+        matplotlib.figure.Figure
+        """
+        if self.df_util is None:
+            self.utilisation_inventory()
+        df_util = self.df_util.loc[self.df_util.fp == fp]
+        if metric is None:
+            metric = utilisation.overlay_metric[df_util.db.iloc[0]]
+
+        times_files = glob.glob(fp + config.sep + "**" + config.sep + "benchmark_times*",
+                                recursive=True)
+        df_times = pd.concat([pd.read_csv(tf) for tf in times_files])
+        if "status" in df_times.columns:
+            df_times = df_times.loc[df_times.status != "skipped"]
+
+        return plot_utilisation(df_times=df_times, df_util=df_util, metric=metric,
+                                save_dir=fp if save else None)
+
     def apply_history(self, row):
         """Apply History Download per file"""
-        x = glob.glob(row.fp + config.sep + "benchmark_times*")
+        x = glob.glob(row.fp + config.sep + "**" + config.sep + "benchmark_times*", recursive=True)
         df = pd.read_csv(x[0])
         t0 = df.driver_t0.min()
         t0 = pd.to_datetime(t0)
@@ -0,0 +1,326 @@
+"""Asynchronous BigQuery job execution
+
+Submits query jobs without waiting on them, polls job state with
+backoff from one poller thread, and fetches results page by page in a
+worker pool as jobs finish.  The number of running jobs is bounded,
+and each job records lifecycle timestamps from BigQuery and from the
+driver.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import time
+import threading
+import traceback
+import concurrent.futures
+
+import pandas as pd
+from google.cloud import bigquery
+
+import config, bq_tpc
+
+
+timestamp_columns = ["submitted", "created", "started", "ended",
+                     "first_row", "fetch_done"]
+
+
+class AsyncJob:
+    def __init__(self, key, query_text, labels=None):
+        """One query submitted through AsyncRunner
+
+        Parameters
+        ----------
+        key : hashable, caller's identifier for the query, i.e. query number
+        query_text : str, query text to execute
+        labels : dict, BigQuery job labels
+        """
+        self.key = key
+        self.query_text = query_text
+        self.labels = labels
+
+        self.job = None
+        self.job_id = None
+        self.state = "PENDING"
+        self.error = None
+        self.callback_error = None  # traceback text if on_result raised
+
+        # driver side
+        self.submitted = None
+        self.first_row = None
+        self.fetch_done = None
+
+        # BigQuery side
+        self.created = None
+        self.started = None
+        self.ended = None
+
+        self.total_rows = None
+        self.bytes_processed = None
+        self.df = None
+
+        self._done = threading.Event()
+        self._next_poll = None
+        self._poll_interval = None
+
+    def wait(self, timeout=None):
+        """Block until the job is fetched or failed
+
+        Returns
+        -------
+        bool, True if the job finished before timeout
+        """
+        return self._done.wait(timeout)
+
+    def done(self):
+        return self._done.is_set()
+
+    def timestamps(self):
+        """Lifecycle timestamps and job summary
+
+        Returns
+        -------
+        dict, with the keys in timestamp_columns plus key, job_id, state,
+            total_rows, bytes_processed, error and callback_error
+        """
+        d = {"key": self.key, "job_id": self.job_id, "state": self.state}
+        for c in timestamp_columns:
+            d[c] = getattr(self, c)
+        d["total_rows"] = self.total_rows
+        d["bytes_processed"] = self.bytes_processed
+        d["error"] = self.error
+        d["callback_error"] = self.callback_error
+        return d
+
+
+class AsyncRunner:
+    def __init__(self, dataset, project=None, max_in_flight=None,
+                 fetch_workers=None, fetch=True, cache=False,
+                 on_result=None, verbose=False):
+        """Run BigQuery query jobs with a bounded in-flight window
+
+        Parameters
+        ----------
+        dataset : str, default BigQuery dataset, i.e. 'ds_100GB_01'
+        project : str, GCP project, if None config.gcp_project
+        max_in_flight : int, maximum jobs submitted and not yet finished,
+            if None config.bq_async_max_in_flight
+        fetch_workers : int, threads fetching results,
+            if None config.bq_async_fetch_workers
+        fetch : bool, if False results are not downloaded, only counted
+        cache : bool, use the BigQuery result cache
+        on_result : callable, called with each AsyncJob once it is
+            fetched or failed, from a worker thread.  An exception it
+            raises is stored in AsyncJob.callback_error, see
+            callback_errors
+        verbose : bool, print debug statements
+        """
+        self.project = config.gcp_project.lower() if project is None else project
+        self.dataset = dataset
+
+        self.max_in_flight = max_in_flight
+        if self.max_in_flight is None:
+            self.max_in_flight = config.bq_async_max_in_flight
+
+        self.fetch_workers = fetch_workers
+        if self.fetch_workers is None:
+            self.fetch_workers = config.bq_async_fetch_workers
+
+        self.fetch = fetch
+        self.cache = cache
+        self.on_result = on_result
+        self.verbose = verbose
+
+        self.client = bq_tpc.get_client()
+
+        self.jobs = []
+
+        self._window = threading.BoundedSemaphore(self.max_in_flight)
+        self._running = []
+        self._cv = threading.Condition()
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.fetch_workers)
+        self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poller.start()
+
+    def job_config(self, labels=None):
+        job_config = bigquery.QueryJobConfig()
+        job_config.default_dataset = self.project + "." + self.dataset
+        job_config.use_query_cache = self.cache
+        if labels is not None:
+            job_config.labels = labels
+        return job_config
+
+    def submit(self, key, query_text, labels=None):
+        """Submit one query, blocking while max_in_flight jobs are running
+
+        Parameters
+        ----------
+        key : hashable, caller's identifier for the query
+        query_text : str, query text to execute
+        labels : dict, BigQuery job labels
+
+        Returns
+        -------
+        AsyncJob
+        """
+        aj = AsyncJob(key=key, query_text=query_text, labels=labels)
+        self._window.acquire()
+
+        aj.submitted = pd.Timestamp.now("UTC")
+        try:
+            aj.job = self.client.query(bq_tpc.add_view(query_text, self.project, self.dataset),
+                                       job_config=self.job_config(labels))
+        except Exception as e:
+            self._window.release()
+            aj.state = "ERROR"
+            aj.error = str(e)
+            self._finish(aj)
+            self.jobs.append(aj)
+            return aj
+
+        aj.job_id = aj.job.job_id
+        aj.state = "RUNNING"
+        aj._poll_interval = config.bq_async_poll_initial
+        aj._next_poll = time.monotonic() + aj._poll_interval
+
+        with self._cv:
+            self._running.append(aj)
+            self._cv.notify()
+        self.jobs.append(aj)
+
+        if self.verbose:
+            print("Submitted {}: {}".format(key, aj.job_id))
+        return aj
+
+    def run(self, queries, labels=None):
+        """Submit a sequence of queries and wait for all of them
+
+        Parameters
+        ----------
+        queries : iterable of (key, query_text) tuples
+        labels : dict, BigQuery job labels applied to all jobs
+
+        Returns
+        -------
+        list of AsyncJob, in submission order
+        """
+        jobs = [self.submit(k, q, labels) for k, q in queries]
+        for aj in jobs:
+            aj.wait()
+        return jobs
+
+    def _poll_loop(self):
+        while True:
+            with self._cv:
+                while len(self._running) == 0 and not self._closed:
+                    self._cv.wait()
+                if self._closed and len(self._running) == 0:
+                    return
+                now = time.monotonic()
+                due = [aj for aj in self._running if aj._next_poll <= now]
+                if len(due) == 0:
+                    next_poll = min(aj._next_poll for aj in self._running)
+                    self._cv.wait(timeout=next_poll - now)
+                    continue
+
+            for aj in due:
+                try:
+                    aj.job.reload()
+                    state = aj.job.state
+                except Exception as e:
+                    if self.verbose:
+                        print("Poll failed for {}: {}".format(aj.job_id, e))
+                    state = None
+
+                if state == "DONE":
+                    with self._cv:
+                        self._running.remove(aj)
+                    self._window.release()
+                    self._executor.submit(self._complete, aj)
+                else:
+                    # exponential backoff per job
+                    aj._poll_interval = min(aj._poll_interval * 2, config.bq_async_poll_max)
+                    aj._next_poll = time.monotonic() + aj._poll_interval
+
+    def _complete(self, aj):
+        job = aj.job
+        aj.created = job.created
+        aj.started = job.started
+        aj.ended = job.ended
+        aj.bytes_processed = job.total_bytes_processed
+
+        if job.error_result is not None:
+            aj.state = "ERROR"
+            aj.error = job.error_result.get("message")
+            self._finish(aj)
+            return
+
+        try:
+            if self.fetch:
+                self._fetch(aj)
+            else:
+                rows = job.result(max_results=0)
+                aj.total_rows = rows.total_rows
+            aj.state = "DONE"
+        except Exception as e:
+            aj.state = "ERROR"
+            aj.error = str(e)
+        self._finish(aj)
+
+    def _fetch(self, aj):
+        """Download results page by page, timing the first row"""
+        rows = aj.job.result(page_size=config.bq_async_page_size)
+        columns = [field.name for field in rows.schema]
+        data = []
+        for page in rows.pages:
+            page_rows = [list(r.values()) for r in page]
+            if aj.first_row is None and len(page_rows) > 0:
+                aj.first_row = pd.Timestamp.now("UTC")
+            data.extend(page_rows)
+        aj.total_rows = rows.total_rows
+        aj.df = pd.DataFrame(data, columns=columns)
+
+    def _finish(self, aj):
+        aj.fetch_done = pd.Timestamp.now("UTC")
+        if self.verbose:
+            print("Finished {}: {} {}".format(aj.key, aj.job_id, aj.state))
+        try:
+            if self.on_result is not None:
+                self.on_result(aj)
+        except Exception:
+            # a worker thread would drop the exception, keep it on the job
+            aj.callback_error = traceback.format_exc()
+            if self.verbose:
+                print("on_result failed for {}: {}".format(aj.key, aj.callback_error))
+        finally:
+            aj._done.set()
+
+    def timestamps(self):
+        """Lifecycle timestamps of all jobs submitted
+
+        Returns
+        -------
+        Pandas DataFrame, one row per job, see AsyncJob.timestamps
+        """
+        return pd.DataFrame([aj.timestamps() for aj in self.jobs])
+
+    def callback_errors(self):
+        """Jobs whose on_result callback raised
+
+        Returns
+        -------
+        dict, job key -> traceback text
+        """
+        return {aj.key: aj.callback_error for aj in self.jobs
+                if aj.callback_error is not None}
+
+    def close(self):
+        """Wait for all jobs and stop the poller and fetch workers"""
+        for aj in list(self.jobs):
+            aj.wait()
+        with self._cv:
+            self._closed = True
+            self._cv.notify()
+        self._poller.join()
+        self._executor.shutdown(wait=True)
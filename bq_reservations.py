@@ -152,6 +152,37 @@ class BQR:
         self.assignment(reservation_id=self.last_reservation, project=project)
         return self.last_assignment
         
+    def commitment_info(self, commitment_id):
+        """Current state of a slot purchase commitment
+        
+        Parameters
+        ----------
+        commitment_id : str, commitment ID for purchase
+        
+        Returns
+        -------
+        bqr.CapacityCommitment, with state and commitment_start_time
+        """
+        return self._res_api.get_capacity_commitment(name=commitment_id)
+        
+    def assignment_info(self, assignment_id):
+        """Current state of an assignment, found among the assignments
+        of its reservation
+        
+        Parameters
+        ----------
+        assignment_id : str, assignment id applied to a project
+        
+        Returns
+        -------
+        bqr.Assignment with state, or None if it does not exist
+        """
+        reservation_id = assignment_id.split("/assignments/")[0]
+        for assign in self._res_api.list_assignments(parent=reservation_id):
+            if assign.name == assignment_id:
+                return assign
+        return None
+        
     def inventory(self):
         """Inventory the currently purchased slots, currently set reservations and 
         currently assignments of reservations
@@ -53,13 +53,18 @@ for BigQuery datatype specifications in standard SQL
 """
 
 import importlib
+import concurrent.futures
 import inspect
 import json
+import threading
 import pandas as pd
+import requests.adapters
 from google.cloud import bigquery
+from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession
 from google.api_core import exceptions as google_api_exceptions
 
-import config, tools, ds_setup, h_setup
+import config, tools, ds_setup, h_setup, dialect, fingerprint, tracing
 from gcp_storage import inventory_bucket_df
 
 
@@ -82,6 +87,54 @@ log_column_names = ["test", "scale", "dataset",
                     "size_bytes", "job_id"]
 
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(fp_service_account_key=None, project=None, location=None):
+    """Get a process wide BigQuery client, created once per credential
+    file, project and location and then reused.  The client's HTTP
+    session keeps up to config.bq_http_pool_size connections open so
+    concurrent job submission does not wait on or rebuild connections.
+
+    Parameters
+    ----------
+    fp_service_account_key : str, absolute path to JSON service account key,
+        if None config.gcp_cred_file is used
+    project : str, GCP project to bill, if None the key's project is used
+    location : str, default location for jobs, i.e. 'US'
+
+    Returns
+    -------
+    bigquery.Client
+    """
+    if fp_service_account_key is None:
+        fp_service_account_key = config.gcp_cred_file
+
+    key = (fp_service_account_key, project, location)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            credentials = service_account.Credentials.from_service_account_file(
+                fp_service_account_key, scopes=bigquery.Client.SCOPE)
+
+            session = AuthorizedSession(credentials)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=config.bq_http_pool_size,
+                                                    pool_maxsize=config.bq_http_pool_size)
+            session.mount("https://", adapter)
+
+            if project is None:
+                project = credentials.project_id
+
+            client = bigquery.Client(project=project,
+                                     credentials=credentials,
+                                     location=location,
+                                     _http=session)
+            _clients[key] = client
+    return client
+
+
 def create_dataset(dataset_name, verbose=False):
     """Create a dataset on the project
     
@@ -105,7 +158,7 @@ def create_dataset(dataset_name, verbose=False):
     dataset = bigquery.Dataset(dataset_name_full)
     dataset.location = config.gcp_location
     
-    client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
+    client = get_client()
     copy_job = client.create_dataset(dataset)
     if verbose:
         print("Created dataset {}.{}".format(client.project, dataset.dataset_id))    
@@ -125,7 +178,7 @@ def create_schema(schema_file, dataset, verbose=False):
     dataset : str, dataset to create table schema in
     verbose : bool, print debug statements
     """
-    client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
+    client = get_client()
     with open(schema_file, 'r') as f:
         query_txt = f.read()
     
@@ -152,7 +205,7 @@ def table_size(project, dataset, table):
     size of table in bytes
     """
     
-    client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
+    client = get_client()
     
     query_txt = """
     select 
@@ -254,7 +307,7 @@ def query(query_text, project, dataset, dry_run=False, use_cache=False):
     query_job : bigquery.query_job object
     """
 
-    client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
+    client = get_client()
     job_config = bigquery.QueryJobConfig()
 
     default_dataset = project + "." + dataset
@@ -271,6 +324,39 @@ def query(query_text, project, dataset, dry_run=False, use_cache=False):
     return query_job
 
 
+def query_history(t0, t1):
+    """Get the query history for the BigQuery project of the cached
+    client, bound by time.  See BQTPC.query_history for details.
+
+    Parameters
+    ----------
+    Both parameters can be either datetime, pd.Timestamp, or str objects
+    that can be parsed by pd.to_datetime
+    t0 : start time
+    t1 : end time
+
+    Returns
+    -------
+    df_result : Pandas DataFrame containing query history
+    qid : str, query id of the history query
+    """
+    t0 = pd.to_datetime(t0)
+    t1 = pd.to_datetime(t1)
+    t0 = t0.strftime("%Y-%m-%d %H:%M:%S")
+    t1 = t1.strftime("%Y-%m-%d %H:%M:%S")
+
+    query_text = ("select * from `region-us`.INFORMATION_SCHEMA.JOBS_BY_PROJECT " +
+                  "where job_type = 'QUERY' " +
+                  f"and end_time between '{t0}' AND '{t1}'")
+
+    job_config = bigquery.QueryJobConfig()
+    job_config.use_query_cache = False
+
+    query_job = get_client().query(query_text, job_config=job_config)
+    df_result = query_job.result().to_dataframe()
+    return df_result, query_job.job_id
+
+
 def parse_query_job(query_job, verbose=False):
     """
 
@@ -328,7 +414,7 @@ class BQUpload:
         dataset : str, GCP BigQuery dataset running this query
         dataset : str, BigQuery dataset name
         """
-        self.client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
+        self.client = get_client()
         
         self.project = config.gcp_project
         self.bucket_name = config.gcs_data_bucket
@@ -621,7 +707,7 @@ class BQTPC:
         self.verbose_query_n = False  # print line numbers in query text
         self.verbose_iter = False
 
-        self.client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
+        self.client = get_client()
         self.job_config = bigquery.QueryJobConfig()
         self.job_config.default_dataset = self.project + "." + self.dataset
 
@@ -632,6 +718,15 @@ class BQTPC:
         self.dry_run = False
 
         self.cache = False
+        self.fetch = True  # if False, time queries without downloading results
+        self.fingerprint = False  # if True, fetch a result fingerprint, see fingerprint.py
+        self.budget = config.bq_cost_budget  # dollars, dry run streams first if not None
+        self.last_rows = None
+        self.last_fingerprint = None
+        self.fingerprint_cache = {}  # query text: fingerprint query text
+        self.last_status = None  # 'ok', 'error', 'timeout' or 'skipped'
+        self.stream_timeout = config.stream_timeout  # seconds, see query_seq
+        self.sample_utilisation = False  # if True, sample warehouse load in query_seq, see utilisation.py
         self.test_stage = "init"
         self.timestamp = timestamp
         self.results_dir, _ = tools.make_name(db="bq", test=self.test, cid=self.cid,
@@ -693,8 +788,8 @@ class BQTPC:
             self.job_config.use_query_cache = False
     '''
 
-    def dry_run(self, use=False):
-        self.job_config.dry_run = use  # only approximate the time and cost
+    def set_dry_run(self, use=False):
+        self.dry_run = use  # only approximate the time and cost
 
     def set_query_label(self, query_label):
         self.job_config.labels = {"label": query_label}
@@ -768,8 +863,8 @@ class BQTPC:
         else:
             self.job_config.use_query_cache = False
 
-        if self.dry_run is True:
-            self.job_config.dry_run = True  # only approximate the time and cost
+        # only approximate the time and cost
+        self.job_config.dry_run = self.dry_run is True
 
         query_text = self.add_view(query_text)
 
@@ -783,7 +878,9 @@ class BQTPC:
             print(qt)
             print()
 
-        query_result = self.client.query(query_text, job_config=self.job_config)
+        with tracing.span("submit") as span:
+            query_result = self.client.query(query_text, job_config=self.job_config)
+            span.set(job_id=query_result.job_id)
         return query_result
 
     @staticmethod
@@ -814,7 +911,39 @@ class BQTPC:
 
         return df_result, qid, t0, t1, bytes_processed, bytes_billed, query_plan
 
-    def query_n(self, n, qual=None, std_out=False):
+    def generate_query(self, n, qual=None, std_out=False):
+        """Generate query text for query template number n
+
+        Parameters
+        ----------
+        n : int, query number to generate
+        qual : None, or True to use qualifying values (to test 1GB qualification db)
+        std_out : bool, print std_out and std_err output
+
+        Returns
+        -------
+        query_text : str, query text generated for query
+        """
+        tpl_dir = f"{config.fp_query_templates}{config.sep}{'bq'}_{self.test}"
+
+        if self.test == "ds":
+            return ds_setup.qgen_template(n=n,
+                                          templates_dir=tpl_dir,
+                                          dialect="sqlserver_tpc",
+                                          scale=self.scale,
+                                          qual=qual,
+                                          verbose=self.verbose,
+                                          verbose_std_out=std_out)
+        elif self.test == "h":
+            return h_setup.qgen_template(n=n,
+                                         templates_dir=tpl_dir,
+                                         scale=self.scale,
+                                         qual=qual,
+                                         verbose=self.verbose,
+                                         verbose_std_out=std_out)
+        return None
+
+    def query_n(self, n, qual=None, std_out=False, query_text=None, timeout=None):
         """Query BigQuery with a specific nth query
 
         Parameters
@@ -822,6 +951,10 @@ class BQTPC:
         n : int, query number to execute
         qual : None, or True to use qualifying values (to test 1GB qualification db)
         std_out : bool, print std_out and std_err output
+        query_text : str, precompiled query text to run instead of
+            generating it, see plan.py
+        timeout : float, seconds to wait for the captured statement before
+            cancelling the job, see collect_result, if None no limit
 
         Returns
         -------
@@ -830,32 +963,19 @@ class BQTPC:
         query_result : bigquery.query_job object result
         query_text : str, query text generated for query
         """
-        tpl_dir = f"{config.fp_query_templates}{config.sep}{'bq'}_{self.test}"
-
-        if self.test == "ds":
-            query_text = ds_setup.qgen_template(n=n,
-                                                templates_dir=tpl_dir,
-                                                dialect="sqlserver_tpc",
-                                                scale=self.scale,
-                                                qual=qual,
-                                                verbose=self.verbose,
-                                                verbose_std_out=std_out)
-        elif self.test == "h":
-            query_text = h_setup.qgen_template(n=n,
-                                               templates_dir=tpl_dir,
-                                               scale=self.scale,
-                                               qual=qual,
-                                               verbose=self.verbose,
-                                               verbose_std_out=std_out)
-        else:
+        if query_text is None:
+            with tracing.span("generate"):
+                query_text = self.generate_query(n, qual=qual, std_out=std_out)
+        if query_text is None:
             return None
 
-        t0 = pd.Timestamp.now("UTC")
-
         # BigQuery will process multiple queries in one query statement
         # However, TPC-DS is completely single-queries, TPC-H has a view created and
         # deleted in #15, the creation and delete steps don't have data to capture
         query_list = [q + ";" for q in query_text.split(";") if len(q.strip()) > 0]
+        self.fingerprint_prepare(query_text, query_list)
+
+        t0 = pd.Timestamp.now("UTC")
 
         # if query includes a view (make view, query, delete view)
         if len(query_list) == 3:
@@ -863,8 +983,8 @@ class BQTPC:
             if self.verbose:
                 print("Non-query reply:", query_1_result.result())
 
-            query_2_result = self.query(query_list[1])
-            df_result = query_2_result.result().to_dataframe()
+            query_2_result = self.query(self.fingerprint_text(query_list[1]))
+            df_result = self.collect_result(query_2_result, timeout=timeout)
             qid = query_2_result.job_id
 
             query_3_result = self.query(query_list[2])
@@ -878,26 +998,155 @@ class BQTPC:
             # the first query will not be captured for qc comparison
             _ = self.query(query_list[0])
             # second query is captured
-            query_2_result = self.query(query_list[1])
-            df_result = query_2_result.result().to_dataframe()
+            query_2_result = self.query(self.fingerprint_text(query_list[1]))
+            df_result = self.collect_result(query_2_result, timeout=timeout)
             qid = query_2_result.job_id
 
         # single query statement
         else:
-            query_result = self.query(query_text)
             try:
-                df_result = query_result.result().to_dataframe()
+                query_result = self.query(self.fingerprint_text(query_text))
+                df_result = self.collect_result(query_result, timeout=timeout)
                 qid = query_result.job_id
             except google_api_exceptions.BadRequest as e:
                 error_data = e.errors[0]
                 error_data["exception"] = e.__class__.__name__
                 df_result = pd.DataFrame([error_data])
                 qid = "Exception - " + e.__class__.__name__
+                self.last_rows = None
+                self.last_fingerprint = None
+                self.last_status = "error"
 
         t1 = pd.Timestamp.now("UTC")
 
         return t0, t1, df_result, query_text, qid
 
+    def fingerprint_prepare(self, query_text, query_list):
+        """Wrap the captured statement of a query before it is timed and
+        store it in self.fingerprint_cache, see fingerprint_text.  A view
+        the statement reads is created and dropped around the dry run.
+        A statement that fails the dry run is left to fail when timed.
+
+        Parameters
+        ----------
+        query_text : str, query text as generated
+        query_list : list of str, statements of query_text as split in query_n
+        """
+        if not self.fingerprint:
+            return
+        captured = query_list[1] if len(query_list) > 1 else query_text
+        if captured in self.fingerprint_cache:
+            return
+        try:
+            if len(query_list) == 3:
+                self.query(query_list[0]).result()
+            try:
+                self.fingerprint_text(captured)
+            finally:
+                if len(query_list) == 3:
+                    self.query(query_list[2]).result()
+        except google_api_exceptions.BadRequest as e:
+            if self.verbose:
+                print("Fingerprint dry run failed:", e)
+
+    def fingerprint_text(self, query_text):
+        """Wrap query text in the result fingerprint aggregate if
+        self.fingerprint is True, see fingerprint.py.  The result columns
+        are read with a dry run, once per query text.
+
+        Parameters
+        ----------
+        query_text : str, single query statement
+
+        Returns
+        -------
+        str, query text to execute
+        """
+        if not self.fingerprint:
+            return query_text
+        if query_text not in self.fingerprint_cache:
+            with tracing.span("rewrite", kind="fingerprint"):
+                columns = fingerprint.bq_columns(self.client, self.add_view(query_text), self.job_config)
+                self.fingerprint_cache[query_text] = fingerprint.bq_wrap(query_text, columns)
+        return self.fingerprint_cache[query_text]
+
+    def collect_result(self, query_job, timeout=None):
+        """Wait for a query job and collect its result.  If self.fetch
+        is False only the row count is read, no rows are downloaded.
+        If self.fingerprint is True the query job is a fingerprint
+        query and its one row result is parsed.  The row count is
+        stored in self.last_rows and the digest in self.last_fingerprint.
+
+        If the job is not done within timeout seconds it is cancelled
+        and self.last_status is set to 'timeout', otherwise 'ok'.
+
+        Parameters
+        ----------
+        query_job : bigquery.query_job object
+        timeout : float, seconds to wait for the job, if None no limit
+
+        Returns
+        -------
+        df_result : Pandas DataFrame, query result, empty if not fetched
+        """
+        self.last_fingerprint = None
+        try:
+            # result() returns once the job is done and the first page is read
+            with tracing.span("execute", job_id=query_job.job_id) as span:
+                if self.fingerprint or self.fetch:
+                    rows = query_job.result(timeout=timeout)
+                else:
+                    rows = query_job.result(max_results=0, timeout=timeout)
+                span.event("first_result")
+            tracing.record("queue", query_job.created, query_job.started)
+            tracing.record("run", query_job.started, query_job.ended)
+
+            with tracing.span("fetch"):
+                if self.fingerprint:
+                    df_result = rows.to_dataframe()
+                    self.last_rows, self.last_fingerprint = fingerprint.parse(df_result)
+                elif self.fetch:
+                    df_result = rows.to_dataframe()
+                    self.last_rows = len(df_result)
+                else:
+                    self.last_rows = rows.total_rows
+                    df_result = pd.DataFrame()
+        except concurrent.futures.TimeoutError:
+            self.client.cancel_job(query_job.job_id, location=query_job.location)
+            if self.verbose:
+                print("Cancelled job {} after {} s".format(query_job.job_id, timeout))
+            self.last_rows = None
+            self.last_status = "timeout"
+            return pd.DataFrame()
+        self.last_status = "ok"
+        return df_result
+
+    def qc_pass(self, df_times, save=True):
+        """Download the results of already run queries by job id, outside
+        of any timed window, i.e. after a timing only run with
+        self.fetch = False.  Query results are kept by BigQuery for
+        about 24 hours.
+
+        Parameters
+        ----------
+        df_times : Pandas DataFrame, timing data as returned by query_seq
+        save : bool, write each result to self.results_dir
+
+        Returns
+        -------
+        dict, query number -> Pandas DataFrame of results
+        """
+        results = {}
+        for n, qid, status in zip(df_times.query_n, df_times.qid, df_times.status):
+            if status != "ok":
+                continue
+            with tracing.span("qc", system="bq", query_n=n, job_id=qid):
+                df_result = self.client.get_job(qid).result().to_dataframe()
+                results[n] = df_result
+                if save:
+                    self.write_results_csv(df=df_result, query_n=n)
+        return results
+
     def query_history(self, t0, t1):
         """Get the query history for the current BigQuery project, bound by
         time.
@@ -926,7 +1175,36 @@ class BQTPC:
         df_result, qid, _, _, _, _, _ = self.parse_query_result(query_result)
         return df_result, qid
 
-    def query_seq(self, seq, seq_n=None, qual=None, save=False, verbose_iter=False):
+    def check_budget(self, seq, seq_n=None, qual=None, plan=None):
+        """Dry run a query sequence and raise ValueError if its predicted
+        on-demand cost is over self.budget or a dry run failed, see
+        estimate.check_budget
+
+        Parameters
+        ----------
+        seq : iterable sequence int, query numbers to execute
+        seq_n : int, stream sequence number, required with plan
+        qual : None, or True to use qualifying values
+        plan : plan.Plan, precompiled query text for stream seq_n
+
+        Returns
+        -------
+        Pandas DataFrame, dry run estimate per query
+        """
+        # import here, estimate imports this module
+        import estimate
+
+        if plan is not None:
+            queries = [(seq_n, n, plan.query_text(seq_n, n)) for n in seq]
+        else:
+            queries = estimate.tpc_queries(self, seq, seq_n, qual=qual)
+        df_estimate = estimate.bq_estimate(queries, dataset=self.dataset,
+                                           project=self.project, verbose=self.verbose)
+        estimate.check_budget(df_estimate, self.budget)
+        return df_estimate
+
+    def query_seq(self, seq, seq_n=None, qual=None, save=False, verbose_iter=False,
+                  plan=None, resume=False):
         """Query BigQuery with TPC-DS or TPC-H query template number n
 
         Parameters
@@ -937,6 +1215,13 @@ class BQTPC:
         qual : None, or True to use qualifying values (to test 1GB qualification db)
         save : bool, save data about this query sequence to disk
         verbose_iter : bool, print per iteration status statements
+        plan : plan.Plan, precompiled query text for stream seq_n, if None
+            query text is generated before each query
+        resume : bool, continue an interrupted stream from the timing rows
+            already written to self.results_dir, skipping queries that
+            finished or timed out, with the same labels and seq_n.
+            self.results_dir must be the interrupted stream's folder,
+            i.e. construct with the same timestamp
 
         Returns
         -------
@@ -953,80 +1238,151 @@ class BQTPC:
             driver_t1 : datatime, time on the driver when query returned
             qid : str, database system under test query id for the query run
         """
+        if plan is not None and seq_n is None:
+            raise ValueError("seq_n is required to run from a plan")
+
+        if plan is None:
+            with tracing.span("validate", system="bq", test=self.test):
+                failures = dialect.validate(db="bq", test=self.test, verbose=self.verbose)
+            if len(failures) > 0:
+                raise ValueError("Query templates failed validation: {}".format(failures))
+
         self.test_stage = "start"
-        metadata_fp = self.results_dir + config.sep + "metadata_bq_initial.json"
+        metadata_name = "metadata_bq_resume.json" if resume else "metadata_bq_initial.json"
+        metadata_fp = self.results_dir + config.sep + metadata_name
         tools.mkdir_safe(self.results_dir)
         with open(metadata_fp, "w") as f:
             f.write(self.to_json(indent="  "))
 
+        stream = seq_n  # seq_n becomes the stream label below
+
         if seq_n is None:
             seq_n = "sNA"
         else:
             seq_n = str(seq_n)
         n_time_data = []
         columns = ["db", "test", "scale", "source", "cid", "desc",
-                   "query_n", "seq_n", "driver_t0", "driver_t1", "qid"]
-
-        t0_seq = pd.Timestamp.now("UTC")
-        i_total = len(seq)
-        for i, n in enumerate(seq):
-            qn_label = self.dataset + "-q" + str(n) + "-" + seq_n + "-" + self.desc
-            qn_label = qn_label.lower()
-
-            if verbose_iter:
-                print("="*40)
-                print("BigQuery Start Query:", n)
-                print("-"*20)
-                print("Stream Completion: {} / {}".format(i+1, i_total))
-                print("Query Label:", qn_label)
-                print("-"*20)
-                print()
-
-            self.set_query_label(qn_label)
-
-            (t0, t1,
-             df_result, query_text, qid) = self.query_n(n=n,
-                                                        qual=qual,
-                                                        std_out=False
-                                                        )
-
-            _d = ["bq", self.test, self.scale, self.dataset, self.cid, self.desc,
-                  n, seq_n, t0, t1, qid]
-            n_time_data.append(_d)
-
-            # write results as collected by each query
-            if save:
-                self.write_query_text(query_text=query_text, query_n=n)
+                   "query_n", "seq_n", "driver_t0", "driver_t1", "qid", "rows",
+                   "fingerprint", "status"]
+
+        # timing rows are appended to disk after each query, see resume
+        done = set()
+        fp = None
+        if resume:
+            fp, n_time_data, done = tools.read_times_checkpoint("bq", self.results_dir,
+                                                                columns, seq_n)
+        self.results_csv_fp = fp if fp is not None else self.times_csv_fp()
+
+        # only queries still to run count against the budget
+        if self.budget is not None:
+            self.check_budget([n for n in seq if n not in done], seq_n=stream,
+                              qual=qual, plan=plan)
+
+        sampler = None
+        if self.sample_utilisation:
+            import utilisation
+            sampler = utilisation.Sampler(db="bq",
+                                          fp=self.results_dir + config.sep + "utilisation_bq.csv",
+                                          verbose=self.verbose)
+            sampler.start()
 
-                if len(df_result) > 0:
-                    self.write_results_csv(df=df_result, query_n=n)
-                else:
-                    # filler for statistics when the query returns no values
-                    df_result.loc[0, :] = ["filler"] * df_result.shape[1]
-                    if verbose_iter:
-                        print("No result rows, FILLER DataFrame created.")
-                    self.write_results_csv(df=df_result, query_n=n)
+        try:
+            t0_seq = pd.Timestamp.now("UTC")
+            i_total = len(seq)
+            for i, n in enumerate(seq):
+                if n in done:
+                    continue
+
+                timeout = tools.query_timeout(self.test, self.scale, n)
+                if self.stream_timeout is not None:
+                    remaining = self.stream_timeout - (pd.Timestamp.now("UTC") - t0_seq).total_seconds()
+                    if remaining <= 0:
+                        # stream over its time limit, record the rest as skipped
+                        t_skip = pd.Timestamp.now("UTC")
+                        _d = ["bq", self.test, self.scale, self.dataset, self.cid,
+                              self.desc, n, seq_n, t_skip, t_skip, None, None, None, "skipped"]
+                        n_time_data.append(_d)
+                        tools.append_csv_row(self.results_csv_fp, _d, columns)
+                        continue
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+
+                qn_label = self.dataset + "-q" + str(n) + "-" + seq_n + "-" + self.desc
+                qn_label = qn_label.lower()
+
+                if verbose_iter:
+                    print("="*40)
+                    print("BigQuery Start Query:", n)
+                    print("-"*20)
+                    print("Stream Completion: {} / {}".format(i+1, i_total))
+                    print("Query Label:", qn_label)
+                    print("-"*20)
+                    print()
 
-            if verbose_iter:
-                dt = t1 - t0
-                print("Query ID: {}".format(qid))
-                print("Total Time Elapsed: {}".format(dt))
-                print("-"*40)
-                print()
+                self.set_query_label(qn_label)
 
-            if self.verbose:
-                if len(df_result) < 25:
-                    print("Result:")
-                    print("-------")
-                    print(df_result)
-                    print()
+                if plan is not None:
+                    plan_text = plan.query_text(stream, n)
                 else:
-                    print("Head of Result:")
-                    print("---------------")
-                    print(df_result.head())
+                    plan_text = None
+
+                with tracing.span("query", system="bq", test=self.test, scale=self.scale,
+                                  cid=self.cid, stream=seq_n, query_n=n) as query_span:
+                    (t0, t1,
+                     df_result, query_text, qid) = self.query_n(n=n,
+                                                                qual=qual,
+                                                                std_out=False,
+                                                                query_text=plan_text,
+                                                                timeout=timeout
+                                                                )
+
+                    _d = ["bq", self.test, self.scale, self.dataset, self.cid, self.desc,
+                          n, seq_n, t0, t1, qid, self.last_rows, self.last_fingerprint,
+                          self.last_status]
+                    n_time_data.append(_d)
+                    tools.append_csv_row(self.results_csv_fp, _d, columns)
+                    query_span.set(job_id=qid, status=self.last_status)
+
+                    # write results as collected by each query
+                    if save:
+                        with tracing.span("write"):
+                            self.write_query_text(query_text=query_text, query_n=n)
+
+                            if not self.fetch or self.last_status == "timeout":
+                                # timing only, results are written by self.qc_pass,
+                                # or cancelled with no result
+                                pass
+                            elif len(df_result) > 0:
+                                self.write_results_csv(df=df_result, query_n=n)
+                            else:
+                                # filler for statistics when the query returns no values
+                                df_result.loc[0, :] = ["filler"] * df_result.shape[1]
+                                if verbose_iter:
+                                    print("No result rows, FILLER DataFrame created.")
+                                self.write_results_csv(df=df_result, query_n=n)
+
+                if verbose_iter:
+                    dt = t1 - t0
+                    print("Query ID: {}".format(qid))
+                    print("Total Time Elapsed: {}".format(dt))
+                    print("-"*40)
                     print()
 
-        t1_seq = pd.Timestamp.now("UTC")
+                if self.verbose:
+                    if len(df_result) < 25:
+                        print("Result:")
+                        print("-------")
+                        print(df_result)
+                        print()
+                    else:
+                        print("Head of Result:")
+                        print("---------------")
+                        print(df_result.head())
+                        print()
+
+            t1_seq = pd.Timestamp.now("UTC")
+        finally:
+            if sampler is not None:
+                sampler.stop()
 
         #if self.verbose:
         dt_seq = t1_seq - t0_seq
@@ -1076,20 +1432,26 @@ class BQTPC:
         df = tools.to_consistent(df, n=config.float_precision)
         df.to_csv(fp, index=False, float_format="%.3f")
 
+    def times_csv_fp(self):
+        """Absolute path of a new timing data CSV file in self.results_dir"""
+        _, fp = tools.make_name(db="bq", test=self.test, cid=self.cid,
+                                kind="times",
+                                datasource=self.dataset, desc=self.desc,
+                                ext=".csv",
+                                timestamp=self.timestamp)
+        return self.results_dir + config.sep + fp
+
     def write_times_csv(self, results_list, columns):
-        """Write a list of results from queries to a CSV file
+        """Write a list of results from queries to a CSV file, replacing
+        the rows appended during query_seq
 
         Parameters
         ----------
         results_list : list, data as recorded on the local machine
         columns : list, column names for output CSV
         """
-        _, fp = tools.make_name(db="bq", test=self.test, cid=self.cid,
-                                kind="times",
-                                datasource=self.dataset, desc=self.desc,
-                                ext=".csv",
-                                timestamp=self.timestamp)
-        self.results_csv_fp = self.results_dir + config.sep + fp
+        if self.results_csv_fp is None:
+            self.results_csv_fp = self.times_csv_fp()
         df = pd.DataFrame(results_list, columns=columns)
         tools.mkdir_safe(self.results_dir)
         df.to_csv(self.results_csv_fp, index=False)
@@ -1097,11 +1459,10 @@ class BQTPC:
 
 class Stats(BQTPC):
     def __init__(self, *args, **kwargs):
-        super(BQTPC, self).__init__(*args, **kwargs)
+        super().__init__(*args, **kwargs)
 
     def get_table_names(self):
-        client = bigquery.Client.from_service_account_json(config.gcp_cred_file)
-        tables = list(client.list_tables(self.dataset))
+        tables = list(self.client.list_tables(self.dataset))
         table_names = [t.table_id for t in tables]
         return table_names
 
@@ -6,12 +6,14 @@ Copyright (c) 2020 SADA Systems, Inc.
 
 import glob
 import json
+import threading
+import concurrent.futures
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-import config, tools, qc, bq_tpc
+import config, tools, qc, bq_tpc, fingerprint, tracing
 
 # TODO: handle BQ or SF only benchmarking separately
 try:
@@ -38,8 +40,11 @@ def collate_results(results_dir):
     df : Pandas Dataframe, filepaths to each results file 
     """
     
-    fps_query_sf = glob.glob(results_dir + config.sep + "query_result_sf*")
-    fps_query_bq = glob.glob(results_dir + config.sep + "query_result_bq*")
+    # concurrent runs write each system to a subfolder
+    fps_query_sf = glob.glob(results_dir + config.sep + "**" + config.sep + "query_result_sf*",
+                             recursive=True)
+    fps_query_bq = glob.glob(results_dir + config.sep + "**" + config.sep + "query_result_bq*",
+                             recursive=True)
     
     dfbq = pd.DataFrame([[fp, int(splitter(fp))] for fp in fps_query_bq],
                         columns=["fp_bq", "q_bq"])
@@ -131,6 +136,8 @@ class QueryCompare:
         self.cache = False
         self.qual = False
         self.save = False
+        self.fetch = True  # if False, time queries without downloading results
+        self.fingerprint = False  # if True, compare result fingerprints, see compare_fingerprints
         
         self.shared_timestamp = None
         self.results_dir = None
@@ -154,9 +161,14 @@ class QueryCompare:
 
         self.sf_warehouse_size = None  # strictly depends on warehouse name
 
+        # run Snowflake and BigQuery at the same time, see run
+        self.concurrent = False
+
         # for understanding the initial metadata record snapshot
         self.test_stage = "initialization"
 
+        self._lock = threading.Lock()
+
     def values(self):
         """Get all class attributes from __dict__ attribute
         except those prefixed with underscore ('_')
@@ -237,10 +249,10 @@ class QueryCompare:
         sf.results_dir = self.results_dir
 
         sf.connect()
-
-        _sf_t0, _sf_t1, df_sf_result, _sf_query_text, sf_qid = sf.query_n(n=query_n)
-
-        sf.close()
+        try:
+            _sf_t0, _sf_t1, df_sf_result, _sf_query_text, sf_qid = sf.query_n(n=query_n)
+        finally:
+            sf.close()
 
         bq = bq_tpc.BQTPC(test=self.test,
                           scale=self.scale,
@@ -264,45 +276,48 @@ class QueryCompare:
 
         return df_bq_result, df_sf_result, bq_qid, sf_qid
         
-    def run(self, seq):
-        """Run a benchmark comparison
+    def write_metadata(self, stage, name):
+        """Write a JSON snapshot of this class to the results folder
 
         Parameters
         ----------
-        seq : list of int, query numbers to execute
-        #systems : list of str, systems under test to collect data. Allowed values: 'sf' and 'bq'
-
-        Returns
-        -------
-        None, writes multiple files to self.results_dir location
+        stage : str, test stage recorded in the snapshot
+        name : str, file name of the snapshot
         """
-
-        self.query_sequence = seq
-
-        if 'sf' in self.systems:
-
-            self.test_stage = "Snowflake start"
-            metadata_fp = self.results_dir + config.sep + "metadata_sf_compare_initial.json"
+        with self._lock:
+            self.test_stage = stage
+            metadata_fp = self.results_dir + config.sep + name
             with open(metadata_fp, "w") as f:
                 f.write(self.to_json(indent="  "))
 
-            sf = sf_tpc.SFTPC(test=self.test,
-                              scale=self.scale,
-                              cid=self.cid,
-                              warehouse=self.sf_warehouse_name,
-                              desc=self.desc,
-                              verbose=self.verbose,
-                              verbose_query=self.verbose_query)
-            sf.verbose_query_n = self.verbose_query_n
+    def run_sf(self, seq, results_dir, resume=False):
+        """Run a query sequence on Snowflake
 
-            if self.verbose:
-                print('Using database:', sf.database)
+        Parameters
+        ----------
+        seq : list of int, query numbers to execute
+        results_dir : str, folder to write Snowflake results to
+        resume : bool, continue an interrupted stream, see SFTPC.query_seq
+        """
+        self.write_metadata("Snowflake start", "metadata_sf_compare_initial.json")
+
+        sf = sf_tpc.SFTPC(test=self.test,
+                          scale=self.scale,
+                          cid=self.cid,
+                          warehouse=self.sf_warehouse_name,
+                          desc=self.desc,
+                          verbose=self.verbose,
+                          verbose_query=self.verbose_query)
+        sf.verbose_query_n = self.verbose_query_n
 
-            sf.timestamp = self.shared_timestamp
-            sf.results_dir = self.results_dir
+        if self.verbose:
+            print('Using database:', sf.database)
 
-            sf.connect()
+        sf.timestamp = self.shared_timestamp
+        sf.results_dir = results_dir
 
+        sf.connect()
+        try:
             # record what the SF warehouse size is
             query_result = sf.show_warehouses()
             warehouse_size_mapper = {r[0]: r[3] for r in query_result.fetchall()}
@@ -315,55 +330,100 @@ class QueryCompare:
             else:
                 sf.cache = False
 
+            sf.fetch = self.fetch
+            sf.fingerprint = self.fingerprint
+
             self.result_sf = sf.query_seq(seq=seq,
                                           seq_n=self.stream_n,
                                           qual=self.qual,
                                           save=self.save,
-                                          verbose_iter=self.verbose_iter)
+                                          verbose_iter=self.verbose_iter,
+                                          resume=resume)
+        finally:
             sf.close()
 
-            self.results_sf_csv_fp = sf.results_csv_fp
+        self.results_sf_csv_fp = sf.results_csv_fp
 
-            self.test_stage = "Snowflake end"
-            metadata_fp = self.results_dir + config.sep + "metadata_sf_compare_final.json"
-            with open(metadata_fp, "w") as f:
-                f.write(self.to_json(indent="  "))
+        self.write_metadata("Snowflake end", "metadata_sf_compare_final.json")
 
-        if 'bq' in self.systems:
+    def run_bq(self, seq, results_dir, resume=False):
+        """Run a query sequence on BigQuery
 
-            bq = bq_tpc.BQTPC(test=self.test,
-                              scale=self.scale,
-                              cid=self.cid,
-                              desc=self.desc,
-                              verbose_query=self.verbose_query,
-                              verbose=self.verbose)
-            bq.verbose_query_n = self.verbose_query_n
+        Parameters
+        ----------
+        seq : list of int, query numbers to execute
+        results_dir : str, folder to write BigQuery results to
+        resume : bool, continue an interrupted stream, see BQTPC.query_seq
+        """
+        bq = bq_tpc.BQTPC(test=self.test,
+                          scale=self.scale,
+                          cid=self.cid,
+                          desc=self.desc,
+                          verbose_query=self.verbose_query,
+                          verbose=self.verbose)
+        bq.verbose_query_n = self.verbose_query_n
 
-            bq.timestamp = self.shared_timestamp
-            bq.results_dir = self.results_dir
+        bq.timestamp = self.shared_timestamp
+        bq.results_dir = results_dir
 
-            if self.cache is True:
-                bq.cache = True
-            else:
-                bq.cache = False
+        if self.cache is True:
+            bq.cache = True
+        else:
+            bq.cache = False
 
-            self.test_stage = "BigQuery start"
-            metadata_fp = self.results_dir + config.sep + "metadata_bq_compare_initial.json"
-            with open(metadata_fp, "w") as f:
-                f.write(self.to_json(indent="  "))
+        bq.fetch = self.fetch
+        bq.fingerprint = self.fingerprint
 
-            self.result_bq = bq.query_seq(seq,
-                                          seq_n=self.stream_n,
-                                          qual=self.qual,
-                                          save=self.save,
-                                          verbose_iter=self.verbose_iter)
+        self.write_metadata("BigQuery start", "metadata_bq_compare_initial.json")
 
-            self.results_bq_csv_fp = bq.results_csv_fp
+        self.result_bq = bq.query_seq(seq,
+                                      seq_n=self.stream_n,
+                                      qual=self.qual,
+                                      save=self.save,
+                                      verbose_iter=self.verbose_iter,
+                                      resume=resume)
 
-            self.test_stage = "BigQuery end"
-            metadata_fp = self.results_dir + config.sep + "metadata_bq_compare_final.json"
-            with open(metadata_fp, "w") as f:
-                f.write(self.to_json(indent="  "))
+        self.results_bq_csv_fp = bq.results_csv_fp
+
+        self.write_metadata("BigQuery end", "metadata_bq_compare_final.json")
+
+    def run(self, seq, resume=False):
+        """Run a benchmark comparison.  If self.concurrent is True both
+        systems run at the same time, each writing to its own subfolder
+        of self.results_dir, otherwise Snowflake runs then BigQuery.
+
+        Parameters
+        ----------
+        seq : list of int, query numbers to execute
+        resume : bool, continue an interrupted comparison, each system
+            skipping queries already in its timing file.  Set
+            self.shared_timestamp and self.results_dir to those of the
+            interrupted run, with the same concurrent setting
+        #systems : list of str, systems under test to collect data. Allowed values: 'sf' and 'bq'
+
+        Returns
+        -------
+        None, writes multiple files to self.results_dir location
+        """
+
+        self.query_sequence = seq
+
+        runners = {"sf": self.run_sf, "bq": self.run_bq}
+        systems = [db for db in ["sf", "bq"] if db in self.systems]
+
+        if not self.concurrent:
+            for db in systems:
+                runners[db](seq, self.results_dir, resume=resume)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(systems)) as executor:
+            futures = []
+            for db in systems:
+                results_dir = self.results_dir + config.sep + db
+                tools.mkdir_safe(results_dir)
+                futures.append(executor.submit(runners[db], seq, results_dir, resume=resume))
+        for f in futures:
+            f.result()
 
     def compare_sum(self):
 
@@ -554,10 +614,12 @@ class QueryCompare:
         sf.results_dir = self.results_dir
 
         sf.connect()
-        query_text = "select * from snowflake.account_usage.tables"
-        sf_query_result = sf.sfc.query(query_text=query_text)
-        df_sf_result = sf_query_result.fetch_pandas_all()
-        sf.close()
+        try:
+            query_text = "select * from snowflake.account_usage.tables"
+            sf_query_result = sf.sfc.query(query_text=query_text)
+            df_sf_result = sf_query_result.fetch_pandas_all()
+        finally:
+            sf.close()
 
         bq = bq_tpc.BQTPC(test=self.test,
                           scale=self.scale,
@@ -633,6 +695,24 @@ class QueryCompare:
 
         return df, df_all
 
+    def compare_fingerprints(self, save=True):
+        """Compare result row counts and fingerprints of a run with
+        self.fingerprint = True, without any result sets downloaded
+
+        Parameters
+        ----------
+        save : bool, save file to self.results_dir
+
+        Returns
+        -------
+        Pandas DataFrame, one row per query number, see fingerprint.compare
+        """
+        df = fingerprint.compare(self.result_bq, self.result_sf,
+                                 suffixes=("_bq", "_sf"))
+        if save:
+            df.to_csv(self.results_dir + config.sep + "qc_fingerprint.csv", index=False)
+        return df
+
     def compare(self, plot=True, save=True):
         """Collate and compare TPC test results
 
@@ -650,8 +730,9 @@ class QueryCompare:
         # TODO: should probably unify file naming in one place
         name = "_".join([x for x in self.results_dir.split(config.sep) if x != ""][-1].split("_")[1:6])
         df = collate_results(self.results_dir)
-        df["equal"] = qc.apply_assert_equal(df)
-        df["equal_percent"] = qc.apply_percent_equal(df)
+        with tracing.span("qc", system="bqsf", test=self.test, scale=self.scale, cid=self.cid):
+            df["equal"] = qc.apply_assert_equal(df)
+            df["equal_percent"] = qc.apply_percent_equal(df)
 
         if len(df) == 1:
 
@@ -44,16 +44,40 @@ sf_warehouse = ["TEST9000_XSMALL", "TEST9001_2XLARGE"]  # ascending size
 sf_warehouse_util = "TEST9000_XSMALL"
 sf_warehouse_benchmark = "TEST9001_2XLARGE"
 sf_warehouse_cost = 0.00056  # price per second for this warehouse size
+sf_credit_cost = 2.00  # dollars per credit, see sweep.py
+sf_min_billed_seconds = 60  # billed per warehouse resume at least
 
 # 2.5 Snowflake connector configuration
 sf_role = "SYSADMIN"
 sf_storage_integration = "gcs_storage_integration"
 sf_named_file_format = "csv_file_format"
+sf_pool_size = 8  # maximum open connections in sf_tpc.connection_pool()
+sf_import_pool_size = 4  # tables loaded concurrently, one connection each
+sf_put_threads = 8  # threads per PUT when loading from local disk
+sf_async_max_in_flight = 16  # queries running at once per SFTPC.query_seq_async
+sf_async_poll_initial = 0.1  # seconds between status polls after a change
+sf_async_poll_max = 2.0  # maximum seconds between status polls
 
 # 2.6 BigQuery Slot Reservations
 bq_slots = 2000
 bq_slot_flex_cost = 4.00  # per (100 slots)/(1 hr)
+bq_flex_min_seconds = 60  # flex commitments can not be deleted sooner
+bq_slot_wait_timeout = 900  # seconds to wait for slots to serve queries, see sweep.py
+bq_slot_wait_poll = 10  # seconds between checks
 bq_on_demand_cost = 5.00  # per TB data processed
+bq_cost_budget = None  # dollars, stop a run whose dry run estimate is over, see estimate.py
+bq_budget_allow_failed = False  # if True, failed dry runs count as 0 bytes in the budget check
+
+# 2.7 BigQuery client
+bq_http_pool_size = 50  # open HTTP connections kept by the cached client
+estimate_workers = 16  # concurrent dry runs or EXPLAINs, see estimate.py
+
+# 2.8 BigQuery asynchronous jobs, see bq_async.py
+bq_async_max_in_flight = 20   # jobs submitted and not yet finished
+bq_async_fetch_workers = 8    # threads downloading finished results
+bq_async_poll_initial = 0.1   # seconds before first job state poll
+bq_async_poll_max = 2.0       # maximum seconds between polls of one job
+bq_async_page_size = 10000    # rows per result page
 
 # 3.0 TPC installer zip file names stored in gcs_zip_bucket
 # >> Edit this if you download a different version from tpc.org
@@ -182,6 +206,17 @@ sf_schema = ["sf_1GB_basic"]
 # TODO: delete this?
 fp_query = cwd + sep + "q"
 
+# Disk cache of generated query text, see query_cache.py
+query_cache_enabled = True
+fp_query_cache = fp_query + sep + "cache"
+query_cache_max_bytes = 256 * 1024**2
+
+# Precompiled benchmark plans, see plan.py
+fp_plan = fp_query + sep + "plans"
+
+# Rewritten query texts memoised per dialect.RuleSet
+dialect_memo_size = 10000
+
 # 5.4 Qualification Query Answers
 # >> Do NOT edit
 fp_ds_answers = fp_ds_src + sep + "answer_sets"
@@ -190,6 +225,8 @@ fp_ds_answers = fp_ds_src + sep + "answer_sets"
 # >> Do NOT edit
 fp_results = cwd + sep + "results"
 fp_plots   = cwd + sep + "plots"
+fp_trace   = fp_results + sep + "trace_spans.jsonl"  # see tracing.py
+otlp_endpoint = None  # OTLP/HTTP collector, i.e. "http://localhost:4318"
 
 # 5.6 SnowFlake from snowflake.account_usage.query_history
 sf_keep = ["QUERY_ID", "QUERY_TEXT", "DATABASE_NAME", "WAREHOUSE_SIZE", "WAREHOUSE_TYPE",
@@ -218,3 +255,34 @@ summary_short_columns = ["db", "test", "scale", "source", "cid", "desc", "query_
 # 5.6 Data Quality Control Precision
 # >> edit if query results aren't matching and debug required
 float_precision = 2  # number of decimal places in str conversion
+qc_chunk_size = 100000  # rows per chunk when hashing result files, see qc.StreamingDigest
+
+# 5.9 Repeated runs, see repeat.py
+repeat_warmup = 1            # unmeasured iterations per query
+repeat_iterations = 5        # maximum measured iterations per query
+repeat_min_iterations = 3    # measured iterations before early stopping
+repeat_ci_width = 0.05       # stop once CI width / median is at or below, None to disable
+repeat_confidence = 0.95     # bootstrap confidence level
+repeat_bootstrap = 1000      # bootstrap resamples
+
+# 5.10 Query time limits, queries over their limit are cancelled
+# and recorded with status 'timeout', see tools.query_timeout
+query_timeout = None   # seconds for any query, None for no limit
+# seconds per query number and scale factor, i.e. {("ds", 10000, 72): 3600},
+# a scale of None applies to all scale factors
+query_timeouts = {}
+stream_timeout = None  # seconds for a whole query stream, None for no limit
+
+# 5.11 Open-loop load generation, see loadgen.py
+loadgen_rate = 0.1           # arrivals per second
+loadgen_duration = 600       # seconds arrivals are generated for
+loadgen_process = "poisson"  # 'poisson' or 'fixed' arrivals
+loadgen_max_in_flight = 200  # BigQuery jobs submitted and not yet finished
+loadgen_sf_sessions = 4      # Snowflake sessions queries are spread over
+loadgen_poll = 0.25          # seconds between Snowflake status polls
+loadgen_percentiles = [50, 90, 95, 99]
+
+# 5.12 Utilisation sampling during query streams, see utilisation.py
+util_interval = 30              # seconds between pulls
+util_settle = 300               # seconds after which a period is not pulled again
+util_bq_job_lookback = "6 hours"  # jobs created this long before sampling are included
@@ -0,0 +1,214 @@
+"""SQL dialect rewriting rules
+
+All rules for one target are compiled once into a single alternation
+regex and applied in one pass over the text.  Output is memoised by a
+hash of the input and each rewrite reports which rules fired.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import os
+import re
+import glob
+import hashlib
+import threading
+
+import config
+
+
+class RuleSet:
+    def __init__(self, name, rules, strip=False):
+        """Ordered set of regex rewriting rules applied in a single pass
+
+        Where two rules match at the same position the earlier rule wins.
+        Rule patterns must not contain backreferences or named groups,
+        since they are combined into one regex.
+
+        Parameters
+        ----------
+        name : str, name of rule set
+        rules : list of tuple, (rule name, regex pattern, replacement)
+            where replacement may use the rule's own group references
+        strip : bool, strip leading and trailing whitespace before
+            and after rewriting
+        """
+        self.name = name
+        self.rules = rules
+        self.strip = strip
+
+        self._rule_regex = [re.compile(pattern) for _, pattern, _ in rules]
+        self._regex = re.compile("|".join("(?P<r{}>{})".format(i, pattern)
+                                          for i, (_, pattern, _) in enumerate(rules)))
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def rewrite(self, text):
+        """Rewrite text
+
+        Parameters
+        ----------
+        text : str, SQL or template text
+
+        Returns
+        -------
+        text : str, rewritten text
+        fired : dict, rule name -> number of replacements made
+        """
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            memo = self._memo.get(key)
+        if memo is not None:
+            return memo[0], dict(memo[1])
+
+        fired = {}
+
+        def _sub(m):
+            i = int(m.lastgroup[1:])
+            rule_name, _, replacement = self.rules[i]
+            fired[rule_name] = fired.get(rule_name, 0) + 1
+            return self._rule_regex[i].sub(replacement, m.group(0), count=1)
+
+        out = text.strip() if self.strip else text
+        out = self._regex.sub(_sub, out)
+        if self.strip:
+            out = out.strip()
+
+        with self._lock:
+            if len(self._memo) >= config.dialect_memo_size:
+                self._memo.clear()
+            self._memo[key] = (out, fired)
+        return out, dict(fired)
+
+    def matches(self, text):
+        """Names of the rules that match anywhere in text, without rewriting
+
+        Parameters
+        ----------
+        text : str, SQL or template text
+
+        Returns
+        -------
+        list of str, rule names in rule order
+        """
+        found = set(int(m.lastgroup[1:]) for m in self._regex.finditer(text))
+        return [self.rules[i][0] for i in sorted(found)]
+
+
+# BigQuery TPC-DS query templates, see ds_setup.tpl_bq_regex
+bq_ds_templates = RuleSet("bq_ds_templates",
+                          [("union_all_upper", r" UNION\n", r" UNION ALL\n"),
+                           ("union_all_lower", r" union\n", r" union all\n"),
+                           ("decimal_upper", r" AS DECIMAL\(\d+,\d+\)", r" AS FLOAT64"),
+                           ("decimal_lower", r" as decimal\(\d+,\d+\)", r" as float64"),
+                           ])
+
+# Snowflake generated query text, see sf_tpc.brute_force_clean_query
+sf_query = RuleSet("sf_query",
+                   [("rowcount", r"set rowcount", r"LIMIT"),
+                    ("top_newline", r"\n top 100", r"\n LIMIT 100"),
+                    ("top_end", r"top 100;", r"LIMIT 100;"),
+                    ("go", r"go\Z", r""),
+                    ],
+                   strip=True)
+
+# rule sets that must already be applied to the templates in tpl/<db>_<test>
+template_rule_sets = {"bq_ds": bq_ds_templates}
+
+
+def rewrite_dir(filepath_dir, file_signature, rule_set, verbose=False):
+    """Rewrite all files in a directory in place
+
+    Parameters
+    ----------
+    filepath_dir : str, absolute filepath to folder to read text files
+    file_signature : str, file selection, for glob.glob input
+    rule_set : RuleSet, rules to apply
+    verbose : bool, print the rules fired per file
+
+    Returns
+    -------
+    dict, file name -> dict of rule name -> replacements made
+    """
+    report = {}
+    for fp in sorted(glob.glob(filepath_dir + config.sep + file_signature)):
+        with open(fp, "r") as f:
+            text = f.read()
+        out, fired = rule_set.rewrite(text)
+        if out != text:
+            with open(fp, "w") as f:
+                f.write(out)
+        file_name = os.path.basename(fp)
+        report[file_name] = fired
+        if verbose:
+            print(file_name, fired)
+    return report
+
+
+def _template_body(text):
+    """Query text of a TPC-DS template after its leading comments and
+    define statements, which end at a ';' outside double quotes"""
+    while True:
+        m = re.match(r"(\s*--[^\n]*\n)+", text)
+        if m:
+            text = text[m.end():]
+        if re.match(r"\s*define\b", text, re.IGNORECASE) is None:
+            return text
+        in_quote = False
+        for i, c in enumerate(text):
+            if c == '"':
+                in_quote = not in_quote
+            elif c == ";" and not in_quote:
+                text = text[i+1:]
+                break
+        else:
+            raise ValueError("unterminated define statement")
+
+
+def validate(db, test, verbose=False):
+    """Check the query templates for a database and test before a run.
+
+    Every template must parse into defines and a query body, and for
+    TPC-DS on BigQuery no rewriting rule may still match, which would
+    mean ds_setup.tpl_bq_regex was not applied.
+
+    Parameters
+    ----------
+    db : str, database system under test, either 'bq' or 'sf'
+    test : str, TPC test, either 'ds' or 'h'
+    verbose : bool, print failures
+
+    Returns
+    -------
+    dict, file name -> description of the failure, empty if all pass
+    """
+    key = f"{db}_{test}"
+    templates_dir = config.fp_query_templates + config.sep + key
+    file_signature = "query*.tpl" if test == "ds" else "*.sql"
+    rule_set = template_rule_sets.get(key)
+
+    failures = {}
+    for fp in sorted(glob.glob(templates_dir + config.sep + file_signature)):
+        file_name = os.path.basename(fp)
+        with open(fp, "r") as f:
+            text = f.read()
+
+        if test == "ds":
+            try:
+                body = _template_body(text)
+                if len(body.strip()) == 0:
+                    failures[file_name] = "empty query body"
+                    continue
+            except Exception as e:
+                failures[file_name] = "parse error: {}".format(e)
+                continue
+
+        if rule_set is not None:
+            unapplied = rule_set.matches(text)
+            if len(unapplied) > 0:
+                failures[file_name] = "rules not applied: {}".format(unapplied)
+
+    if verbose:
+        for file_name, reason in failures.items():
+            print(file_name, reason)
+    return failures
@@ -14,7 +14,7 @@ from google.cloud import storage
 
 import pandas as pd
 
-import config, gcp_storage, tools
+import config, gcp_storage, tools, query_cache, dialect
 
 
 log_column_names = ["test", "scale", "status",
@@ -459,6 +459,17 @@ def qgen_template(n, templates_dir, dialect, scale, qual=None,
     else:
         r = None
 
+    cache = query_cache.query_cache()
+    key = cache.key(test="ds",
+                    files=[templates_dir + config.sep + "query{}.tpl".format(n),
+                           templates_dir + config.sep + dialect + ".tpl"],
+                    scale=scale, seed=r, qual=qual, n=n)
+    query_text = cache.get(key)
+    if query_text is not None:
+        if verbose:
+            print("Query {} from cache: {}".format(n, cache.path(key)))
+        return query_text
+
     std_out, err_out = dsqgen(directory=templates_dir,
                               dialect=dialect,
                               scale=scale,
@@ -478,6 +489,8 @@ def qgen_template(n, templates_dir, dialect, scale, qual=None,
 
     query_text = std_out  # just to be clear and match other methods
 
+    cache.put(key, query_text)
+
     return query_text
 
 
@@ -505,6 +518,23 @@ def qgen_stream(p, templates_dir, dialect, scale, qual=None,
     else:
         r = None
 
+    # every template in the stream input list changes the output
+    fp_input = templates_dir + config.sep + "templates.lst"
+    with open(fp_input, "r") as f:
+        template_names = [line.strip() for line in f if len(line.strip()) > 0]
+    files = ([fp_input, templates_dir + config.sep + dialect + ".tpl"] +
+             [templates_dir + config.sep + tn for tn in template_names])
+
+    cache = query_cache.query_cache()
+    keys = [cache.key(test="ds", files=files, scale=scale, seed=r,
+                      qual=qual, stream=_p)
+            for _p in range(p+1)]
+    query_text = cache.get(keys[p])
+    if query_text is not None:
+        if verbose:
+            print("Stream {} from cache: {}".format(p, cache.path(keys[p])))
+        return query_text
+
     # make temporary query directory
     temp_dir = config.fp_ds_output + config.sep + "temp_queries"
     tools.mkdir_safe(temp_dir)
@@ -521,6 +551,12 @@ def qgen_stream(p, templates_dir, dialect, scale, qual=None,
                               output_dir=temp_dir,
                               )
 
+    # dsqgen wrote streams 0 through p, cache all of them
+    for _p in range(p+1):
+        _fp = temp_dir + config.sep + "query_{}.sql".format(_p)
+        with open(_fp, "r") as f:
+            cache.put(keys[_p], f.read())
+
     query_fp = temp_dir + config.sep + "query_{}.sql".format(p)
     with open(query_fp, "r") as f:
         query_text = f.read()
@@ -540,16 +576,17 @@ def qgen_stream(p, templates_dir, dialect, scale, qual=None,
 
 
 def tpl_bq_regex(tpl_dir, verbose=False):
-    dtype_mapper = {r' UNION\n': r' UNION ALL\n',
-                    r' union\n': r' union all\n',
-                    r' AS DECIMAL\(\d+,\d+\)': r' AS FLOAT64',
-                    r' as decimal\(\d+,\d+\)': r' as float64',
-                    }
-    
-    tools.regex_dir(filepath_dir=tpl_dir,
-                    file_signature="query*.tpl",
-                    replace_mapper=dtype_mapper,
-                    verbose=verbose)
+    """Rewrite DS query templates in place for BigQuery, see
+    dialect.bq_ds_templates for the rules applied
+
+    Returns
+    -------
+    dict, file name -> dict of rule name -> replacements made
+    """
+    return dialect.rewrite_dir(filepath_dir=tpl_dir,
+                               file_signature="query*.tpl",
+                               rule_set=dialect.bq_ds_templates,
+                               verbose=verbose)
 
 
 def parse_log(fp):
@@ -0,0 +1,220 @@
+"""Pre-flight estimates of query streams
+
+Dry runs every query of one or more streams on BigQuery at the same
+time and predicts on-demand cost per query, per stream and per run, or
+collects EXPLAIN plans with partition counts from Snowflake.  A run
+can be stopped before it starts if the estimate is over budget.
+
+Statements that depend on an earlier statement of the same query, i.e.
+the view created in TPC-H 15, can not be estimated alone and are
+reported with an error and no bytes.  The budget check fails closed on
+them unless config.bq_budget_allow_failed is True.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import json
+import concurrent.futures
+
+import pandas as pd
+from google.cloud import bigquery
+
+import config, bq_tpc
+
+try:
+    import sf_tpc
+except ModuleNotFoundError:
+    print("Failed to Load Snowflake driver.")
+
+
+def split_statements(query_text):
+    return [q.strip() + ";" for q in query_text.split(";") if len(q.strip()) > 0]
+
+
+def plan_queries(plan, streams=None):
+    """Queries of a plan.Plan as estimator input
+
+    Parameters
+    ----------
+    plan : plan.Plan
+    streams : list of int, streams to include, if None all in the plan
+
+    Returns
+    -------
+    list of (stream, query number, query text)
+    """
+    if streams is None:
+        streams = sorted(plan.streams)
+    return [(s, n, plan.query_text(s, n)) for s in streams for n in plan.order(s)]
+
+
+def tpc_queries(tpc, seq, stream, qual=None):
+    """Queries generated by a BQTPC or SFTPC instance as estimator input
+
+    Returns
+    -------
+    list of (stream, query number, query text)
+    """
+    return [(stream, n, tpc.generate_query(n, qual=qual)) for n in seq]
+
+
+def bq_dry_run(client, query_text, project, dataset):
+    """Dry run one statement
+
+    Returns
+    -------
+    bytes_processed : int, None if the dry run failed
+    error : str, None if the dry run succeeded
+    """
+    job_config = bigquery.QueryJobConfig()
+    job_config.default_dataset = project + "." + dataset
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+    try:
+        job = client.query(bq_tpc.add_view(query_text, project, dataset),
+                           job_config=job_config)
+        return job.total_bytes_processed, None
+    except Exception as e:
+        return None, str(e)
+
+
+def bq_estimate(queries, dataset, project=None, max_workers=None, verbose=False):
+    """Dry run all queries concurrently and predict on-demand cost
+
+    Parameters
+    ----------
+    queries : list of (stream, query number, query text), see plan_queries
+    dataset : str, BigQuery dataset, i.e. 'ds_100GB_01'
+    project : str, GCP project, if None config.gcp_project
+    max_workers : int, concurrent dry runs, if None config.estimate_workers
+    verbose : bool, print failed dry runs
+
+    Returns
+    -------
+    Pandas DataFrame, one row per query with stream, query_n,
+        bytes_processed, TB, cost and error
+    """
+    if project is None:
+        project = config.gcp_project.lower()
+    if max_workers is None:
+        max_workers = config.estimate_workers
+    client = bq_tpc.get_client()
+
+    def _query(stream, n, query_text):
+        total = 0
+        errors = []
+        for statement in split_statements(query_text):
+            b, e = bq_dry_run(client, statement, project, dataset)
+            if e is not None:
+                errors.append(e)
+            else:
+                total += b
+        return [stream, n, total, "; ".join(errors) if len(errors) > 0 else None]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        d = list(executor.map(lambda q: _query(*q), queries))
+
+    df = pd.DataFrame(d, columns=["stream", "query_n", "bytes_processed", "error"])
+    # 1 TeraByte (TB) = 1e12 bytes, as in analysis.MultiResult
+    df["TB"] = df.bytes_processed / 1e12
+    df["cost"] = df.TB * config.bq_on_demand_cost
+
+    if verbose:
+        for _, r in df.loc[df.error.notnull()].iterrows():
+            print("Dry run failed, stream {} query {}: {}".format(r.stream, r.query_n, r.error))
+    return df
+
+
+def bq_summary(df):
+    """Predicted cost per stream and for the run
+
+    Parameters
+    ----------
+    df : Pandas DataFrame, see bq_estimate
+
+    Returns
+    -------
+    df_stream : Pandas DataFrame, TB, cost and failed dry runs per stream
+    total : dict, TB, cost and failed dry runs for all streams
+    """
+    df_stream = df.groupby("stream").agg(TB=("TB", "sum"),
+                                         cost=("cost", "sum"),
+                                         failed=("error", "count"))
+    total = {"TB": df.TB.sum(), "cost": df.cost.sum(), "failed": int(df.error.count())}
+    return df_stream, total
+
+
+def check_budget(df, budget=None, allow_failed=None):
+    """Raise if the predicted cost of a run is over budget, or if any
+    dry run failed, since its bytes are not in the estimate
+
+    Parameters
+    ----------
+    df : Pandas DataFrame, see bq_estimate
+    budget : float, dollars, if None config.bq_cost_budget, and no
+        check is made if that is None too
+    allow_failed : bool, count failed dry runs as 0 bytes instead of
+        raising, if None config.bq_budget_allow_failed
+    """
+    if budget is None:
+        budget = config.bq_cost_budget
+    if budget is None:
+        return
+    if allow_failed is None:
+        allow_failed = config.bq_budget_allow_failed
+    _, total = bq_summary(df)
+    if total["cost"] > budget:
+        raise ValueError("Estimated on-demand cost ${:.2f} ({:.3f} TB) is over the budget of ${:.2f}".format(
+            total["cost"], total["TB"], budget))
+    if total["failed"] > 0 and not allow_failed:
+        failed = df.loc[df.error.notnull(), ["stream", "query_n"]].values.tolist()
+        raise ValueError("{} dry runs failed so the estimate of ${:.2f} is incomplete, "
+                         "failed (stream, query): {}".format(total["failed"], total["cost"], failed))
+
+
+def sf_explain(queries, template, max_workers=None, verbose=False):
+    """Collect EXPLAIN plans of all queries concurrently on pooled sessions
+
+    Parameters
+    ----------
+    queries : list of (stream, query number, query text), see plan_queries
+    template : sf_tpc.SessionTemplate, session context, i.e.
+        SFTPC.session_template()
+    max_workers : int, concurrent sessions, if None config.estimate_workers
+    verbose : bool, print failed plans
+
+    Returns
+    -------
+    Pandas DataFrame, one row per statement with stream, query_n,
+        statement, partitions_total, partitions_assigned, bytes_assigned,
+        error and plan (JSON text)
+    """
+    if max_workers is None:
+        max_workers = config.estimate_workers
+    pool = sf_tpc.connection_pool()
+
+    def _query(stream, n, query_text):
+        rows = []
+        with pool.session(template) as sfc:
+            for i, statement in enumerate(split_statements(query_text)):
+                try:
+                    cursor = sfc.query("EXPLAIN USING JSON " + statement)
+                    plan_text = cursor.fetchone()[0]
+                    stats = json.loads(plan_text).get("GlobalStats", {})
+                    rows.append([stream, n, i, stats.get("partitionsTotal"),
+                                 stats.get("partitionsAssigned"),
+                                 stats.get("bytesAssigned"), None, plan_text])
+                except Exception as e:
+                    rows.append([stream, n, i, None, None, None, str(e), None])
+        return rows
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        d = [r for rows in executor.map(lambda q: _query(*q), queries) for r in rows]
+
+    df = pd.DataFrame(d, columns=["stream", "query_n", "statement", "partitions_total",
+                                  "partitions_assigned", "bytes_assigned", "error", "plan"])
+    if verbose:
+        for _, r in df.loc[df.error.notnull()].iterrows():
+            print("EXPLAIN failed, stream {} query {}: {}".format(r.stream, r.query_n, r.error))
+    return df
@@ -0,0 +1,227 @@
+"""Server side result fingerprints for quality control
+
+A benchmark query is wrapped in an aggregate that hashes a canonical
+text form of each result row and combines the hashes independent of
+row order.  BigQuery and Snowflake build the same canonical text and
+the same hash, so comparing two systems' results needs only a row
+count and a digest per query instead of the result sets.
+
+Canonical row text:
+    numbers : rounded to config.float_precision, fixed decimals, i.e. '1.50'
+    dates : 'YYYY-MM-DD'
+    timestamps : 'YYYY-MM-DD HH:MM:SS'
+    text : trailing spaces removed
+    NULL : '\\N'
+    columns joined with '|'
+
+Row hash: first 15 hex digits of the MD5 of the row text as an integer.
+Digest: BIT_XOR of row hashes and SUM of row hashes mod a prime, the
+sum keeps duplicate rows from cancelling out in the XOR.
+
+Columns are referenced by name, so queries returning two columns with
+the same name can not be wrapped.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import pandas as pd
+
+import config
+
+
+null_text = "\\\\N"  # '\N' once inside a SQL string literal
+
+sum_prime = 2147483647
+
+bq_numeric = ["INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC"]
+bq_timestamp = ["TIMESTAMP", "DATETIME"]
+
+sf_numeric = ["FIXED", "REAL"]
+sf_timestamp = ["TIMESTAMP_LTZ", "TIMESTAMP_NTZ", "TIMESTAMP_TZ"]
+
+
+def strip_statement(query_text):
+    """Query text without a trailing ';' so it can be a subquery"""
+    return query_text.strip().rstrip(";").strip()
+
+
+# BigQuery
+# ========
+
+def bq_kind(field_type):
+    field_type = field_type.upper()
+    if field_type in bq_numeric:
+        return "numeric"
+    if field_type == "DATE":
+        return "date"
+    if field_type in bq_timestamp:
+        return "timestamp"
+    return "text"
+
+
+def bq_columns(client, query_text, job_config):
+    """Result column names and kinds from a BigQuery dry run
+
+    Parameters
+    ----------
+    client : bigquery.Client
+    query_text : str, query text
+    job_config : bigquery.QueryJobConfig, copied and set to dry run
+
+    Returns
+    -------
+    list of (str, str), column name and kind
+    """
+    dry_config = type(job_config).from_api_repr(job_config.to_api_repr())
+    dry_config.dry_run = True
+    dry_config.use_query_cache = False
+    job = client.query(query_text, job_config=dry_config)
+    return [(field.name, bq_kind(field.field_type)) for field in job.schema]
+
+
+def bq_canonical(name, kind):
+    col = f"`{name}`"
+    n = config.float_precision
+    if kind == "numeric":
+        expr = f"FORMAT('%.{n}f', ROUND(CAST({col} AS BIGNUMERIC), {n}))"
+    elif kind == "date":
+        expr = f"FORMAT_DATE('%Y-%m-%d', {col})"
+    elif kind == "timestamp":
+        expr = f"FORMAT_DATETIME('%Y-%m-%d %H:%M:%S', CAST({col} AS DATETIME))"
+    else:
+        expr = f"RTRIM(CAST({col} AS STRING))"
+    return f"COALESCE({expr}, '{null_text}')"
+
+
+def bq_wrap(query_text, columns):
+    """Wrap a query in the BigQuery fingerprint aggregate
+
+    Parameters
+    ----------
+    query_text : str, query text
+    columns : list of (str, str), see bq_columns
+
+    Returns
+    -------
+    str, fingerprint query text
+    """
+    row_text = ", '|', ".join(bq_canonical(name, kind) for name, kind in columns)
+    row_hash = f"CAST(CONCAT('0x', SUBSTR(TO_HEX(MD5(CONCAT({row_text}))), 1, 15)) AS INT64)"
+    return (f"SELECT COUNT(*) AS fp_rows, BIT_XOR(fp_h) AS fp_xor, " +
+            f"SUM(MOD(fp_h, {sum_prime})) AS fp_sum\n" +
+            f"FROM (SELECT {row_hash} AS fp_h\n" +
+            f"FROM ({strip_statement(query_text)}) AS fp_q) AS fp_r")
+
+
+# Snowflake
+# =========
+
+def sf_kind(type_name):
+    if type_name in sf_numeric:
+        return "numeric"
+    if type_name == "DATE":
+        return "date"
+    if type_name in sf_timestamp:
+        return "timestamp"
+    return "text"
+
+
+def sf_columns(sfc, query_text):
+    """Result column names and kinds by describing the query with LIMIT 0
+
+    Parameters
+    ----------
+    sfc : sf_tpc.Connector class instance
+    query_text : str, query text
+
+    Returns
+    -------
+    list of (str, str), column name and kind
+    """
+    from snowflake.connector.constants import FIELD_ID_TO_NAME
+
+    cursor = sfc.query(f"SELECT * FROM ({strip_statement(query_text)}) LIMIT 0")
+    return [(d[0], sf_kind(FIELD_ID_TO_NAME[d[1]])) for d in cursor.description]
+
+
+def sf_canonical(name, kind):
+    col = '"{}"'.format(name.replace('"', '""'))
+    n = config.float_precision
+    if kind == "numeric":
+        # the cast rounds half away from zero like BigQuery's ROUND and
+        # leaves 38 - n integer digits
+        expr = f"CAST(CAST({col} AS NUMBER(38, {n})) AS VARCHAR)"
+    elif kind == "date":
+        expr = f"TO_VARCHAR({col}, 'YYYY-MM-DD')"
+    elif kind == "timestamp":
+        expr = f"TO_VARCHAR({col}, 'YYYY-MM-DD HH24:MI:SS')"
+    else:
+        expr = f"RTRIM(TO_VARCHAR({col}))"
+    return f"COALESCE({expr}, '{null_text}')"
+
+
+def sf_wrap(query_text, columns):
+    """Wrap a query in the Snowflake fingerprint aggregate
+
+    Parameters
+    ----------
+    query_text : str, query text
+    columns : list of (str, str), see sf_columns
+
+    Returns
+    -------
+    str, fingerprint query text
+    """
+    row_text = " || '|' || ".join(sf_canonical(name, kind) for name, kind in columns)
+    row_hash = f"TO_NUMBER(SUBSTR(MD5({row_text}), 1, 15), 'XXXXXXXXXXXXXXX')"
+    return (f"SELECT COUNT(*) AS fp_rows, BITXOR_AGG(fp_h) AS fp_xor, " +
+            f"SUM(MOD(fp_h, {sum_prime})) AS fp_sum\n" +
+            f"FROM (SELECT {row_hash} AS fp_h\n" +
+            f"FROM ({strip_statement(query_text)}) AS fp_q) AS fp_r")
+
+
+# Results
+# =======
+
+def parse(df_result):
+    """Row count and digest from a fingerprint query result
+
+    Parameters
+    ----------
+    df_result : Pandas DataFrame, one row result of a wrapped query
+
+    Returns
+    -------
+    rows : int, result rows of the original query
+    digest : str, order insensitive digest of the result rows
+    """
+    df_result.columns = [c.lower() for c in df_result.columns]
+    r = df_result.iloc[0]
+    rows = int(r.fp_rows)
+    if rows == 0:
+        return 0, "0:0"
+    return rows, "{}:{}".format(int(r.fp_xor), int(r.fp_sum))
+
+
+def compare(df_times_1, df_times_2, suffixes=("_1", "_2")):
+    """Compare fingerprints of two query_seq timing results
+
+    Parameters
+    ----------
+    df_times_1 : Pandas DataFrame, timing data with rows and fingerprint columns
+    df_times_2 : Pandas DataFrame, same for the other system
+    suffixes : tuple of str, column suffixes for each system
+
+    Returns
+    -------
+    Pandas DataFrame, one row per query number with an 'equal' column
+    """
+    s1, s2 = suffixes
+    cols = ["query_n", "rows", "fingerprint"]
+    df = pd.merge(df_times_1[cols], df_times_2[cols], on="query_n",
+                  suffixes=suffixes, how="outer")
+    df["equal"] = ((df["rows" + s1] == df["rows" + s2]) &
+                   (df["fingerprint" + s1] == df["fingerprint" + s2]) &
+                   df["fingerprint" + s1].notnull())
+    return df
@@ -17,7 +17,7 @@ from google.cloud import storage
 
 import pandas as pd
 
-import config, tools, gcp_storage
+import config, tools, gcp_storage, query_cache
 
 
 log_column_names = ["test", "scale", "status",
@@ -501,6 +501,16 @@ def qgen_template(n, templates_dir, scale, qual=None,
     else:
         r = None
 
+    cache = query_cache.query_cache()
+    key = cache.key(test="h",
+                    files=[templates_dir + config.sep + "{}.sql".format(n)],
+                    scale=scale, seed=r, qual=qual, n=n)
+    query_text = cache.get(key)
+    if query_text is not None:
+        if verbose:
+            print("Query {} from cache: {}".format(n, cache.path(key)))
+        return query_text
+
     std_out, err_out = qgen(n=n,
                             r=r,
                             d=qual,
@@ -519,6 +529,8 @@ def qgen_template(n, templates_dir, scale, qual=None,
 
         std_err_print(std_out, err_out)
 
+    cache.put(key, query_text)
+
     return query_text
 
 
@@ -549,6 +561,16 @@ def qgen_stream(p, templates_dir, scale, qual=None,
     else:
         r = None
 
+    cache = query_cache.query_cache()
+    key = cache.key(test="h",
+                    files=sorted(glob.glob(templates_dir + config.sep + "*.sql")),
+                    scale=scale, seed=r, qual=qual, stream=p)
+    query_text = cache.get(key)
+    if query_text is not None:
+        if verbose:
+            print("Stream {} from cache: {}".format(p, cache.path(key)))
+        return query_text
+
     if p == -1:
         p = None
 
@@ -569,6 +591,8 @@ def qgen_stream(p, templates_dir, scale, qual=None,
 
         std_err_print(std_out, err_out)
 
+    cache.put(key, query_text)
+
     return query_text
 
 
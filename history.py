@@ -20,7 +20,8 @@ except ModuleNotFoundError:
 
 def exp_log_t0(results_dir):
     """Get query history for experiment"""
-    fps_time = glob.glob(results_dir + config.sep + "benchmark_times*")
+    fps_time = glob.glob(results_dir + config.sep + "**" + config.sep + "benchmark_times*",
+                         recursive=True)
     source_csv = {k: v for k, v in zip([os.path.basename(x).split("_")[2] for x in fps_time], fps_time)}
     dfsf = pd.read_csv(source_csv["sf"])
     dfbq = pd.read_csv(source_csv["bq"])
@@ -80,14 +81,7 @@ def bq_results(results_dir, t0=None, buffer_time="20 minutes", verbose: bool = F
     t_buffer = pd.Timedelta(buffer_time)
     t0 = pd.to_datetime(t0) - t_buffer
 
-    bq = bq_tpc.BQTPC(test="ds",
-                      scale=1,
-                      cid="01",
-                      desc="query_history",
-                      verbose=verbose,
-                      verbose_query=verbose)
-
-    df_bq_history, qid_bq = bq.query_history(t0=t0, t1=pd.Timestamp.utcnow())
+    df_bq_history, qid_bq = bq_tpc.query_history(t0=t0, t1=pd.Timestamp.utcnow())
 
     df_bq_history.to_csv(results_dir + config.sep + "query_history_bq.csv")
 
@@ -96,7 +90,8 @@ def bq_results(results_dir, t0=None, buffer_time="20 minutes", verbose: bool = F
 
 def test_t0(results_dir):
     """Get query history for experiment"""
-    x = glob.glob(results_dir + config.sep + "benchmark_times*")
+    x = glob.glob(results_dir + config.sep + "**" + config.sep + "benchmark_times*",
+                  recursive=True)
     df = pd.read_csv(x[0])
     t0 = df.driver_t0.min()
     t0 = pd.to_datetime(t0)
@@ -0,0 +1,429 @@
+"""Open-loop load generation
+
+Submits TPC queries at a target arrival rate for a set duration, no
+matter how many earlier queries are still running, so queueing in a
+shared BigQuery reservation or Snowflake warehouse shows up as latency
+instead of being hidden by a closed loop.  Arrivals are Poisson or at
+a fixed interval, and each arrival draws a query number from a weighted
+mix.  Query text comes from a compiled plan.Plan or is generated once
+per query number before the clock starts.
+
+Each arrival records:
+    lag_s : driver delay from the scheduled arrival to the submit
+    queue_s : time queued on the warehouse before execution
+    exec_s : execution time on the warehouse
+    latency_s : scheduled arrival to the result being available
+
+On Snowflake every statement of an arrival carries its own query tag,
+queue_s and exec_s are summed over them.
+
+Sweeping the arrival rate gives a latency against throughput curve for
+one configuration.
+
+TPC-H query 15 creates and drops a view with a fixed name, so
+concurrent copies of it conflict, leave it out of the mix.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import config, tools, bq_async
+
+try:
+    import sf_tpc
+except ModuleNotFoundError:
+    print("Failed to Load Snowflake driver.")
+
+
+sample_columns = ["db", "test", "scale", "cid", "desc", "rate", "process",
+                  "arrival", "query_n", "scheduled", "submitted", "created",
+                  "started", "ended", "finished", "qid", "status", "error",
+                  "lag_s", "queue_s", "exec_s", "latency_s"]
+
+metrics = ["lag_s", "queue_s", "exec_s", "latency_s"]
+
+
+def arrival_offsets(rate, duration, process="poisson", rng=None):
+    """Arrival times of an open-loop load
+
+    Parameters
+    ----------
+    rate : float, mean arrivals per second
+    duration : float, seconds arrivals are generated for
+    process : str, 'poisson' for exponential gaps between arrivals or
+        'fixed' for one arrival every 1 / rate seconds
+    rng : numpy.random.Generator, if None seeded with config.random_seed
+
+    Returns
+    -------
+    numpy array of float, seconds from the start, ascending
+    """
+    assert process in ["poisson", "fixed"], "process must be 'poisson' or 'fixed'"
+    if process == "fixed":
+        return np.arange(0, duration, 1 / rate)
+    if rng is None:
+        rng = np.random.default_rng(config.random_seed)
+    # given the count in an interval, Poisson arrival times are uniform
+    n = rng.poisson(rate * duration)
+    return np.sort(rng.uniform(0, duration, size=n))
+
+
+def draw_queries(mix, size, rng=None):
+    """Query numbers drawn from a weighted mix
+
+    Parameters
+    ----------
+    mix : dict, query number -> relative weight
+    size : int, number of queries to draw
+    rng : numpy.random.Generator, if None seeded with config.random_seed
+
+    Returns
+    -------
+    list of int
+    """
+    if rng is None:
+        rng = np.random.default_rng(config.random_seed)
+    keys = list(mix)
+    weights = np.array([mix[k] for k in keys], dtype="float64")
+    idx = rng.choice(len(keys), size=size, p=weights / weights.sum())
+    return [keys[i] for i in idx]
+
+
+def summarize(df_samples, by=("db", "rate"), percentiles=None):
+    """Latency percentiles and achieved throughput per arrival rate
+
+    Parameters
+    ----------
+    df_samples : Pandas DataFrame, samples from LoadGenerator.run
+    by : tuple of str, columns to group by
+    percentiles : list of float, if None config.loadgen_percentiles
+
+    Returns
+    -------
+    Pandas DataFrame, one row per group with arrivals, completed, errors,
+        throughput (completed queries per second from the first
+        arrival to the last result) and a column per metric and
+        percentile, i.e. 'latency_s_p99'
+    """
+    if percentiles is None:
+        percentiles = config.loadgen_percentiles
+    d = []
+    for key, g in df_samples.groupby(list(by)):
+        key = key if isinstance(key, tuple) else (key,)
+        ok = g.loc[g.status == "ok"]
+        span_s = (g.finished.max() - g.scheduled.min()).total_seconds()
+        row = list(key) + [len(g), len(ok), int((g.status != "ok").sum()),
+                           len(ok) / span_s if span_s > 0 else np.nan]
+        for m in metrics:
+            x = ok[m].dropna().values.astype("float64")
+            for p in percentiles:
+                row.append(np.percentile(x, p) if len(x) > 0 else np.nan)
+        d.append(row)
+    columns = (list(by) + ["arrivals", "completed", "errors", "throughput"] +
+               ["{}_p{:g}".format(m, p) for m in metrics for p in percentiles])
+    return pd.DataFrame(d, columns=columns)
+
+
+def sf_query_times(sfc, tags, t0):
+    """Queue and execution times of Snowflake arrivals from
+    INFORMATION_SCHEMA.QUERY_HISTORY, summed over all statements of an
+    arrival, i.e. the view create, query and drop of TPC-H 15
+
+    Parameters
+    ----------
+    sfc : sf_tpc.Connector class instance
+    tags : list of str, query tags, one per arrival
+    t0 : pd.Timestamp, UTC time before the first query was submitted
+
+    Returns
+    -------
+    Pandas DataFrame, indexed by query tag with created, started, ended,
+        queue_s and exec_s
+    """
+    t0 = t0.strftime("%Y-%m-%d %H:%M:%S")
+    query_text = ("select query_tag, start_time, end_time, queued_provisioning_time, " +
+                  "queued_repair_time, queued_overload_time, execution_time " +
+                  "from table(information_schema.query_history(" +
+                  f"end_time_range_start=>to_timestamp_ltz('{t0}'), " +
+                  "result_limit=>10000));")
+    df = sfc.query(query_text).fetch_pandas_all()
+    df.columns = [c.lower() for c in df.columns]
+    df = df.loc[df.query_tag.isin(tags)].copy()
+
+    df["created"] = pd.to_datetime(df.start_time, utc=True)
+    df["ended"] = pd.to_datetime(df.end_time, utc=True)
+    df["queue_s"] = (df.queued_provisioning_time + df.queued_repair_time +
+                     df.queued_overload_time) / 1000
+    df["exec_s"] = df.execution_time / 1000
+    df["started"] = df.ended - pd.to_timedelta(df.exec_s, unit="s")
+    return df.groupby("query_tag").agg(created=("created", "min"),
+                                       started=("started", "min"),
+                                       ended=("ended", "max"),
+                                       queue_s=("queue_s", "sum"),
+                                       exec_s=("exec_s", "sum"))
+
+
+class LoadGenerator:
+    def __init__(self, tpc, mix=None, rate=None, duration=None, process=None,
+                 plan=None, stream=0, qual=None, max_in_flight=None,
+                 sessions=None, seed=None, verbose_iter=False):
+        """Open-loop load of TPC queries on one system
+
+        Parameters
+        ----------
+        tpc : bq_tpc.BQTPC or sf_tpc.SFTPC instance, configured
+        mix : dict, query number -> relative weight, if None every query
+            of the stream with equal weight
+        rate : float, arrivals per second, if None config.loadgen_rate
+        duration : float, seconds arrivals are generated for, if None
+            config.loadgen_duration
+        process : str, 'poisson' or 'fixed', if None config.loadgen_process
+        plan : plan.Plan, precompiled query text for stream
+        stream : int, stream the query text is taken from
+        qual : None, or True to use qualifying values
+        max_in_flight : int, BigQuery jobs submitted and not yet finished
+            before submits wait, which shows up as lag_s, if None
+            config.loadgen_max_in_flight
+        sessions : int, Snowflake sessions queries are spread over, if
+            None config.loadgen_sf_sessions
+        seed : int, random seed for arrivals and the mix, if None
+            config.random_seed
+        verbose_iter : bool, print per query status statements
+        """
+        self.tpc = tpc
+        self.db = "bq" if hasattr(tpc, "dataset") else "sf"
+        self.plan = plan
+        self.stream = stream
+        self.qual = qual
+
+        if mix is None:
+            seq = plan.order(stream) if plan is not None else tools.tpc_stream(tpc.test, stream)
+            mix = {n: 1 for n in seq}
+        self.mix = mix
+
+        self.rate = config.loadgen_rate if rate is None else rate
+        self.duration = config.loadgen_duration if duration is None else duration
+        self.process = config.loadgen_process if process is None else process
+        self.max_in_flight = config.loadgen_max_in_flight if max_in_flight is None else max_in_flight
+        self.sessions = config.loadgen_sf_sessions if sessions is None else sessions
+        self.seed = config.random_seed if seed is None else seed
+        self.verbose_iter = verbose_iter
+
+        self.source = tpc.dataset if self.db == "bq" else tpc.database
+        self.timestamp = str(pd.Timestamp.now("UTC")).replace(" ", "_")
+        self.results_dir, _ = tools.make_name(db=self.db, test=tpc.test, cid=tpc.cid,
+                                              kind="loadgen", datasource=self.source,
+                                              desc=tpc.desc, ext="",
+                                              timestamp=self.timestamp)
+
+        self.query_text = {}  # query number -> text, compiled once
+        self.df_samples = None
+        self.df_curve = None
+
+    def compile(self):
+        """Get the query text of every query in the mix before the clock starts"""
+        for n in self.mix:
+            if n in self.query_text:
+                continue
+            if self.plan is not None:
+                self.query_text[n] = self.plan.query_text(self.stream, n)
+            else:
+                self.query_text[n] = self.tpc.generate_query(n, qual=self.qual)
+
+    def schedule(self, rate):
+        """Arrival offsets in seconds and query numbers for one rate"""
+        rng = np.random.default_rng(self.seed)
+        offsets = arrival_offsets(rate, self.duration, self.process, rng=rng)
+        return list(zip(offsets, draw_queries(self.mix, len(offsets), rng=rng)))
+
+    def label(self, n):
+        return "{}-lg-q{}-{}".format(self.source, n, self.tpc.desc).lower()
+
+    def arrival_tag(self, n, arrival, t_wall):
+        """Snowflake query tag of one arrival of the run started at t_wall"""
+        return "{}-{}-a{}".format(self.label(n), t_wall.strftime("%Y%m%d%H%M%S%f"), arrival)
+
+    def _run_bq(self, schedule, t_wall):
+        runner = bq_async.AsyncRunner(dataset=self.tpc.dataset, project=self.tpc.project,
+                                      max_in_flight=self.max_in_flight,
+                                      fetch=self.tpc.fetch, cache=self.tpc.cache)
+        jobs = []
+        t_start = time.perf_counter()
+        for offset, n in schedule:
+            delay = offset - (time.perf_counter() - t_start)
+            if delay > 0:
+                time.sleep(delay)
+            aj = runner.submit(key=n, query_text=self.query_text[n],
+                               labels={"label": self.label(n)})
+            jobs.append((offset, aj))
+            if self.verbose_iter:
+                print("{:.3f} s submitted query {}: {}".format(offset, n, aj.job_id))
+        runner.close()
+
+        d = []
+        for offset, aj in jobs:
+            d.append({"scheduled": t_wall + pd.Timedelta(seconds=offset),
+                      "query_n": aj.key,
+                      "submitted": aj.submitted,
+                      "created": aj.created,
+                      "started": aj.started,
+                      "ended": aj.ended,
+                      "finished": aj.fetch_done,
+                      "qid": aj.job_id,
+                      "status": "ok" if aj.state == "DONE" else "error",
+                      "error": aj.error})
+        df = pd.DataFrame(d)
+        for c in ["created", "started", "ended"]:
+            df[c] = pd.to_datetime(df[c], utc=True)
+        df["queue_s"] = (df.started - df.created).dt.total_seconds()
+        df["exec_s"] = (df.ended - df.started).dt.total_seconds()
+        return df
+
+    def _run_sf(self, schedule, t_wall):
+        pool = sf_tpc.connection_pool()
+        pool.size = max(pool.size, self.sessions)
+        template = self.tpc.session_template()
+        sessions = [pool.acquire(template) for _ in range(self.sessions)]
+
+        records = []
+        running = []
+        try:
+            t_start = time.perf_counter()
+            i = 0
+            while i < len(schedule) or len(running) > 0:
+                now = time.perf_counter() - t_start
+                while i < len(schedule) and schedule[i][0] <= now:
+                    offset, n = schedule[i]
+                    r = {"scheduled": t_wall + pd.Timedelta(seconds=offset),
+                         "query_n": n, "aq": None, "error": None,
+                         "tag": self.arrival_tag(n, i, t_wall)}
+                    try:
+                        # setup statements are submitted without waiting, see sf_tpc.AsyncQuery
+                        r["aq"] = self.tpc.query_async(n, query_text=self.query_text[n],
+                                                       sfc=sessions[i % len(sessions)],
+                                                       query_tag=r["tag"])
+                        running.append(r)
+                    except Exception as e:
+                        r["error"] = str(e)
+                        r["finished"] = pd.Timestamp.now("UTC")
+                    records.append(r)
+                    if self.verbose_iter:
+                        print("{:.3f} s submitted query {}".format(offset, n))
+                    i += 1
+
+                still_running = []
+                for r in running:
+                    try:
+                        if r["aq"].poll():
+                            still_running.append(r)
+                    except Exception as e:
+                        r["error"] = str(e)
+                running = still_running
+
+                # poll at a fixed interval so latency is not stretched by backoff
+                wait = config.loadgen_poll
+                if i < len(schedule):
+                    wait = min(wait, schedule[i][0] - (time.perf_counter() - t_start))
+                if wait > 0:
+                    time.sleep(wait)
+
+            tags = [r["tag"] for r in records if r["aq"] is not None]
+            df_server = sf_query_times(sessions[0], tags, t_wall)
+        finally:
+            for sfc in sessions:
+                pool.release(sfc)
+
+        d = []
+        for r in records:
+            aq = r["aq"]
+            error = r["error"] if aq is None or r["error"] is not None else aq.error
+            d.append({"scheduled": r["scheduled"],
+                      "query_n": r["query_n"],
+                      "submitted": None if aq is None else aq.submitted,
+                      "finished": r.get("finished") if aq is None else aq.finished,
+                      "qid": None if aq is None else aq.sfqid,
+                      "tag": r["tag"],
+                      "status": "ok" if error is None else "error",
+                      "error": error})
+        df = pd.DataFrame(d)
+        return df.join(df_server, on="tag")
+
+    def run(self, rate=None):
+        """Generate load at one arrival rate for self.duration seconds
+        and wait for every query to finish
+
+        Parameters
+        ----------
+        rate : float, arrivals per second, if None self.rate
+
+        Returns
+        -------
+        Pandas DataFrame, one row per arrival with sample_columns
+        """
+        rate = self.rate if rate is None else rate
+        self.compile()
+        schedule = self.schedule(rate)
+
+        t_wall = pd.Timestamp.now("UTC")
+        if self.db == "bq":
+            df = self._run_bq(schedule, t_wall)
+        else:
+            df = self._run_sf(schedule, t_wall)
+
+        df["db"] = self.db
+        df["test"] = self.tpc.test
+        df["scale"] = self.tpc.scale
+        df["cid"] = self.tpc.cid
+        df["desc"] = self.tpc.desc
+        df["rate"] = rate
+        df["process"] = self.process
+        df["arrival"] = range(len(df))
+        for c in ["scheduled", "submitted", "finished"]:
+            df[c] = pd.to_datetime(df[c], utc=True)
+        df["lag_s"] = (df.submitted - df.scheduled).dt.total_seconds()
+        df["latency_s"] = (df.finished - df.scheduled).dt.total_seconds()
+        return df[sample_columns]
+
+    def sweep(self, rates=None):
+        """Run each arrival rate in turn for a latency against
+        throughput curve, then save
+
+        Parameters
+        ----------
+        rates : list of float, arrivals per second, if None [self.rate]
+
+        Returns
+        -------
+        Pandas DataFrame, one row per rate, see summarize
+        """
+        rates = [self.rate] if rates is None else rates
+        dfs = []
+        for rate in rates:
+            df = self.run(rate)
+            dfs.append(df)
+            if self.verbose_iter:
+                print("Rate {} per s: {} arrivals, p99 latency {:.3f} s".format(
+                    rate, len(df), df.latency_s.quantile(0.99)))
+        self.df_samples = pd.concat(dfs, ignore_index=True)
+        self.df_curve = summarize(self.df_samples)
+        self.save()
+        return self.df_curve
+
+    def save(self):
+        """Write samples, the curve and settings to self.results_dir"""
+        fp = self.results_dir
+        tools.mkdir_safe(fp)
+        self.df_samples.to_csv(fp + config.sep + "loadgen_samples.csv", index=False)
+        self.df_curve.to_csv(fp + config.sep + "loadgen_curve.csv", index=False)
+        settings = {k: v for k, v in self.__dict__.items()
+                    if k in ["db", "source", "stream", "qual", "mix", "rate", "duration",
+                             "process", "max_in_flight", "sessions", "seed", "timestamp"]}
+        settings["mix"] = {str(k): v for k, v in self.mix.items()}
+        with open(fp + config.sep + "loadgen_settings.json", "w") as f:
+            json.dump(settings, f, indent="  ", default=str)
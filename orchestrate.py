@@ -0,0 +1,387 @@
+"""Full TPC benchmark runs and the reported metrics
+
+Runs the prescribed test sequence on BigQuery or Snowflake and computes
+the composite metrics with the timing intervals they need:
+
+TPC-H, specification 5.3 and 5.4
+    power test: RF1, query stream 0, RF2
+    throughput test: query streams 1..S with a refresh stream running
+        S pairs of RF1 and RF2 at the same time
+    QphH@Size = sqrt(Power@Size * Throughput@Size)
+
+TPC-DS, specification 7.4 and 7.6
+    load test (timed by the caller), power test: query stream 0,
+    throughput test 1: streams 1..Sq, data maintenance 1,
+    throughput test 2: streams Sq+1..2Sq, data maintenance 2
+    QphDS@SF = floor(SF * Q / (T_PT * T_TT * T_DM * T_LD) ** (1/4))
+
+This project does not generate refresh or data maintenance data sets,
+so the refresh functions are callables supplied by the caller.  Without
+them the metrics are also reported without the refresh intervals and
+labelled as such, they are not comparable to published results.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import json
+import math
+import threading
+
+import pandas as pd
+
+import config, tools, bq_tpc, throughput
+
+try:
+    import sf_tpc
+except ModuleNotFoundError:
+    print("Failed to Load Snowflake driver.")
+
+
+def geometric_mean(values):
+    """Geometric mean computed as exp(mean(log(x))) to avoid overflow.
+    Intervals below 1/1000 of the longest are raised to it, see TPC-H
+    specification 5.4.1.4"""
+    floor = max(values) / 1000
+    values = [max(v, floor) for v in values]
+    return math.exp(sum(math.log(v) for v in values) / len(values))
+
+
+def power_at_size(scale, query_seconds, refresh_seconds=None):
+    """TPC-H Power@Size = 3600 * SF / (prod(QI) * prod(RI)) ** (1/24)
+
+    Parameters
+    ----------
+    scale : int, database scale factor
+    query_seconds : list of float, 22 power test query intervals
+    refresh_seconds : list of float, RF1 and RF2 intervals, if None the
+        geometric mean is taken over the queries only
+
+    Returns
+    -------
+    float
+    """
+    intervals = list(query_seconds)
+    if refresh_seconds is not None:
+        intervals += list(refresh_seconds)
+    return 3600 * scale / geometric_mean(intervals)
+
+
+def qphh(power, throughput_at_size):
+    """TPC-H QphH@Size = sqrt(Power@Size * Throughput@Size)"""
+    return math.sqrt(power * throughput_at_size)
+
+
+def qphds(scale, streams, t_power, t_tt, t_dm, t_load):
+    """TPC-DS QphDS@SF
+
+    Parameters
+    ----------
+    scale : int, database scale factor
+    streams : int, Sq, number of streams in each throughput test
+    t_power : float, power test elapsed seconds
+    t_tt : float, sum of both throughput test elapsed seconds
+    t_dm : float, sum of both data maintenance elapsed seconds,
+        if None the metric is computed without T_DM
+    t_load : float, load test elapsed seconds
+
+    Returns
+    -------
+    int
+    """
+    q = streams * 99
+    t_pt = t_power / 3600 * streams
+    t_ld = 0.01 * streams * t_load / 3600
+    factors = [t_pt, t_tt / 3600, t_ld]
+    if t_dm is not None:
+        factors.append(t_dm / 3600)
+    return math.floor(scale * q / math.prod(factors) ** (1 / len(factors)))
+
+
+class FullRun:
+    def __init__(self, db, test, scale, cid, streams, desc="",
+                 warehouse=None, qual=None, save=False, plan=None,
+                 refresh=None, load_seconds=None,
+                 verbose=False, verbose_iter=False):
+        """Full TPC benchmark run with the reported metrics
+
+        Parameters
+        ----------
+        db : str, database system under test, either 'bq' or 'sf'
+        test : str, TPC test being executed, either "ds" or "h"
+        scale : int, database scale factor (i.e. 1, 100, 1000 etc)
+        cid : str, config identifier, i.e. "01" or "03A"
+        streams : int, S for TPC-H or Sq for TPC-DS
+        desc : str, description of current data collection effort
+        warehouse : str, Snowflake warehouse to run the queries on, if None
+            config.sf_warehouse_benchmark
+        qual : None, or True to use qualifying values
+        save : bool, save query text and results to disk
+        plan : plan.Plan, precompiled query text including stream 0 and
+            all throughput streams
+        refresh : dict of callables, for TPC-H 'rf1' and 'rf2', for
+            TPC-DS 'dm', each called with the refresh or maintenance run
+            number, 0 for the TPC-H power test
+        load_seconds : float, TPC-DS load test elapsed seconds
+        verbose : bool, print debug statements
+        verbose_iter : bool, print per query status statements
+        """
+        self.db = db
+        self.test = test
+        self.scale = scale
+        self.cid = cid
+        self.streams = streams
+        self.desc = desc
+
+        self.warehouse = warehouse
+        if self.warehouse is None:
+            self.warehouse = config.sf_warehouse_benchmark
+
+        self.qual = qual
+        self.save = save
+        self.plan = plan
+        self.refresh = {} if refresh is None else refresh
+        self.load_seconds = load_seconds
+
+        self.verbose = verbose
+        self.verbose_iter = verbose_iter
+
+        self.timestamp = str(pd.Timestamp.now("UTC")).replace(" ", "_")
+        self.data_source = f"{self.test}_{self.scale}GB_{self.cid}"
+        self.results_dir, _ = tools.make_name(db=self.db, test=self.test, cid=self.cid,
+                                              kind="full",
+                                              datasource=self.data_source,
+                                              desc=self.desc, ext="",
+                                              timestamp=self.timestamp)
+
+        self.intervals = {}  # name -> (t0, t1)
+        self.df_power = None
+        self.throughput = []
+        self.metrics = None
+
+        self._lock = threading.Lock()
+
+    def timed(self, name, f, *args):
+        """Call f(*args) and record its interval under name"""
+        t0 = pd.Timestamp.now("UTC")
+        out = f(*args)
+        t1 = pd.Timestamp.now("UTC")
+        with self._lock:
+            self.intervals[name] = (t0, t1)
+        if self.verbose:
+            print("{}: {:.1f} s".format(name, (t1 - t0).total_seconds()))
+        return out
+
+    def seconds(self, name):
+        if name not in self.intervals:
+            return None
+        t0, t1 = self.intervals[name]
+        return (t1 - t0).total_seconds()
+
+    def refresh_pair(self, n):
+        """Run TPC-H RF1 and RF2 for refresh run n"""
+        self.timed(f"rf1_{n}", self.refresh["rf1"], n)
+        self.timed(f"rf2_{n}", self.refresh["rf2"], n)
+
+    def power_test(self):
+        """Run query stream 0 in one session, with TPC-H RF1 before and
+        RF2 after if given
+
+        Returns
+        -------
+        Pandas DataFrame, timing data as returned by query_seq
+        """
+        if self.db == "bq":
+            tpc = bq_tpc.BQTPC(test=self.test, scale=self.scale, cid=self.cid,
+                               desc=self.desc, timestamp=self.timestamp,
+                               verbose=self.verbose)
+        else:
+            tpc = sf_tpc.SFTPC(test=self.test, scale=self.scale, cid=self.cid,
+                               warehouse=self.warehouse, desc=self.desc,
+                               timestamp=self.timestamp, verbose=self.verbose)
+            tpc.connect()
+        tpc.results_dir = self.results_dir + config.sep + "power"
+
+        if self.plan is not None:
+            seq = self.plan.order(0)
+        else:
+            seq = tools.tpc_stream(self.test, 0)
+
+        h_refresh = self.test == "h" and "rf1" in self.refresh
+        t0 = pd.Timestamp.now("UTC")
+        try:
+            if h_refresh:
+                self.timed("rf1_0", self.refresh["rf1"], 0)
+            self.df_power = self.timed("power_queries", tpc.query_seq, seq, 0,
+                                       self.qual, self.save, self.verbose_iter,
+                                       self.plan)
+            if h_refresh:
+                self.timed("rf2_0", self.refresh["rf2"], 0)
+        finally:
+            if self.db == "sf":
+                tpc.close()
+        self.intervals["power"] = (t0, pd.Timestamp.now("UTC"))
+        return self.df_power
+
+    def throughput_test(self, n, streams):
+        """Run one throughput test, for TPC-H with the refresh stream
+
+        Parameters
+        ----------
+        n : int, throughput test number, 1 or 2
+        streams : list of int, query stream numbers
+
+        Returns
+        -------
+        dict of metrics, see throughput.throughput_metrics
+        """
+        tt = throughput.ThroughputTest(db=self.db, test=self.test, scale=self.scale,
+                                       cid=self.cid, streams=streams, desc=self.desc,
+                                       warehouse=self.warehouse, qual=self.qual,
+                                       save=self.save, plan=self.plan,
+                                       verbose=self.verbose,
+                                       verbose_iter=self.verbose_iter)
+        tt.timestamp = self.timestamp
+        tt.results_dir = self.results_dir + config.sep + f"throughput_{n}"
+
+        refresh_thread = None
+        if self.test == "h" and "rf1" in self.refresh:
+            def _refresh_stream():
+                for i in range(1, len(streams)+1):
+                    self.refresh_pair(i)
+            refresh_thread = threading.Thread(target=_refresh_stream)
+
+        t0 = pd.Timestamp.now("UTC")
+        if refresh_thread is not None:
+            refresh_thread.start()
+        tt.run()
+        if refresh_thread is not None:
+            refresh_thread.join()
+        self.intervals[f"throughput_{n}"] = (t0, pd.Timestamp.now("UTC"))
+
+        self.throughput.append(tt)
+        return tt.metrics
+
+    def maintenance(self, n):
+        """Run TPC-DS data maintenance n if given"""
+        if "dm" in self.refresh:
+            self.timed(f"dm_{n}", self.refresh["dm"], n)
+
+    def run(self):
+        """Run the full test sequence and compute the metrics
+
+        Returns
+        -------
+        dict of metrics, see compute_metrics
+        """
+        tools.mkdir_safe(self.results_dir)
+        with open(self.results_dir + config.sep + "metadata_full_initial.json", "w") as f:
+            f.write(self.to_json(indent="  "))
+
+        s = self.streams
+        if self.test == "ds":
+            assert 2*s <= 20, "TPC-DS stream orders are defined for streams 0 to 20"
+        self.power_test()
+        self.throughput_test(1, list(range(1, s+1)))
+        if self.test == "ds":
+            self.maintenance(1)
+            self.throughput_test(2, list(range(s+1, 2*s+1)))
+            self.maintenance(2)
+
+        self.metrics = self.compute_metrics()
+
+        with open(self.results_dir + config.sep + "tpc_metrics.json", "w") as f:
+            json.dump(self.metrics, f, indent="  ", default=str)
+        with open(self.results_dir + config.sep + "metadata_full_final.json", "w") as f:
+            f.write(self.to_json(indent="  "))
+
+        if self.verbose:
+            print("Full Run Done!")
+            print("==============")
+            for k, v in self.metrics.items():
+                print("{}: {}".format(k, v))
+            print()
+        return self.metrics
+
+    def compute_metrics(self):
+        """Compute the reported metrics from the recorded intervals
+
+        Returns
+        -------
+        dict of metrics, timing intervals in seconds
+        """
+        d = {"db": self.db, "test": self.test, "scale": self.scale,
+             "cid": self.cid, "desc": self.desc, "streams": self.streams}
+        for name in self.intervals:
+            d[name + "_seconds"] = self.seconds(name)
+
+        if self.test == "h":
+            dt = self.df_power.driver_t1 - self.df_power.driver_t0
+            query_seconds = [x.total_seconds() for x in dt]
+            rf = [self.seconds("rf1_0"), self.seconds("rf2_0")]
+            refresh = None not in rf
+
+            # Ts spans the query streams and the refresh stream, without
+            # refresh functions every metric is labelled as not comparable
+            ts = self.seconds("throughput_1")
+            throughput_value = self.streams * 22 * 3600 / ts * self.scale
+            if refresh:
+                d["power_at_size"] = power_at_size(self.scale, query_seconds, rf)
+                d["throughput_at_size"] = throughput_value
+                d["qphh_at_size"] = qphh(d["power_at_size"], d["throughput_at_size"])
+            else:
+                d["power_at_size_no_rf"] = power_at_size(self.scale, query_seconds)
+                d["throughput_at_size_no_rf"] = throughput_value
+                d["qphh_at_size_no_rf"] = qphh(d["power_at_size_no_rf"],
+                                               d["throughput_at_size_no_rf"])
+
+        elif self.test == "ds":
+            t_power = self.seconds("power")
+            t_tt = self.seconds("throughput_1") + self.seconds("throughput_2")
+            dm = [self.seconds("dm_1"), self.seconds("dm_2")]
+            t_dm = None if None in dm else sum(dm)
+            d["t_pt_hours"] = t_power / 3600 * self.streams
+            d["t_tt_hours"] = t_tt / 3600
+            if self.load_seconds is not None:
+                d["t_ld_hours"] = 0.01 * self.streams * self.load_seconds / 3600
+                value = qphds(self.scale, self.streams, t_power, t_tt, t_dm,
+                              self.load_seconds)
+                d["qphds_at_sf" if t_dm is not None else "qphds_at_sf_no_dm"] = value
+            if t_dm is not None:
+                d["t_dm_hours"] = t_dm / 3600
+        return d
+
+    def summary(self):
+        """Metrics as a one row DataFrame, to show next to
+        analysis.MultiResult aggregates
+
+        Returns
+        -------
+        Pandas DataFrame
+        """
+        return pd.DataFrame([self.metrics])
+
+    def values(self):
+        """Get all class attributes from __dict__ attribute
+        except those prefixed with underscore ('_')
+
+        Returns
+        -------
+        dict, of (attribute: value) pairs
+        """
+        skip_attributes = ["df_power", "throughput", "plan", "refresh"]
+        d = {}
+        for k, v in self.__dict__.items():
+            if (k[0] != "_") and (k not in skip_attributes):
+                d[k] = v
+        return d
+
+    def to_json(self, indent=None):
+        """Return all class attributes as JSON, see values
+
+        Returns
+        -------
+        str, JSON formatted (attribute: value) pairs
+        """
+        return json.dumps(self.values(), default=str,
+                          sort_keys=True, indent=indent)
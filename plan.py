@@ -0,0 +1,343 @@
+"""Benchmark plan compiler
+
+Generates the SQL for every query in a range of TPC streams ahead of
+time and saves it with the stream order as one versioned JSON
+artifact.  BQTPC.query_seq and SFTPC.query_seq can then run from the
+plan without any query generator subprocess in the timed loop.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import os
+import re
+import glob
+import json
+import shutil
+import tempfile
+import concurrent.futures
+
+import pandas as pd
+
+import config, tools, ds_setup, h_setup, query_cache
+
+
+plan_version = 1
+
+ds_dialect = "sqlserver_tpc"
+
+# dsqgen writes the _BEGIN and _END dialect defines around each query
+ds_begin_define = ('define _BEGIN = "-- start query " + [_QUERY] + " in stream " + '
+                   '[_STREAM] + " using template " + [_TEMPLATE];')
+ds_end_define = ('define _END = "-- end query " + [_QUERY] + " in stream " + '
+                 '[_STREAM] + " using template " + [_TEMPLATE];')
+
+ds_begin_regex = re.compile(r"^-- start query \d+ in stream (\d+) using template query(\d+)\.tpl\s*$",
+                            re.MULTILINE)
+ds_end_regex = re.compile(r"^-- end query \d+ in stream \d+ using template query\d+\.tpl\s*$",
+                          re.MULTILINE)
+
+h_header_regex = re.compile(r"^--.*\(Q(\d+)\)\s*$")
+
+
+class Plan:
+    def __init__(self, db, test, scale, seed=None, qual=None, streams=None,
+                 template_hashes=None, created=None):
+        """Stream order and SQL text for a range of TPC query streams
+
+        Parameters
+        ----------
+        db : str, database system under test, either 'bq' or 'sf'
+        test : str, TPC test, either 'ds' or 'h'
+        scale : int, database scale factor (i.e. 1, 100, 1000 etc)
+        seed : int, random seed used by the query generator
+        qual : None, or True if qualifying values were used
+        streams : dict, stream number -> list of (query number, query text)
+            in execution order
+        template_hashes : dict, template file name -> SHA256 of contents
+        created : str, UTC timestamp the plan was compiled
+        """
+        self.version = plan_version
+        self.db = db
+        self.test = test
+        self.scale = scale
+        self.seed = seed
+        self.qual = qual
+        self.streams = {} if streams is None else streams
+        self.template_hashes = {} if template_hashes is None else template_hashes
+        self.created = created
+
+        self._index = {s: dict(q) for s, q in self.streams.items()}
+
+    def order(self, stream):
+        """Query numbers for a stream in execution order
+
+        Parameters
+        ----------
+        stream : int, query stream number
+
+        Returns
+        -------
+        list of int
+        """
+        return [n for n, _ in self.streams[int(stream)]]
+
+    def query_text(self, stream, n):
+        """SQL for query number n in a stream
+
+        Parameters
+        ----------
+        stream : int, query stream number
+        n : int, query number
+
+        Returns
+        -------
+        str, query text
+        """
+        return self._index[int(stream)][int(n)]
+
+    def to_dataframe(self):
+        """Plan as one row per stream and query, in execution order"""
+        d = []
+        for s, queries in self.streams.items():
+            for i, (n, query_text) in enumerate(queries):
+                d.append([s, i, n, query_text])
+        return pd.DataFrame(d, columns=["stream", "position", "query_n", "query_text"])
+
+    def to_dict(self):
+        return {"version": self.version,
+                "db": self.db,
+                "test": self.test,
+                "scale": self.scale,
+                "seed": self.seed,
+                "qual": self.qual,
+                "created": self.created,
+                "template_hashes": self.template_hashes,
+                "streams": {str(s): [[n, q] for n, q in queries]
+                            for s, queries in self.streams.items()}}
+
+    def save(self, fp=None):
+        """Write the plan to a JSON file
+
+        Parameters
+        ----------
+        fp : str, absolute path to file, if None a name is made in
+            config.fp_plan from the plan's parameters
+
+        Returns
+        -------
+        fp : str, absolute path to the written file
+        """
+        if fp is None:
+            tools.mkdir_safe(config.fp_plan)
+            fp = config.fp_plan + config.sep + self.name()
+        with open(fp, "w") as f:
+            json.dump(self.to_dict(), f, indent="  ")
+        return fp
+
+    def name(self):
+        s = sorted(self.streams)
+        qual = "_qual" if self.qual else ""
+        return (f"plan_v{self.version}_{self.db}_{self.test}_{self.scale}GB_" +
+                f"seed{self.seed}{qual}_s{s[0]}-{s[-1]}.json")
+
+
+def load(fp):
+    """Read a plan written by Plan.save
+
+    Parameters
+    ----------
+    fp : str, absolute path to plan JSON file
+
+    Returns
+    -------
+    Plan
+    """
+    with open(fp, "r") as f:
+        d = json.load(f)
+
+    if d["version"] != plan_version:
+        raise ValueError("Plan version {} is not supported, expected {}".format(
+            d["version"], plan_version))
+
+    streams = {int(s): [(int(n), q) for n, q in queries]
+               for s, queries in d["streams"].items()}
+    return Plan(db=d["db"], test=d["test"], scale=d["scale"],
+                seed=d["seed"], qual=d["qual"], streams=streams,
+                template_hashes=d["template_hashes"], created=d["created"])
+
+
+def ds_plan_dialect(templates_dir, dialect=ds_dialect):
+    """Write a copy of a dialect file that marks the start and end of
+    each query in dsqgen stream output
+
+    Parameters
+    ----------
+    templates_dir : str, absolute path to a scratch copy of the query
+        templates directory, the plan dialect file is written to it
+    dialect : str, dialect file name without '.tpl'
+
+    Returns
+    -------
+    str, name of the plan dialect to pass to dsqgen
+    """
+    with open(templates_dir + config.sep + dialect + ".tpl", "r") as f:
+        lines = [line for line in f
+                 if not re.match(r"\s*define\s+_(BEGIN|END)\s*=", line)]
+    lines = [line.rstrip("\n") for line in lines] + [ds_begin_define, ds_end_define]
+
+    plan_dialect = dialect + "_plan"
+    with open(templates_dir + config.sep + plan_dialect + ".tpl", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return plan_dialect
+
+
+def ds_split(stream_text):
+    """Split one dsqgen stream file into per query SQL
+
+    Parameters
+    ----------
+    stream_text : str, contents of a dsqgen query_<stream>.sql file
+
+    Returns
+    -------
+    list of (int, str), query number and query text in stream order
+    """
+    matches = list(ds_begin_regex.finditer(stream_text))
+    queries = []
+    for i, m in enumerate(matches):
+        i1 = matches[i+1].start() if i+1 < len(matches) else len(stream_text)
+        query_text = ds_end_regex.sub("", stream_text[m.end():i1]).strip() + "\n"
+        queries.append((int(m.group(2)), query_text))
+    return queries
+
+
+def h_split(stream_text):
+    """Split one qgen -p stream output into per query SQL
+
+    Parameters
+    ----------
+    stream_text : str, standard out of qgen for one stream
+
+    Returns
+    -------
+    list of (int, str), query number and query text in stream order
+    """
+    chunks = []
+    for line in stream_text.split("\n"):
+        m = h_header_regex.match(line.rstrip("\r"))
+        if m:
+            chunks.append([int(m.group(1)), []])
+        elif len(chunks) > 0:
+            chunks[-1][1].append(line.rstrip("\r"))
+
+    queries = []
+    for n, lines in chunks:
+        # the next template's leading comment lines end up at the tail
+        while len(lines) > 0 and (lines[-1].strip() == "" or lines[-1].startswith("--")):
+            lines.pop()
+        query_text = h_setup.std_out_filter("\n".join(lines))
+        queries.append((n, query_text))
+    return queries
+
+
+def compile_ds(templates_dir, scale, streams, seed, qual=None, verbose=False):
+    """Generate and split TPC-DS streams with a single dsqgen run"""
+    # the plan dialect is written to a copy so the tracked templates are untouched
+    with tempfile.TemporaryDirectory(prefix="plan_") as temp_dir:
+        plan_templates_dir = temp_dir + config.sep + "templates"
+        shutil.copytree(templates_dir, plan_templates_dir)
+        plan_dialect = ds_plan_dialect(plan_templates_dir)
+
+        output_dir = temp_dir + config.sep + "streams"
+        os.mkdir(output_dir)
+        std_out, err_out = ds_setup.dsqgen(directory=plan_templates_dir,
+                                           dialect=plan_dialect,
+                                           scale=scale,
+                                           streams=max(streams)+1,
+                                           input=plan_templates_dir + config.sep + "templates.lst",
+                                           rngseed=seed,
+                                           qualify=qual,
+                                           verbose=verbose,
+                                           output_dir=output_dir)
+        if verbose:
+            ds_setup.std_err_print(std_out, err_out)
+
+        d = {}
+        for s in streams:
+            with open(output_dir + config.sep + "query_{}.sql".format(s), "r") as f:
+                d[s] = ds_split(f.read())
+    return d
+
+
+def compile_h(templates_dir, scale, streams, seed, qual=None, verbose=False):
+    """Generate and split TPC-H streams, one qgen process per stream"""
+
+    def _qgen(s):
+        std_out, err_out = h_setup.qgen(p=s,
+                                        r=seed,
+                                        d=qual,
+                                        s=scale,
+                                        templates_dir=templates_dir,
+                                        verbose=verbose)
+        if verbose:
+            h_setup.std_err_print(std_out, err_out)
+        return h_split(std_out)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.cpu_count) as executor:
+        futures = {s: executor.submit(_qgen, s) for s in streams}
+    return {s: f.result() for s, f in futures.items()}
+
+
+def compile_plan(db, test, scale, streams, qual=None, save=True, verbose=False):
+    """Compile the SQL for all queries in a range of streams
+
+    Parameters
+    ----------
+    db : str, database system under test, either 'bq' or 'sf'
+    test : str, TPC test, either 'ds' or 'h'
+    scale : int, database scale factor (i.e. 1, 100, 1000 etc)
+    streams : iterable of int, query stream numbers, 0 is the power test
+    qual : None, or True to use qualifying values (to test 1GB qualification db)
+    save : bool, write the plan to config.fp_plan
+    verbose : bool, print debug statements
+
+    Returns
+    -------
+    Plan
+    """
+    assert db in ["bq", "sf"], "Must be valid database name"
+    assert test in ["ds", "h"], "Must be valid TPC test name"
+
+    streams = sorted(set(int(s) for s in streams))
+    templates_dir = f"{config.fp_query_templates}{config.sep}{db}_{test}"
+    seed = config.random_seed
+
+    if test == "ds":
+        d = compile_ds(templates_dir, scale, streams, seed, qual, verbose)
+        pattern = "*.tpl"
+    else:
+        d = compile_h(templates_dir, scale, streams, seed, qual, verbose)
+        pattern = "*.sql"
+
+    for s, queries in d.items():
+        expected = tools.tpc_stream(test, s)
+        actual = [n for n, _ in queries]
+        if actual != expected:
+            print("Warning: stream {} order differs from specification".format(s))
+            print("Expected:", expected)
+            print("Compiled:", actual)
+
+    template_hashes = {os.path.basename(fp): query_cache.file_hash(fp)
+                       for fp in sorted(glob.glob(templates_dir + config.sep + pattern))}
+
+    _plan = Plan(db=db, test=test, scale=scale, seed=seed, qual=qual,
+                 streams=d, template_hashes=template_hashes,
+                 created=str(pd.Timestamp.now("UTC")))
+
+    if save:
+        fp = _plan.save()
+        if verbose:
+            print("Plan saved to:", fp)
+
+    return _plan
@@ -4,6 +4,7 @@ MIT License, see LICENSE file for complete text.
 Copyright (c) 2020 SADA Systems, Inc.
 """
 
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -66,3 +67,206 @@ def apply_assert_equal(df):
 
 def apply_percent_equal(df):
     return df.apply(lambda r: percent_equal_csv(r.fp_bq, r.fp_sf), axis=1)
+
+
+# Order insensitive result hashing
+# ================================
+
+# multiplier to combine column hashes into a row hash, FNV-1a 64 bit prime
+_row_prime = np.uint64(0x100000001b3)
+
+# hash of a NULL value in any column
+_null_hash = np.uint64(0x9e3779b97f4a7c15)
+
+
+class StreamingDigest:
+    def __init__(self, n=None, drop_columns=None):
+        """Order insensitive digest of a query result, updated one
+        chunk at a time so no full sort or full result is needed.
+
+        Each cell is canonicalised with vectorised operations: numbers
+        are rounded to n decimal places, text has trailing spaces
+        removed and NULLs hash to one constant.  Column hashes are
+        combined into a row hash and row hashes are reduced with XOR
+        and a sum modulo 2**64, both commutative, so row order does
+        not change the digest and duplicate rows are still counted.
+
+        A column's kind, numeric or text, is fixed by the first chunk
+        where it has non-NULL values.  NULLs hash the same whatever the
+        kind, so chunks before that are hashed consistently.
+
+        Parameters
+        ----------
+        n : int, number of decimal places to round numbers to,
+            if None config.float_precision
+        drop_columns : list of str, lowercase column names to ignore,
+            if None the same columns tools.to_consistent drops
+        """
+        self.n = config.float_precision if n is None else n
+        self.drop_columns = ["lochierarchy"] if drop_columns is None else drop_columns
+
+        self.columns = None
+        self.kinds = None
+        self.rows = 0
+
+        self._xor = np.uint64(0)
+        self._sum = np.uint64(0)
+        self._col_xor = None
+        self._col_sum = None
+
+    @staticmethod
+    def _kind(s):
+        """Kind of a column from its non-NULL values, None if all NULL"""
+        values = s.dropna()
+        if len(values) == 0:
+            return None
+        if pd.api.types.is_datetime64_any_dtype(s):
+            return "text"
+        try:
+            pd.to_numeric(values)
+            return "numeric"
+        except (ValueError, TypeError):
+            return "text"
+
+    def _column_hash(self, s, kind):
+        mask = s.isna().values
+        if kind == "numeric":
+            try:
+                v = pd.to_numeric(s).astype("float64").values
+            except (ValueError, TypeError):
+                raise ValueError("Column '{}' was numeric in an earlier chunk but "
+                                 "has text values".format(s.name))
+            # + 0.0 so -0.0 and 0.0 hash the same
+            v = np.round(np.where(mask, 0.0, v), self.n) + 0.0
+            h = pd.util.hash_array(v)
+        else:
+            if pd.api.types.is_datetime64_any_dtype(s):
+                s = s.dt.strftime("%Y-%m-%d %H:%M:%S").str.replace(" 00:00:00", "", regex=False)
+            v = s.where(~mask, "").astype(str).str.rstrip().values.astype(object)
+            h = pd.util.hash_array(v, categorize=False)
+        h[mask] = _null_hash
+        return h
+
+    def update(self, df):
+        """Add a chunk of result rows to the digest
+
+        Parameters
+        ----------
+        df : Pandas DataFrame, result rows, all chunks with the same columns
+        """
+        columns = [str(c).lower() for c in df.columns]
+        keep = [i for i, c in enumerate(columns) if c not in self.drop_columns]
+
+        if self.columns is None:
+            self.columns = [columns[i] for i in keep]
+            self.kinds = [None] * len(keep)  # None until a non-NULL value is seen
+            self._col_xor = np.zeros(len(keep), dtype="uint64")
+            self._col_sum = np.zeros(len(keep), dtype="uint64")
+        elif [columns[i] for i in keep] != self.columns:
+            raise ValueError("Chunk columns differ from the first chunk")
+
+        for j, i in enumerate(keep):
+            if self.kinds[j] is None:
+                self.kinds[j] = self._kind(df.iloc[:, i])
+
+        if len(df) == 0:
+            return
+
+        row_hash = np.zeros(len(df), dtype="uint64")
+        with np.errstate(over="ignore"):
+            for j, i in enumerate(keep):
+                # a column still without a kind is all NULL, which hashes the same as text
+                h = self._column_hash(df.iloc[:, i], self.kinds[j] or "text")
+                self._col_xor[j] ^= np.bitwise_xor.reduce(h)
+                self._col_sum[j] += h.sum(dtype="uint64")
+                row_hash = (row_hash ^ h) * _row_prime
+            self._xor ^= np.bitwise_xor.reduce(row_hash)
+            self._sum += row_hash.sum(dtype="uint64")
+        self.rows += len(df)
+
+    def digest(self):
+        """Digest of all rows added
+
+        Returns
+        -------
+        str, row count, XOR and sum of row hashes
+        """
+        return "{}:{:016x}:{:016x}".format(self.rows, int(self._xor), int(self._sum))
+
+    def column_digests(self):
+        """Digest of each column's values independent of the other columns
+
+        Returns
+        -------
+        dict, column name -> str digest
+        """
+        if self.columns is None:
+            return {}
+        return {c: "{:016x}:{:016x}".format(int(x), int(s))
+                for c, x, s in zip(self.columns, self._col_xor, self._col_sum)}
+
+
+def digest_df(df, n=None):
+    """StreamingDigest of a complete DataFrame"""
+    sd = StreamingDigest(n=n)
+    sd.update(df)
+    return sd
+
+
+def digest_csv(fp, n=None, chunksize=None):
+    """StreamingDigest of a results CSV, read in chunks
+
+    Parameters
+    ----------
+    fp : str, filepath to results CSV
+    n : int, number of decimal places to round numbers to
+    chunksize : int, rows per chunk, if None config.qc_chunk_size
+
+    Returns
+    -------
+    StreamingDigest
+    """
+    if chunksize is None:
+        chunksize = config.qc_chunk_size
+    sd = StreamingDigest(n=n)
+    for chunk in pd.read_csv(fp, chunksize=chunksize):
+        sd.update(chunk)
+    return sd
+
+
+def diverged_columns(sd1, sd2):
+    """Names of the columns whose digests differ between two results,
+    compared by position since column names may differ by system
+
+    Returns
+    -------
+    list of str, column names from sd1
+    """
+    cd1 = list(sd1.column_digests().items())
+    cd2 = list(sd2.column_digests().items())
+    diverged = [c1 for (c1, d1), (_, d2) in zip(cd1, cd2) if d1 != d2]
+    diverged += [c for c, _ in cd1[len(cd2):]]
+    return diverged
+
+
+def digest_equal_csv(fp1, fp2):
+    sd1 = digest_csv(fp1)
+    sd2 = digest_csv(fp2)
+    if sd1.rows == 0 and sd2.rows == 0:
+        return False
+    return sd1.digest() == sd2.digest()
+
+
+def apply_digest_equal(df):
+    """Compare the CSV results from a dual SF/BQ query sequence by
+    digest, without sorting either result
+
+    Parameters
+    ----------
+    df : Pandas Dataframe, filepaths to each results file
+
+    Returns
+    -------
+    result : Pandas Series, bool if the result digests were identical
+    """
+    return df.apply(lambda r: digest_equal_csv(r.fp_bq, r.fp_sf), axis=1)
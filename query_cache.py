@@ -0,0 +1,249 @@
+"""Content addressed disk cache of generated TPC query text
+
+With a fixed config.random_seed the output of dsqgen and qgen is
+deterministic, so the SQL for a template is stored on disk keyed by
+a hash of every input that changes it.  Repeated runs, QC notebooks
+and QueryCompare then reuse the text without running the generator.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import os
+import glob
+import json
+import time
+import hashlib
+import threading
+
+import config, tools
+
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def file_hash(fp):
+    """SHA256 of a file's contents, memoised on path, size and mtime
+    so unchanged templates are only read once per process.
+
+    Parameters
+    ----------
+    fp : str, absolute path to file
+
+    Returns
+    -------
+    str, hex digest or None if the file does not exist
+    """
+    try:
+        stat = os.stat(fp)
+    except FileNotFoundError:
+        return None
+
+    k = (fp, stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        digest = _file_hashes.get(k)
+    if digest is None:
+        with open(fp, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with _file_hashes_lock:
+            _file_hashes[k] = digest
+    return digest
+
+
+class QueryCache:
+    def __init__(self, directory=None, max_bytes=None, enabled=None):
+        """Disk cache of generated query text
+
+        Parameters
+        ----------
+        directory : str, absolute path to cache directory,
+            if None config.fp_query_cache is used
+        max_bytes : int, total size of cached files before the least
+            recently used are evicted, if None config.query_cache_max_bytes
+        enabled : bool, if False every lookup misses and nothing is stored,
+            if None config.query_cache_enabled
+        """
+        if directory is None:
+            directory = config.fp_query_cache
+        if max_bytes is None:
+            max_bytes = config.query_cache_max_bytes
+        if enabled is None:
+            enabled = config.query_cache_enabled
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        # path -> [size, last used], read from disk on first use, then
+        # kept current so put does not scan the directory
+        self._index = None
+        self._total = 0
+
+    def _load_index(self):
+        """Build the size index from the cache directory, call with self._lock held"""
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total = 0
+        for fp in glob.glob(self.directory + config.sep + "*.sql"):
+            try:
+                stat = os.stat(fp)
+            except FileNotFoundError:
+                continue
+            self._index[fp] = [stat.st_size, stat.st_mtime]
+            self._total += stat.st_size
+
+    def key(self, test, files, scale, seed, qual=None, n=None, stream=None):
+        """Build the cache key for one generator call
+
+        Parameters
+        ----------
+        test : str, TPC test being executed, either "ds" or "h"
+        files : list of str, absolute paths to every template and
+            dialect file the generator reads
+        scale : int, database scale factor
+        seed : int, random seed passed to the generator
+        qual : None or True, qualification values
+        n : int, query template number, None for a stream
+        stream : int, query stream number, None for a single template
+
+        Returns
+        -------
+        str, hex digest key or None if the call cannot be cached
+        """
+        if (not self.enabled) or (seed is None):
+            return None
+
+        d = {"test": test,
+             "files": [[os.path.basename(fp), file_hash(fp)] for fp in files],
+             "scale": scale,
+             "seed": seed,
+             "qual": bool(qual),
+             "n": n,
+             "stream": stream}
+        s = json.dumps(d, sort_keys=True)
+        return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return self.directory + config.sep + key + ".sql"
+
+    def get(self, key):
+        """Read cached query text
+
+        Parameters
+        ----------
+        key : str, key from QueryCache.key
+
+        Returns
+        -------
+        str, query text or None on a miss
+        """
+        if key is None:
+            return None
+
+        fp = self.path(key)
+        try:
+            with open(fp, "r") as f:
+                query_text = f.read()
+            os.utime(fp)  # mark as recently used for eviction
+        except FileNotFoundError:
+            query_text = None
+
+        with self._lock:
+            if query_text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if self._index is not None and fp in self._index:
+                    self._index[fp][1] = time.time()
+        return query_text
+
+    def put(self, key, query_text):
+        """Store query text, empty generator output is never cached
+
+        Parameters
+        ----------
+        key : str, key from QueryCache.key
+        query_text : str, generated query text
+        """
+        if (key is None) or (not query_text) or (len(query_text.strip()) == 0):
+            return
+
+        tools.mkdir_safe(self.directory)
+        fp = self.path(key)
+        fp_temp = fp + ".{}.tmp".format(threading.get_ident())
+        with open(fp_temp, "w") as f:
+            f.write(query_text)
+        os.replace(fp_temp, fp)
+
+        with self._lock:
+            self._load_index()
+            size = os.path.getsize(fp)
+            if fp in self._index:
+                self._total -= self._index[fp][0]
+            self._index[fp] = [size, time.time()]
+            self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used files until the cache is below max_bytes"""
+        with self._lock:
+            self._load_index()
+            if self._total <= self.max_bytes:
+                return
+            files = sorted(self._index.items(), key=lambda item: item[1][1])
+            for fp, (size, _) in files:
+                if self._total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(fp)
+                except FileNotFoundError:
+                    pass
+                del self._index[fp]
+                self._total -= size
+                self.evictions += 1
+
+    def clear(self):
+        """Delete every cached query and reset counters"""
+        with self._lock:
+            for fp in glob.glob(self.directory + config.sep + "*.sql"):
+                os.remove(fp)
+            self._index = {}
+            self._total = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Cache counters and current size
+
+        Returns
+        -------
+        dict, with keys hits, misses, evictions, files, size_bytes
+        """
+        with self._lock:
+            self._load_index()
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "files": len(self._index),
+                    "size_bytes": self._total}
+
+
+_query_cache = None
+
+
+def query_cache():
+    """Get the process wide QueryCache, created on first use"""
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryCache()
+    return _query_cache
@@ -0,0 +1,224 @@
+"""Repeated query runs with warm-up and statistical summaries
+
+Runs each query of a sequence through a configured BQTPC or SFTPC
+instance for warm-up iterations, then measured iterations, keeps every
+sample and summarises them per system and query with the median, p90,
+p99, standard deviation and a bootstrap confidence interval of the
+median.  A query stops being sampled once its interval is tight enough.
+Samples of runs that errored or timed out are kept with their status
+but left out of the statistics and the early stop.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+import config, tools
+
+
+def bootstrap_ci(x, confidence=None, n_boot=None, rng=None):
+    """Bootstrap confidence interval of the median
+
+    Parameters
+    ----------
+    x : array-like of float, samples
+    confidence : float, confidence level, if None config.repeat_confidence
+    n_boot : int, resamples, if None config.repeat_bootstrap
+    rng : numpy.random.Generator, if None seeded with config.random_seed
+
+    Returns
+    -------
+    lower : float
+    upper : float
+    """
+    if confidence is None:
+        confidence = config.repeat_confidence
+    if n_boot is None:
+        n_boot = config.repeat_bootstrap
+    if rng is None:
+        rng = np.random.default_rng(config.random_seed)
+
+    x = np.asarray(x, dtype="float64")
+    if len(x) < 2:
+        return np.nan, np.nan
+    resamples = rng.choice(x, size=(n_boot, len(x)), replace=True)
+    medians = np.median(resamples, axis=1)
+    alpha = (1 - confidence) / 2
+    return np.quantile(medians, alpha), np.quantile(medians, 1 - alpha)
+
+
+def relative_width(lower, upper, median):
+    """CI width relative to the median, NaN if the median is not positive"""
+    if not median > 0:
+        return np.nan
+    return (upper - lower) / median
+
+
+def summarize(df_samples, by=("db", "query_n")):
+    """Statistics of measured samples with status 'ok'
+
+    Parameters
+    ----------
+    df_samples : Pandas DataFrame, samples with 'dt_s' and 'warmup'
+        columns, and 'status' if any run may have failed
+    by : tuple of str, columns to group by
+
+    Returns
+    -------
+    Pandas DataFrame, one row per group with n, excluded, the measured
+        samples left out for their status, mean, median, p90, p99,
+        std, ci_lower, ci_upper and ci_width, the CI width relative to
+        the median
+    """
+    rng = np.random.default_rng(config.random_seed)
+    df = df_samples.loc[~df_samples.warmup]
+    d = []
+    for key, g in df.groupby(list(by)):
+        ok = g.status == "ok" if "status" in g.columns else np.ones(len(g), dtype=bool)
+        x = g.dt_s.values[ok]
+        key = key if isinstance(key, tuple) else (key,)
+        if len(x) == 0:
+            d.append(list(key) + [0, len(g)] + [np.nan] * 8)
+            continue
+        lower, upper = bootstrap_ci(x, rng=rng)
+        median = np.median(x)
+        d.append(list(key) + [len(x), len(g) - len(x), np.mean(x), median,
+                              np.quantile(x, 0.9), np.quantile(x, 0.99),
+                              np.std(x, ddof=1) if len(x) > 1 else np.nan,
+                              lower, upper, relative_width(lower, upper, median)])
+    columns = list(by) + ["n", "excluded", "mean", "median", "p90", "p99", "std",
+                          "ci_lower", "ci_upper", "ci_width"]
+    return pd.DataFrame(d, columns=columns)
+
+
+class RepeatRun:
+    def __init__(self, tpc, seq, warmup=None, iterations=None,
+                 min_iterations=None, ci_width=None, order="interleaved",
+                 qual=None, verbose_iter=False):
+        """Repeated runs of a query sequence on one system
+
+        Parameters
+        ----------
+        tpc : bq_tpc.BQTPC or sf_tpc.SFTPC instance, configured and for
+            Snowflake connected
+        seq : list of int, query numbers to execute
+        warmup : int, unmeasured iterations per query,
+            if None config.repeat_warmup
+        iterations : int, maximum measured iterations per query,
+            if None config.repeat_iterations
+        min_iterations : int, measured iterations before a query may stop
+            early, if None config.repeat_min_iterations
+        ci_width : float, stop sampling a query once its CI width relative
+            to the median is at or below this, if None
+            config.repeat_ci_width, 0 disables early stopping
+        order : str, 'interleaved' runs the sequence once per iteration,
+            'blocked' runs all iterations of one query before the next
+        qual : None, or True to use qualifying values
+        verbose_iter : bool, print per query status statements
+        """
+        assert order in ["interleaved", "blocked"], "order must be 'interleaved' or 'blocked'"
+
+        self.tpc = tpc
+        self.db = "bq" if hasattr(tpc, "dataset") else "sf"
+        self.seq = list(seq)
+
+        self.warmup = config.repeat_warmup if warmup is None else warmup
+        self.iterations = config.repeat_iterations if iterations is None else iterations
+        self.min_iterations = (config.repeat_min_iterations if min_iterations is None
+                               else min_iterations)
+        self.ci_width = config.repeat_ci_width if ci_width is None else ci_width
+        self.order = order
+        self.qual = qual
+        self.verbose_iter = verbose_iter
+
+        self.query_text = {}  # query number -> text, generated once
+        self.samples = []
+        self.stopped = {}  # query number -> measured iterations at early stop
+        self.df_samples = None
+        self.df_stats = None
+
+    def label(self, n, iteration):
+        source = self.tpc.dataset if self.db == "bq" else self.tpc.database
+        label = "{}-q{}-r{}-{}".format(source, n, iteration, self.tpc.desc)
+        return label.lower()
+
+    def run_one(self, n, iteration, warmup):
+        """Run query n once and record the sample with its status"""
+        self.tpc.set_query_label(self.label(n, iteration))
+        self.tpc.last_status = None
+        t0, t1, _, query_text, qid = self.tpc.query_n(n=n, qual=self.qual,
+                                                      query_text=self.query_text.get(n))
+        self.query_text[n] = query_text
+        status = self.tpc.last_status
+        self.samples.append([self.db, self.tpc.test, self.tpc.scale, self.tpc.cid,
+                             self.tpc.desc, n, iteration, warmup, t0, t1,
+                             (t1 - t0).total_seconds(), qid, status])
+        if self.verbose_iter:
+            print("Query {} iteration {}{}: {:.3f} s, {}".format(
+                n, iteration, " (warm-up)" if warmup else "", (t1 - t0).total_seconds(),
+                status))
+
+    def done(self, n):
+        """True if query n has used its measured iterations, or its
+        samples with status 'ok' have a tight enough CI"""
+        measured = [s for s in self.samples if s[5] == n and not s[7]]
+        if len(measured) >= self.iterations:
+            return True
+        x = [s[10] for s in measured if s[12] == "ok"]
+        if not self.ci_width or len(x) < max(self.min_iterations, 2):
+            return False
+        lower, upper = bootstrap_ci(x)
+        if relative_width(lower, upper, np.median(x)) <= self.ci_width:
+            self.stopped[n] = len(x)
+            return True
+        return False
+
+    def run(self):
+        """Run warm-up and measured iterations and summarise
+
+        Returns
+        -------
+        Pandas DataFrame, statistics per query, see summarize
+        """
+        if self.order == "interleaved":
+            for i in range(self.warmup):
+                for n in self.seq:
+                    self.run_one(n, i, True)
+            remaining = list(self.seq)
+            i = 0
+            while len(remaining) > 0:
+                for n in remaining:
+                    self.run_one(n, i, False)
+                remaining = [n for n in remaining if not self.done(n)]
+                i += 1
+        else:
+            for n in self.seq:
+                for i in range(self.warmup):
+                    self.run_one(n, i, True)
+                i = 0
+                while not self.done(n):
+                    self.run_one(n, i, False)
+                    i += 1
+
+        columns = ["db", "test", "scale", "cid", "desc", "query_n", "iteration",
+                   "warmup", "driver_t0", "driver_t1", "dt_s", "qid", "status"]
+        self.df_samples = pd.DataFrame(self.samples, columns=columns)
+        self.df_stats = summarize(self.df_samples)
+        self.save()
+        return self.df_stats
+
+    def save(self):
+        """Write samples, statistics and settings to the instance's results_dir"""
+        fp = self.tpc.results_dir
+        tools.mkdir_safe(fp)
+        self.df_samples.to_csv(fp + config.sep + "repeat_samples.csv", index=False)
+        self.df_stats.to_csv(fp + config.sep + "repeat_stats.csv", index=False)
+        settings = {k: v for k, v in self.__dict__.items()
+                    if k in ["db", "seq", "warmup", "iterations", "min_iterations",
+                             "ci_width", "order", "qual", "stopped"]}
+        with open(fp + config.sep + "repeat_settings.json", "w") as f:
+            json.dump(settings, f, indent="  ", default=str)
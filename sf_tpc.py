@@ -16,20 +16,39 @@ https://docs.snowflake.com/en/sql-reference/intro-summary-data-types.html
 for Snowflake datatype specifications in standard SQL
 """
 
+import os
+import time
 import snowflake.connector
 import atexit
+import contextlib
 import json
+import queue
+import threading
+import concurrent.futures
 
 import pandas as pd
 
 import config, poor_security, gcp_storage, tools
-import h_setup, ds_setup
+import h_setup, ds_setup, dialect, fingerprint, tracing
+
+
+# connector error number of a query aborted by an execute timeout
+sf_timeout_errno = 604
 
 
 log_column_names = ["test", "scale", "database",
                     "table", "status",
                     "t0", "t1",
-                    "size_bytes", "job_id"]
+                    "size_bytes", "job_id", "rows_loaded", "bytes_loaded"]
+
+# Snowflake limit on the number of files in one COPY INTO FILES= list
+copy_files_max = 1000
+
+# same format as config.sf_named_file_format, but with compression detected
+# so files gzipped by PUT are also read
+csv_format_options = ("type=csv field_delimiter='|' skip_header=0 " +
+                      "null_if=('NULL', 'null') empty_field_as_null=true " +
+                      "encoding='iso-8859-1' compression=auto")
 
 
 def parse_log(fp):
@@ -41,15 +60,53 @@ def calc_cost(running_time):
     return running_time * config.sf_warehouse_cost
 
 
-def brute_force_clean_query(query_text):
-    """Brute force removal of TPC template text that isn't needed"""
-    query_text = query_text.replace('set rowcount', 'LIMIT').strip()
-    query_text = query_text.replace('top 100;', 'LIMIT 100;').strip()
-    query_text = query_text.replace('\n top 100', '\n LIMIT 100').strip()
+def copy_rows_loaded(query_result):
+    """Total rows loaded as reported by the result of a COPY INTO statement
+
+    Parameters
+    ----------
+    query_result : Snowflake connector cursor object result
+
+    Returns
+    -------
+    int, sum of 'rows_loaded' over all files in the COPY
+    """
+    columns = [c[0].lower() for c in query_result.description]
+    if "rows_loaded" not in columns:
+        # i.e. 'Copy executed with 0 files processed.'
+        return 0
+    i = columns.index("rows_loaded")
+    return int(sum([r[i] for r in query_result.fetchall()]))
 
-    if query_text.endswith('go'):
-        query_text = query_text[:len(query_text) - 2]
 
+def copy_bytes_loaded(sfc, table, t0):
+    """Bytes of the files loaded into a table since t0, from the
+    INFORMATION_SCHEMA.COPY_HISTORY table function.  The COPY INTO result
+    and LOAD_HISTORY do not report bytes.  File sizes are as staged, so
+    compressed for files gzipped by PUT.
+
+    Parameters
+    ----------
+    sfc : Connector class instance, with the table's database and schema in use
+    table : str, name of table loaded
+    t0 : pd.Timestamp, UTC time before the first COPY INTO
+
+    Returns
+    -------
+    int, sum of file_size over files not failed
+    """
+    t0 = t0.strftime("%Y-%m-%d %H:%M:%S")
+    query_text = ("select coalesce(sum(file_size), 0) " +
+                  "from table(information_schema.copy_history(" +
+                  f"table_name=>'{table}', " +
+                  f"start_time=>to_timestamp_ltz('{t0} +00:00', 'YYYY-MM-DD HH24:MI:SS TZH:TZM'))) " +
+                  "where status != 'Load failed';")
+    return int(sfc.query(query_text).fetchone()[0])
+
+
+def brute_force_clean_query(query_text):
+    """Brute force removal of TPC template text that isn't needed"""
+    query_text, _ = dialect.sf_query.rewrite(query_text)
     return query_text
 
 
@@ -106,6 +163,58 @@ class Warehouse:
         self.comment = "NA"
 
 
+class SessionTemplate:
+    def __init__(self, warehouse=None, database=None, schema=None, role=None,
+                 timezone="UTC", query_tag=None, cache=False):
+        """Snowflake session context a pooled connection is set to before use.
+        Values of None are left as the connection currently has them.
+
+        Parameters
+        ----------
+        warehouse : str, warehouse to use
+        database : str, database to use
+        schema : str, schema to use
+        role : str, role to use
+        timezone : str, session timezone, defaults to 'UTC'
+        query_tag : str, session query tag, None clears the tag a
+            previous borrower of a pooled connection set
+        cache : bool, use cached results, defaults to False
+        """
+        self.warehouse = warehouse
+        self.database = database
+        self.schema = schema
+        self.role = role
+        self.timezone = timezone
+        self.query_tag = query_tag
+        self.cache = cache
+
+    def parameters(self):
+        """Session parameters in the form accepted by ALTER SESSION
+        and snowflake.connector.connect(session_parameters=...)
+
+        Returns
+        -------
+        dict, (parameter: value) pairs
+        """
+        d = {"TIMEZONE": self.timezone,
+             "QUERY_TAG": "" if self.query_tag is None else self.query_tag,
+             "USE_CACHED_RESULT": self.cache}
+        return {k: v for k, v in d.items() if v is not None}
+
+    def context(self):
+        """Object context of the session, set with USE statements
+
+        Returns
+        -------
+        dict, (object type: name) pairs
+        """
+        d = {"ROLE": self.role,
+             "WAREHOUSE": self.warehouse,
+             "DATABASE": self.database,
+             "SCHEMA": self.schema}
+        return {k: v for k, v in d.items() if v is not None}
+
+
 class Connector:
     def __init__(self, verbose=False, verbose_query=False):
         """"Snowflake Connector wrapper class"""
@@ -116,16 +225,30 @@ class Connector:
         self.conn = None                    # Connector class connection
         self.cursor = None                  # Connector cursor
         self.dry_run = False                # execute query in dry run mode
+        self.session = {}                   # session parameters and context last set
 
         atexit.register(self.close)         # if class closes, close connection
 
     def close(self):
         """ Closes connection to Snowflake server"""
-        self.conn.close()
+        if self.conn is not None:
+            self.conn.close()
+
+    def is_closed(self):
+        return (self.conn is None) or self.conn.is_closed()
 
-    def connect(self, account, username, password, verbose=False):
+    def connect(self, account, username, password, verbose=False, template=None):
         """Initializes a network connection to Snowflake using
         values saved in config.py and poor_security.py
+
+        Parameters
+        ----------
+        account : str, Snowflake account name
+        username : str, Snowflake user name
+        password : str, Snowflake user password
+        verbose : bool, print debug statements
+        template : SessionTemplate class instance, session context set
+            at login, saving a round trip per value
         """
 
         if verbose:
@@ -135,19 +258,73 @@ class Connector:
             print(f'Account:  {account}')
             print()
 
+        kwargs = {}
+        if template is not None:
+            kwargs = {k.lower(): v for k, v in template.context().items()}
+            kwargs["session_parameters"] = template.parameters()
+
         self.conn = snowflake.connector.connect(user=username,
                                                 password=password,
-                                                account=account
+                                                account=account,
+                                                **kwargs
                                                 )
         self.cursor = self.conn.cursor()
 
-    def query(self, query_text, verbose=False):
+        if template is not None:
+            self.session = {**template.parameters(), **template.context()}
+
+    def cursor_new(self):
+        """Open an additional cursor on this connection, so several
+        queries can run concurrently from different threads
+
+        Returns
+        -------
+        Snowflake connector cursor object
+        """
+        assert self.conn is not None, "Connection not initialized"
+        return self.conn.cursor()
+
+    def apply_session(self, template, verbose=False):
+        """Set the session to a template, only running the statements
+        for values that differ from what was last set
+
+        Parameters
+        ----------
+        template : SessionTemplate class instance
+        verbose : bool, print debug statements
+        """
+        for k, v in template.context().items():
+            if self.session.get(k) != v:
+                self.query(f"USE {k} {v}", verbose=verbose)
+                self.session[k] = v
+                if k == "DATABASE":
+                    # USE DATABASE resets the schema to PUBLIC
+                    self.session.pop("SCHEMA", None)
+
+        changed = {k: v for k, v in template.parameters().items()
+                   if self.session.get(k) != v}
+        if len(changed) > 0:
+            values = []
+            for k, v in changed.items():
+                if isinstance(v, bool):
+                    values.append(f"{k}={str(v).lower()}")
+                else:
+                    values.append(f"{k}='{v}'")
+            self.query("ALTER SESSION SET " + " ".join(values), verbose=verbose)
+            self.session.update(changed)
+
+    def query(self, query_text, verbose=False, cursor=None, timeout=None):
         """Opens cursor, runs query and returns all results at once
 
         Parameters
         ----------
         query_text : str, query to execute
         verbose : bool, print debug statements
+        cursor : Snowflake connector cursor object to run the query on,
+            if None the connection's default cursor is used
+        timeout : float, seconds before the connector aborts the query
+            and raises ProgrammingError with errno sf_timeout_errno,
+            if None no limit
 
         Returns
         -------
@@ -156,6 +333,9 @@ class Connector:
 
         assert self.conn is not None, "Connection not initialized"
 
+        if cursor is None:
+            cursor = self.cursor
+
         if self.dry_run:
             return
         else:
@@ -168,23 +348,99 @@ class Connector:
                 print("====================")
                 print(qt)
                 print()
-            query_result = self.cursor.execute(query_text)
+            query_result = cursor.execute(query_text, timeout=timeout)
             return query_result
 
+    def cancel(self, sfqid):
+        """Abort a running query by query id
+
+        Parameters
+        ----------
+        sfqid : str, Snowflake query id
+        """
+        return self.query(f"SELECT SYSTEM$CANCEL_QUERY('{sfqid}')")
+
+    def query_async(self, query_text, verbose=False, cursor=None, query_tag=None):
+        """Submit a query without waiting for it to finish
+
+        Parameters
+        ----------
+        query_text : str, query to execute
+        verbose : bool, print debug statements
+        cursor : Snowflake connector cursor object to submit the query on,
+            if None the connection's default cursor is used
+        query_tag : str, QUERY_TAG of this statement only, if None the
+            session's tag
+
+        Returns
+        -------
+        sfqid : str, Snowflake query id
+        """
+
+        assert self.conn is not None, "Connection not initialized"
+
+        if cursor is None:
+            cursor = self.cursor
+
+        if verbose:
+            print("SNOWFLAKE ASYNC QUERY TEXT")
+            print("==========================")
+            print(query_text)
+            print()
+        if query_tag is None:
+            cursor.execute_async(query_text)
+        else:
+            cursor.execute_async(query_text, _statement_params={"QUERY_TAG": query_tag})
+        return cursor.sfqid
+
+    def query_status(self, sfqid):
+        """Status of a submitted query
+
+        Parameters
+        ----------
+        sfqid : str, Snowflake query id
+
+        Returns
+        -------
+        snowflake.connector.constants.QueryStatus
+        """
+        return self.conn.get_query_status(sfqid)
+
+    def query_result(self, sfqid):
+        """Cursor over the results of a submitted query, blocking until
+        the query finishes
+
+        Parameters
+        ----------
+        sfqid : str, Snowflake query id
+
+        Returns
+        -------
+        Snowflake connector cursor object
+        """
+        cursor = self.conn.cursor()
+        cursor.get_results_from_sfqid(sfqid)
+        return cursor
+
     def cache_on(self):
         self.query("ALTER SESSION SET USE_CACHED_RESULT=true")
+        self.session["USE_CACHED_RESULT"] = True
 
     def cache_off(self):
         self.query("ALTER SESSION SET USE_CACHED_RESULT=false")
+        self.session["USE_CACHED_RESULT"] = False
 
     def role_select(self, role, verbose=False):
         self.query(f'USE ROLE {role}', verbose=verbose)
+        self.session["ROLE"] = role
 
     def set_query_tag(self, tag_text):
         self.query(f"ALTER SESSION SET QUERY_TAG = '{tag_text}'")
+        self.session["QUERY_TAG"] = tag_text
 
     def set_timezone(self, timezone_code):
         self.query(f"ALTER SESSION SET TIMEZONE = '{timezone_code}'")
+        self.session["TIMEZONE"] = timezone_code
 
     def show_warehouses(self):
         return self.query("SHOW WAREHOUSES")
@@ -198,11 +454,16 @@ class Connector:
 
     def warehouse_use(self, name, verbose=False):
         self.query(f'USE WAREHOUSE {name}', verbose=verbose)
+        self.session["WAREHOUSE"] = name
 
     def warehouse_suspend(self, name, verbose=False):
         """ suspends warehouse and closes connection """
         self.query(f'ALTER WAREHOUSE {name} SUSPEND;', verbose=verbose)
 
+    def warehouse_size(self, name, size, verbose=False):
+        """Set warehouse size, one of Warehouse().size_options"""
+        self.query(f"ALTER WAREHOUSE {name} SET WAREHOUSE_SIZE = '{size}';", verbose=verbose)
+
     def warehouse_drop(self, name, verbose=False):
         """Drop (delete) warehouse if it exists"""
         self.query(f'DROP WAREHOUSE IF EXISTS {name};', verbose=verbose)
@@ -212,6 +473,7 @@ class Connector:
 
     def database_use(self, db, verbose=False):
         self.query(f'USE DATABASE {db}', verbose=verbose)
+        self.session["DATABASE"] = db
 
     def database_drop(self, name, verbose=False):
         """ Drop a database from the current warehouse"""
@@ -220,6 +482,7 @@ class Connector:
     def schema_use(self, name, verbose=False):
         """Use a specific schema in a database"""
         self.query(f"USE SCHEMA {name}", verbose=verbose)
+        self.session["SCHEMA"] = name
 
     def create_named_file_format(self, named_ff, verbose=False):
         """Create named file format"""
@@ -275,6 +538,246 @@ class Connector:
         return result
 
 
+class AsyncQuery:
+    def __init__(self, sfc, key, query_text, setup=None, cleanup=None, query_tag=None):
+        """A query submitted with Connector.query_async whose status is
+        polled and whose results are fetched only when asked for.  Setup
+        and cleanup statements are submitted the same way, each once the
+        one before it has finished, so no statement blocks the caller.
+
+        Parameters
+        ----------
+        sfc : Connector class instance the query was submitted on
+        key : hashable, caller's identifier for the query, i.e. query number
+        query_text : str, query text submitted
+        setup : list of str, statements run before the query, i.e. the
+            first query of TPC-DS 39 or the view TPC-H query 15 creates
+        cleanup : list of str, statements run once the query has finished,
+            i.e. dropping the view TPC-H query 15 creates
+        query_tag : str, QUERY_TAG set on every statement, if None the
+            session's tag
+        """
+        self.sfc = sfc
+        self.key = key
+        self.query_text = query_text
+        self.setup = [] if setup is None else setup
+        self.cleanup = [] if cleanup is None else cleanup
+        self.query_tag = query_tag
+
+        self.sfqid = None   # Snowflake query id of query_text
+        self.sfqids = []    # Snowflake query ids of all statements submitted
+        self.status = None
+        self.error = None
+
+        self.submitted = None  # driver time the first statement was submitted
+        self.finished = None   # driver time the query was first seen finished
+
+        self._cursor = None
+        self._statements = self.setup + [self.query_text] + self.cleanup
+        self._main = len(self.setup)  # index of query_text in _statements
+        self._step = 0
+        self._step_sfqid = None
+
+    def _submit_step(self):
+        self._step_sfqid = self.sfc.query_async(self._statements[self._step],
+                                                query_tag=self.query_tag)
+        self.sfqids.append(self._step_sfqid)
+        if self._step == self._main:
+            self.sfqid = self._step_sfqid
+
+    def submit(self):
+        self.submitted = pd.Timestamp.now("UTC")
+        self._submit_step()
+        self.status = "RUNNING"
+        return self.sfqid
+
+    def poll(self):
+        """Update status and submit the next statement once the current
+        one has finished, returns True while any statement is running"""
+        if self._step >= len(self._statements):
+            return False
+        status = self.sfc.query_status(self._step_sfqid)
+        if self.sfc.conn.is_still_running(status):
+            return True
+
+        failed = self.sfc.conn.is_an_error(status)
+        if self._step <= self._main and (failed or self._step == self._main):
+            # the query finished, or a setup statement failed so it never runs
+            self.finished = pd.Timestamp.now("UTC")
+            self.status = status.name
+            if failed:
+                self.error = status.name
+            self._step = self._main + 1
+        else:
+            self._step += 1
+
+        if self._step >= len(self._statements):
+            return False
+        self._submit_step()
+        return True
+
+    def wait(self):
+        """Block until every statement has finished"""
+        while self.poll():
+            time.sleep(config.sf_async_poll_initial)
+
+    def result(self):
+        """Cursor over the query results, fetched on first call
+
+        Returns
+        -------
+        Snowflake connector cursor object
+        """
+        if self._cursor is None:
+            self.wait()
+            if self.sfqid is None:
+                raise ValueError("Query {} was not run, setup failed: {}".format(self.key, self.error))
+            self._cursor = self.sfc.query_result(self.sfqid)
+        return self._cursor
+
+    def fetch_pandas_all(self):
+        return self.result().fetch_pandas_all()
+
+
+class ConnectionPool:
+    def __init__(self, account, username, password, size=None, verbose=False):
+        """Pool of logged in Snowflake connections, handed out set to a
+        SessionTemplate and returned for reuse instead of being closed
+
+        Parameters
+        ----------
+        account : str, Snowflake account name
+        username : str, Snowflake user name
+        password : str, Snowflake user password
+        size : int, maximum number of open connections, if None
+            config.sf_pool_size is used
+        verbose : bool, print debug statements
+        """
+        self.account = account
+        self.username = username
+        self.password = password
+
+        self.size = size
+        if self.size is None:
+            self.size = config.sf_pool_size
+
+        self.verbose = verbose
+
+        self._idle = queue.LifoQueue()  # most recently used first
+        self._lock = threading.Lock()
+        self._open = 0
+
+        atexit.register(self.close_all)
+
+    def _new(self, template):
+        sfc = Connector(verbose=self.verbose)
+        sfc.connect(account=self.account,
+                    username=self.username,
+                    password=self.password,
+                    verbose=self.verbose,
+                    template=template)
+        return sfc
+
+    def acquire(self, template=None, timeout=None):
+        """Get a connection set to a session template, reusing an idle
+        connection if there is one
+
+        Parameters
+        ----------
+        template : SessionTemplate class instance, if None a default
+            template is used
+        timeout : float, seconds to wait for a connection if the pool
+            is at its size limit, if None waits indefinitely
+
+        Returns
+        -------
+        Connector class instance
+        """
+        if template is None:
+            template = SessionTemplate()
+
+        while True:
+            try:
+                sfc = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    create = self._open < self.size
+                    if create:
+                        self._open += 1
+                if create:
+                    try:
+                        return self._new(template)
+                    except Exception:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                sfc = self._idle.get(timeout=timeout)
+
+            if sfc.is_closed():
+                with self._lock:
+                    self._open -= 1
+                continue
+
+            sfc.apply_session(template, verbose=self.verbose)
+            return sfc
+
+    def release(self, sfc):
+        """Return a connection to the pool for reuse
+
+        Parameters
+        ----------
+        sfc : Connector class instance, from self.acquire
+        """
+        sfc.verbose = self.verbose
+        sfc.verbose_query = False
+        sfc.verbose_query_n = False
+        sfc.dry_run = False
+        self._idle.put(sfc)
+
+    @contextlib.contextmanager
+    def session(self, template=None):
+        """Context manager for a pooled connection, i.e.
+
+            with pool.session(template) as sfc:
+                sfc.query(query_text)
+        """
+        sfc = self.acquire(template)
+        try:
+            yield sfc
+        finally:
+            self.release(sfc)
+
+    def close_all(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                sfc = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            sfc.close()
+            with self._lock:
+                self._open -= 1
+
+
+_connection_pool = None
+
+
+def connection_pool():
+    """Process wide pool of connections using the credentials in
+    config.py and poor_security.py
+
+    Returns
+    -------
+    ConnectionPool class instance
+    """
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = ConnectionPool(account=config.sf_account,
+                                          username=poor_security.sf_username,
+                                          password=poor_security.sf_password)
+    return _connection_pool
+
+
 class AccountUsage:
     def __init__(self, warehouse):
         """Connect to the snowflake.account_usage context
@@ -295,27 +798,26 @@ class AccountUsage:
         self.verbose = False
         self.verbose_query = False
 
-        self.sfc = Connector(verbose_query=self.verbose_query,
-                             verbose=self.verbose)
+        self.sfc = None
 
     def connect(self):
-        """Initializes a network connection to Snowflake using
+        """Get a pooled connection to Snowflake using
         values saved in config.py and poor_security.py
         """
 
-        self.sfc.connect(username=poor_security.sf_username,
-                         password=poor_security.sf_password,
-                         account=config.sf_account,
-                         verbose=self.verbose)
-        self.sfc.set_timezone("UTC")
-        self.sfc.set_query_tag("read_query_history")
-        self.sfc.cache_off()
-        self.sfc.warehouse_use(self.warehouse, verbose=self.verbose)
-        self.sfc.database_use(self.database, verbose=self.verbose)
-        self.sfc.schema_use("account_usage")
+        template = SessionTemplate(warehouse=self.warehouse,
+                                   database=self.database,
+                                   schema=self.schema,
+                                   role=self.role_str,
+                                   query_tag="read_query_history",
+                                   cache=False)
+        self.sfc = connection_pool().acquire(template)
+        self.sfc.verbose = self.verbose
+        self.sfc.verbose_query = self.verbose_query
 
     def close(self):
-        self.sfc.close()
+        connection_pool().release(self.sfc)
+        self.sfc = None
 
     def cache_set(self, state="off"):
         """Set Snowflake user cache, API defaults to True, here we default to False
@@ -392,26 +894,16 @@ def usage(warehouse, schema, query_text, verbose=False):
     verbose : bool, print debug statements
     """
 
-    sfc = Connector(verbose_query=False,
-                    verbose=verbose)
-
-    sfc.connect(username=poor_security.sf_username,
-                password=poor_security.sf_password,
-                account=config.sf_account,
-                verbose=verbose)
-
-    sfc.set_timezone("UTC")
-    sfc.set_query_tag("read_query_history")
-    sfc.cache_off()
-    sfc.warehouse_use(warehouse, verbose=verbose)
-    sfc.database_use("snowflake", verbose=verbose)
-    sfc.schema_use(schema)
-
-    query_result = sfc.query(query_text)
-    df_result = query_result.fetch_pandas_all()
-    qid = query_result.sfqid
+    template = SessionTemplate(warehouse=warehouse,
+                               database="snowflake",
+                               schema=schema,
+                               query_tag="read_query_history",
+                               cache=False)
 
-    sfc.close()
+    with connection_pool().session(template) as sfc:
+        query_result = sfc.query(query_text, verbose=verbose)
+        df_result = query_result.fetch_pandas_all()
+        qid = query_result.sfqid
 
     return df_result, qid
 
@@ -518,8 +1010,20 @@ class SFTPC:
 
         self.df_gcs_full = None  # all files in bucket, as fyi
         self.df_gcs = None       # just files for this dataset
+        self.df_local = None     # local files for this dataset
         self.upload_data = []
 
+        self.async_queries = []  # AsyncQuery instances from query_seq_async
+
+        self.fetch = True  # if False, time queries without downloading results
+        self.fingerprint = False  # if True, fetch a result fingerprint, see fingerprint.py
+        self.last_rows = None
+        self.last_fingerprint = None
+        self.fingerprint_cache = {}  # query text: fingerprint query text
+        self.last_status = None  # 'ok', 'error', 'timeout' or 'skipped'
+        self.stream_timeout = config.stream_timeout  # seconds, see query_seq
+        self.sample_utilisation = False  # if True, sample warehouse load in query_seq, see utilisation.py
+
         self.verbose = verbose
         self.verbose_query = verbose_query
         self.verbose_query_n = False  # print line numbers in query text
@@ -540,6 +1044,9 @@ class SFTPC:
         self.results_csv_fp = None
         self.fp_log = None
 
+        self._lock = threading.Lock()
+        self._pooled = False  # self.sfc was acquired from connection_pool()
+
     def values(self):
         """Get all class attributes from __dict__ attribute
         except those prefixed with underscore ('_')
@@ -549,7 +1056,7 @@ class SFTPC:
         dict, of (attribute: value) pairs
         """
 
-        skip_attributes = ["sfc"]
+        skip_attributes = ["sfc", "async_queries"]
         d = {}
         for k, v in self.__dict__.items():
             if (k[0] != "_") and (k not in skip_attributes):
@@ -579,20 +1086,51 @@ class SFTPC:
                          verbose=self.verbose)
         self.sfc.verbose_query_n = self.verbose_query_n
 
+    def session_template(self):
+        """Session context of this class: UTC, base query label,
+        cache off, this warehouse and database
+
+        Returns
+        -------
+        SessionTemplate class instance
+        """
+        return SessionTemplate(warehouse=self.warehouse,
+                               database=self.database,
+                               role=self.role_str,
+                               timezone="UTC",
+                               query_tag=self.q_label_base,
+                               cache=False)
+
+    def _acquire(self):
+        """Get a connection set to this class' session context
+        from the process wide connection pool"""
+        sfc = connection_pool().acquire(self.session_template())
+        sfc.verbose = self.verbose
+        sfc.verbose_query = self.verbose_query
+        sfc.verbose_query_n = self.verbose_query_n
+        return sfc
+
     def connect(self):
-        """Initializes a network connection to Snowflake using
-        values saved in config.py and poor_security.py
+        """Get a connection to Snowflake using values saved in
+        config.py and poor_security.py, reusing a pooled session
+        if one is available
         """
 
-        self._connect()
-        self.sfc.set_timezone("UTC")
-        self.set_query_label(self.q_label_base)
-        self.cache_set("off")
-        self.warehouse_use()
-        self.database_use()
+        self.sfc = self._acquire()
+        self._pooled = True
 
     def close(self):
-        self.sfc.close()
+        """Return the connection to the pool, or close it if it was
+        opened directly with self._connect"""
+        if self._pooled:
+            try:
+                connection_pool().release(self.sfc)
+            finally:
+                self.sfc = Connector(verbose_query=self.verbose_query,
+                                     verbose=self.verbose)
+                self._pooled = False
+        else:
+            self.sfc.close()
 
     def cache_set(self, state="off"):
         """Set Snowflake user cache, API defaults to True, here we default to False
@@ -628,6 +1166,9 @@ class SFTPC:
     def warehouse_suspend(self):
         self.sfc.warehouse_suspend(self.warehouse, verbose=self.verbose)
 
+    def warehouse_size(self, size):
+        self.sfc.warehouse_size(self.warehouse, size, verbose=self.verbose)
+
     def database_create(self):
         self.sfc.database_create(self.database, verbose=self.verbose)
 
@@ -728,55 +1269,180 @@ class SFTPC:
                                            (self.df_gcs_full.scale == self.scale_str)].copy()
         self.df_gcs.uri = self.df_gcs.uri.str.replace("gs:", "gcs:")
 
-    def import_data_apply(self, table, gcs_file_path):
-        """ run import """
-        query_text = (f"copy into {table} from '{gcs_file_path}' " +
-                      f"storage_integration={self.storage_integration_name} " +
-                      "file_format=(format_name=csv_file_format);")
+    def _write_log(self, d):
+        """Append one line to the import log, safe across import threads"""
+        with self._lock:
+            with open(self.fp_log, "a") as f:
+                f.write(",".join(d) + "\n")
 
-        d_prefix = [self.test, str(self.scale), self.database]
+    def import_table(self, table, sfc=None):
+        """Load all GCS files for one table with a COPY INTO per batch of
+        files, so Snowflake parallelizes the file ingestion in the warehouse
 
-        t0 = pd.Timestamp.now("UTC")
+        Parameters
+        ----------
+        table : str, name of table to load
+        sfc : Connector class instance to run the COPY on, if None
+            the class connection is used
 
-        d0 = d_prefix + [table, "start", str(t0), "", "", ""]
-        with open(self.fp_log, "a") as f:
-            _d0 = ",".join(d0) + "\n"
-            f.write(_d0)
+        Returns
+        -------
+        list, log record of the table load
+        """
+        if sfc is None:
+            sfc = self.sfc
 
-        query_result = self.sfc.query(query_text, verbose=self.verbose)
-        qid = query_result.sfqid
+        _df = self.df_gcs.loc[self.df_gcs.table == table]
+        uri_base = "gcs://" + config.gcs_data_bucket + "/"
+        files = _df.uri.str.replace(uri_base, "", regex=False).to_list()
+        size_bytes = _df.size_bytes.sum()
+
+        if self.verbose:
+            print("Loading table:", table)
+            print("Files:", len(files))
+            print("============================")
+            print()
+
+        d_prefix = [self.test, str(self.scale), self.database]
+
+        t0 = pd.Timestamp.now("UTC")
+        self._write_log(d_prefix + [table, "start", str(t0), "",
+                                    str(size_bytes), "", "", ""])
+
+        rows_loaded = 0
+        qids = []
+        for i in range(0, len(files), copy_files_max):
+            file_list = ", ".join([f"'{f}'" for f in files[i:i + copy_files_max]])
+            query_text = (f"copy into {table} from '{uri_base}' " +
+                          f"storage_integration={self.storage_integration_name} " +
+                          f"files=({file_list}) " +
+                          f"file_format=(format_name={config.sf_named_file_format});")
+
+            query_result = sfc.query(query_text, verbose=self.verbose)
+            rows_loaded += copy_rows_loaded(query_result)
+            qids.append(query_result.sfqid)
 
         t1 = pd.Timestamp.now("UTC")
+        bytes_loaded = copy_bytes_loaded(sfc, table, t0)
 
-        d1 = d_prefix + [table, "end",
-                         str(t0), str(t1),
-                         "", qid]
-        with open(self.fp_log, "a") as f:
-            _d1 = ",".join(d1) + "\n"
-            f.write(_d1)
+        d1 = d_prefix + [table, "end", str(t0), str(t1),
+                         str(size_bytes), ";".join(qids), str(rows_loaded), str(bytes_loaded)]
+        self._write_log(d1)
 
         if self.verbose:
+            print("Table:", table)
+            print("Rows Loaded:", rows_loaded)
+            print("Bytes Loaded:", bytes_loaded)
             print("Time Elapsed:", t1-t0)
+            print()
 
-    def import_table(self, table):
+        return d1
+
+    def local_inventory(self):
+        """Inventory data files on local disk that match this class' test and scale,
+        either as generated or after renaming for GCS upload"""
+        data_dir = ({"h": config.fp_h_output, "ds": config.fp_ds_output}[self.test] +
+                    config.sep + self.scale_str)
+        prefix = self.test + "_" + self.scale_str + "_"
+        d = []
+        for fp in sorted(tools.pathlist(data_dir)):
+            if not os.path.isfile(fp):
+                continue
+            f_name = os.path.basename(fp)
+            if f_name[:len(prefix)] == prefix:
+                table = gcp_storage.extract_table(f_name)
+            else:
+                table = tools.extract_table_name(f_name)
+            d.append([f_name, fp, os.path.getsize(fp), table])
+        self.df_local = pd.DataFrame(d, columns=["chunk_name", "fp", "size_bytes", "table"])
+
+    def put_table(self, table, sfc=None, threads=None):
+        """Upload all local files for one table to the table's internal stage
+        with PUT, then load them with a single COPY INTO
+
+        Parameters
+        ----------
+        table : str, name of table to load
+        sfc : Connector class instance to run the PUT and COPY on, if None
+            the class connection is used
+        threads : int, number of threads each PUT uses to upload a file,
+            if None config.sf_put_threads is used
+
+        Returns
+        -------
+        list, log record of the table load
+        """
+        if sfc is None:
+            sfc = self.sfc
+        if threads is None:
+            threads = config.sf_put_threads
+
+        _df = self.df_local.loc[self.df_local.table == table]
+        size_bytes = _df.size_bytes.sum()
 
-        _df = self.df_gcs.loc[self.df_gcs.table == table]
         if self.verbose:
             print("Loading table:", table)
+            print("Files:", len(_df))
             print("============================")
             print()
-        # this could be turned into a pooled apply but perhaps 1 warehouse
-        # can't handle it?
-        _df.apply(lambda r: self.import_data_apply(table=r.table,
-                                                   gcs_file_path=r.uri),
-                  axis=1)
+
+        d_prefix = [self.test, str(self.scale), self.database]
+
+        t0 = pd.Timestamp.now("UTC")
+        self._write_log(d_prefix + [table, "start", str(t0), "",
+                                    str(size_bytes), "", "", ""])
+
+        for fp in _df.fp.values:
+            query_text = (f"put 'file://{fp}' @%{table} " +
+                          f"auto_compress=true parallel={threads} overwrite=true;")
+            sfc.query(query_text, verbose=self.verbose)
+
+        query_text = (f"copy into {table} from @%{table} " +
+                      f"file_format=({csv_format_options}) purge=true;")
+        query_result = sfc.query(query_text, verbose=self.verbose)
+        rows_loaded = copy_rows_loaded(query_result)
+        qid = query_result.sfqid
+
+        t1 = pd.Timestamp.now("UTC")
+        bytes_loaded = copy_bytes_loaded(sfc, table, t0)
+
+        d1 = d_prefix + [table, "end", str(t0), str(t1),
+                         str(size_bytes), qid, str(rows_loaded), str(bytes_loaded)]
+        self._write_log(d1)
+
         if self.verbose:
-            print("Done!")
+            print("Table:", table)
+            print("Rows Loaded:", rows_loaded)
+            print("Bytes Loaded:", bytes_loaded)
+            print("Time Elapsed:", t1-t0)
             print()
 
-    def import_data(self):
+        return d1
 
-        self.fp_log = ("sf_upload-" + self.test + "_" +
+    def _import_pooled(self, import_method, table):
+        """Run an import method for a table on a connection borrowed
+        from the connection pool"""
+        sfc = self._acquire()
+        try:
+            return import_method(table=table, sfc=sfc)
+        finally:
+            connection_pool().release(sfc)
+
+    def _import_tables(self, import_method, tables, log_name, n):
+        """Import tables concurrently, each worker on its own connection
+
+        Parameters
+        ----------
+        import_method : method of this class that loads one table
+        tables : list of str, table names to load
+        log_name : str, prefix of the import log file name
+        n : int, number of tables to load concurrently
+
+        Returns
+        -------
+        Pandas DataFrame, per table load record
+        """
+        self.fp_log = (log_name + "-" + self.test + "_" +
                        str(self.scale) + "GB-" +
                        self.database + "-" +
                        str(pd.Timestamp.now("UTC")) + ".csv"
@@ -788,10 +1454,64 @@ class SFTPC:
             _d0 = ",".join(log_column_names) + "\n"
             f.write(_d0)
 
-        for table in self.df_gcs.table.unique():
-            if table in config.ignore_tables:
-                continue
-            self.import_table(table=table)
+        tables = [t for t in tables if t not in config.ignore_tables]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n) as executor:
+            results = list(executor.map(lambda t: self._import_pooled(import_method, t),
+                                        tables))
+
+        self.upload_data = results
+
+        return pd.DataFrame(results, columns=log_column_names)
+
+    def import_data(self, n=None):
+        """Import all tables found in GCS by self.gcs_inventory, with up to
+        n tables loading at the same time each on its own connection
+
+        Parameters
+        ----------
+        n : int, number of tables to load concurrently, if None
+            config.sf_import_pool_size is used
+
+        Returns
+        -------
+        Pandas DataFrame, per table load record
+        """
+        if n is None:
+            n = config.sf_import_pool_size
+
+        return self._import_tables(import_method=self.import_table,
+                                   tables=self.df_gcs.table.unique(),
+                                   log_name="sf_upload", n=n)
+
+    def import_local(self, n=None, threads=None):
+        """Import all tables found on local disk by self.local_inventory
+        with PUT and COPY, without staging data in GCS or needing a storage
+        integration.  Up to n tables upload at the same time.
+
+        Parameters
+        ----------
+        n : int, number of tables to load concurrently, if None
+            config.sf_import_pool_size is used
+        threads : int, number of threads each PUT uses to upload a file,
+            if None config.sf_put_threads is used
+
+        Returns
+        -------
+        Pandas DataFrame, per table load record
+        """
+        if n is None:
+            n = config.sf_import_pool_size
+
+        if self.df_local is None:
+            self.local_inventory()
+
+        def put_method(table, sfc):
+            return self.put_table(table=table, sfc=sfc, threads=threads)
+
+        return self._import_tables(import_method=put_method,
+                                   tables=self.df_local.table.unique(),
+                                   log_name="sf_put", n=n)
 
     @staticmethod
     def parse_query_result(query_result):
@@ -809,7 +1529,143 @@ class SFTPC:
         qid = query_result.sfqid
         return df_result, qid
 
-    def query_n(self, n, qual=None, std_out=False):
+    def generate_query(self, n, qual=None, std_out=False):
+        """Generate query text for query template number n
+
+        Parameters
+        ----------
+        n : int, query number to generate
+        qual : None, or True to use qualifying values (to test 1GB qualification db)
+        std_out : bool, print std_out and std_err output
+
+        Returns
+        -------
+        query_text : str, query text generated for query
+        """
+        tpl_dir = f"{config.fp_query_templates}{config.sep}{'sf'}_{self.test}"
+
+        if self.test == "ds":
+            return ds_setup.qgen_template(n=n,
+                                          templates_dir=tpl_dir,
+                                          dialect="sqlserver_tpc",
+                                          scale=self.scale,
+                                          qual=qual,
+                                          verbose=self.verbose,
+                                          verbose_std_out=std_out)
+        elif self.test == "h":
+            return h_setup.qgen_template(n=n,
+                                         templates_dir=tpl_dir,
+                                         scale=self.scale,
+                                         qual=qual,
+                                         verbose=self.verbose,
+                                         verbose_std_out=std_out)
+        return None
+
+    def query_async(self, n, qual=None, query_text=None, sfc=None, query_tag=None):
+        """Submit the nth query without waiting for it to finish.  Extra
+        statements in TPC-H 15 (view create and drop) and TPC-DS 39
+        (first query) are submitted before and after it, see AsyncQuery.
+
+        Parameters
+        ----------
+        n : int, query number to execute
+        qual : None, or True to use qualifying values (to test 1GB qualification db)
+        query_text : str, precompiled query text, if None it is generated
+        sfc : Connector class instance to submit on, if None self.sfc
+        query_tag : str, QUERY_TAG of all the query's statements, if None
+            the session's tag
+
+        Returns
+        -------
+        AsyncQuery class instance
+        """
+        if query_text is None:
+            query_text = self.generate_query(n, qual=qual)
+        if sfc is None:
+            sfc = self.sfc
+
+        query_list = [q + ";" for q in query_text.split(";") if len(q.strip()) > 0]
+
+        setup, cleanup = [], []
+        if len(query_list) == 3:
+            setup, main, cleanup = [query_list[0]], query_list[1], [query_list[2]]
+        elif len(query_list) == 2:
+            setup, main = [query_list[0]], query_list[1]
+        else:
+            main = query_text
+
+        aq = AsyncQuery(sfc=sfc, key=n, query_text=main,
+                        setup=setup, cleanup=cleanup, query_tag=query_tag)
+        aq.submit()
+        return aq
+
+    def query_seq_async(self, seq, seq_n=None, qual=None, max_in_flight=None,
+                        plan=None, verbose_iter=False):
+        """Run a query sequence with many queries in flight on this
+        class' one connection, polling status with backoff.  Results are
+        not fetched, call AsyncQuery.fetch_pandas_all on the entries of
+        self.async_queries for them.
+
+        driver_t1 is when the poller first saw the query finished, so
+        it is only as precise as the poll interval, use query_history
+        for exact execution times.
+
+        Parameters
+        ----------
+        seq : iterable sequence int, query numbers to execute
+        seq_n : int, stream sequence number for test
+        qual : None, or True to use qualifying values (to test 1GB qualification db)
+        max_in_flight : int, maximum concurrently running queries,
+            if None config.sf_async_max_in_flight
+        plan : plan.Plan, precompiled query text for stream seq_n
+        verbose_iter : bool, print per query status statements
+
+        Returns
+        -------
+        Pandas DataFrame, timing data with the query_seq columns plus status
+        """
+        if plan is not None and seq_n is None:
+            raise ValueError("seq_n is required to run from a plan")
+        if max_in_flight is None:
+            max_in_flight = config.sf_async_max_in_flight
+
+        seq_label = "sNA" if seq_n is None else str(seq_n)
+        pending = list(seq)
+        running = []
+        self.async_queries = []
+        interval = config.sf_async_poll_initial
+
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < max_in_flight:
+                n = pending.pop(0)
+                query_text = None if plan is None else plan.query_text(seq_n, n)
+                aq = self.query_async(n, qual=qual, query_text=query_text)
+                running.append(aq)
+                self.async_queries.append(aq)
+                if verbose_iter:
+                    print("Submitted query {}: {}".format(n, aq.sfqid))
+
+            time.sleep(interval)
+            still_running = [aq for aq in running if aq.poll()]
+            if len(still_running) < len(running):
+                # something finished, poll quickly again
+                interval = config.sf_async_poll_initial
+                if verbose_iter:
+                    for aq in running:
+                        if aq not in still_running:
+                            print("Finished query {}: {}".format(aq.key, aq.status))
+            else:
+                interval = min(interval * 2, config.sf_async_poll_max)
+            running = still_running
+
+        columns = ["db", "test", "scale", "source", "cid", "desc",
+                   "query_n", "seq_n", "driver_t0", "driver_t1", "qid", "status"]
+        d = [["sf", self.test, self.scale, self.database, self.cid, self.desc,
+              aq.key, seq_label, aq.submitted, aq.finished, aq.sfqid, aq.status]
+             for aq in self.async_queries]
+        return pd.DataFrame(d, columns=columns)
+
+    def query_n(self, n, qual=None, std_out=False, query_text=None, timeout=None):
 
         """Query Snowflake with a specific nth query
 
@@ -818,6 +1674,10 @@ class SFTPC:
         n : int, query number to execute
         qual : None, or True to use qualifying values (to test 1GB qualification db)
         std_out : bool, print std_out and std_err output
+        query_text : str, precompiled query text to run instead of
+            generating it, see plan.py
+        timeout : float, seconds to wait for the captured statement before
+            aborting it, see query_captured, if None no limit
 
         Returns
         -------
@@ -826,26 +1686,11 @@ class SFTPC:
         query_result : Snowflake connector cursor object result
         query_text : str, query text generated for query
         """
-        tpl_dir = f"{config.fp_query_templates}{config.sep}{'sf'}_{self.test}"
-
-        if self.test == "ds":
-            query_text = ds_setup.qgen_template(n=n,
-                                                templates_dir=tpl_dir,
-                                                dialect="sqlserver_tpc",
-                                                scale=self.scale,
-                                                qual=qual,
-                                                verbose=self.verbose,
-                                                verbose_std_out=std_out)
-        elif self.test == "h":
-            query_text = h_setup.qgen_template(n=n,
-                                               templates_dir=tpl_dir,
-                                               scale=self.scale,
-                                               qual=qual,
-                                               verbose=self.verbose,
-                                               verbose_std_out=std_out)
-        else:
+        if query_text is None:
+            with tracing.span("generate"):
+                query_text = self.generate_query(n, qual=qual, std_out=std_out)
+        if query_text is None:
             return None
-        t0 = pd.Timestamp.now("UTC")
 
         # Snowflake doesn't process multiple queries in one query statement,
         # additionally another query command will wipe out the previous query_result
@@ -853,6 +1698,9 @@ class SFTPC:
         # Also, TPC-DS is completely single-queries, TPC-H has a view created and
         # deleted in #15, the creation and delete steps don't have data to capture
         query_list = [q + ";" for q in query_text.split(";") if len(q.strip()) > 0]
+        self.fingerprint_prepare(query_text, query_list)
+
+        t0 = pd.Timestamp.now("UTC")
 
         # if query includes a view (make view, query, delete view)
         if len(query_list) == 3:
@@ -860,9 +1708,7 @@ class SFTPC:
             if self.verbose:
                 print("Non-query reply:", query_1_result.fetchall())
 
-            query_2_result = self.sfc.query(query_list[1])
-            df_result = query_2_result.fetch_pandas_all()
-            qid = query_2_result.sfqid
+            df_result, qid = self.query_captured(query_list[1], timeout=timeout)
 
             query_3_result = self.sfc.query(query_list[2])
             if self.verbose:
@@ -875,25 +1721,164 @@ class SFTPC:
             # the first query will not be captured for qc comparison
             _ = self.sfc.query(query_list[0])
             # second query is captured
-            query_2_result = self.sfc.query(query_list[1])
-            query_result = query_2_result
-            df_result = query_result.fetch_pandas_all()
-            qid = query_result.sfqid
+            df_result, qid = self.query_captured(query_list[1], timeout=timeout)
 
         # single query statement
         else:
-            query_result = self.sfc.query(query_text)
             try:
-                df_result = query_result.fetch_pandas_all()
-                qid = query_result.sfqid
+                df_result, qid = self.query_captured(query_text, timeout=timeout)
             except Exception as e:
                 df_result = pd.DataFrame({"query_exception": e})
                 qid = "NaN-exception"
+                self.last_rows = None
+                self.last_fingerprint = None
+                self.last_status = "error"
 
         t1 = pd.Timestamp.now("UTC")
 
         return t0, t1, df_result, query_text, qid
 
+    def query_captured(self, query_text, timeout=None):
+        """Run the statement of a query whose result is captured.  If it
+        runs longer than timeout seconds it is aborted and
+        self.last_status is set to 'timeout', otherwise 'ok'.
+
+        Parameters
+        ----------
+        query_text : str, single query statement
+        timeout : float, seconds before the query is aborted, if None no limit
+
+        Returns
+        -------
+        df_result : Pandas DataFrame, query result, see collect_result
+        qid : str, Snowflake query id
+        """
+        query_text = self.fingerprint_text(query_text)
+        try:
+            # execute returns once the query is done and the first result chunk is read
+            with tracing.span("execute") as span:
+                query_result = self.sfc.query(query_text, timeout=timeout)
+                span.set(job_id=query_result.sfqid)
+                span.event("first_result")
+        except snowflake.connector.errors.ProgrammingError as e:
+            if e.errno != sf_timeout_errno:
+                raise
+            # the connector aborts on timeout, cancel by id in case it did not
+            if e.sfqid is not None:
+                self.sfc.cancel(e.sfqid)
+            if self.verbose:
+                print("Aborted query {} after {} s".format(e.sfqid, timeout))
+            self.last_rows = None
+            self.last_fingerprint = None
+            self.last_status = "timeout"
+            return pd.DataFrame(), e.sfqid
+        with tracing.span("fetch"):
+            df_result = self.collect_result(query_result)
+        self.last_status = "ok"
+        return df_result, query_result.sfqid
+
+    def fingerprint_prepare(self, query_text, query_list):
+        """Wrap the captured statement of a query before it is timed and
+        store it in self.fingerprint_cache, see fingerprint_text.  A view
+        the statement reads is created and dropped around the LIMIT 0
+        run.  A statement that fails to compile is left to fail when timed.
+
+        Parameters
+        ----------
+        query_text : str, query text as generated
+        query_list : list of str, statements of query_text as split in query_n
+        """
+        if not self.fingerprint:
+            return
+        captured = query_list[1] if len(query_list) > 1 else query_text
+        if captured in self.fingerprint_cache:
+            return
+        try:
+            if len(query_list) == 3:
+                self.sfc.query(query_list[0])
+            try:
+                self.fingerprint_text(captured)
+            finally:
+                if len(query_list) == 3:
+                    self.sfc.query(query_list[2])
+        except snowflake.connector.errors.ProgrammingError as e:
+            if self.verbose:
+                print("Fingerprint describe failed:", e)
+
+    def fingerprint_text(self, query_text):
+        """Wrap query text in the result fingerprint aggregate if
+        self.fingerprint is True, see fingerprint.py.  The result columns
+        are read by running the query with LIMIT 0, once per query text.
+
+        Parameters
+        ----------
+        query_text : str, single query statement
+
+        Returns
+        -------
+        str, query text to execute
+        """
+        if not self.fingerprint:
+            return query_text
+        if query_text not in self.fingerprint_cache:
+            with tracing.span("rewrite", kind="fingerprint"):
+                columns = fingerprint.sf_columns(self.sfc, query_text)
+                self.fingerprint_cache[query_text] = fingerprint.sf_wrap(query_text, columns)
+        return self.fingerprint_cache[query_text]
+
+    def collect_result(self, query_result):
+        """Collect the result of a finished query.  If self.fetch is
+        False only the row count is read, no rows are downloaded.
+        If self.fingerprint is True the query is a fingerprint query and
+        its one row result is parsed.  The row count is stored in
+        self.last_rows and the digest in self.last_fingerprint.
+
+        Parameters
+        ----------
+        query_result : Snowflake connector cursor object
+
+        Returns
+        -------
+        df_result : Pandas DataFrame, query result, empty if not fetched
+        """
+        self.last_fingerprint = None
+        if self.fingerprint:
+            df_result = query_result.fetch_pandas_all()
+            self.last_rows, self.last_fingerprint = fingerprint.parse(df_result)
+        elif self.fetch:
+            df_result = query_result.fetch_pandas_all()
+            self.last_rows = len(df_result)
+        else:
+            self.last_rows = query_result.rowcount
+            df_result = pd.DataFrame()
+        return df_result
+
+    def qc_pass(self, df_times, save=True):
+        """Download the results of already run queries by query id, outside
+        of any timed window, i.e. after a timing only run with
+        self.fetch = False.  Query results are kept by Snowflake for
+        24 hours.
+
+        Parameters
+        ----------
+        df_times : Pandas DataFrame, timing data as returned by query_seq
+        save : bool, write each result to self.results_dir
+
+        Returns
+        -------
+        dict, query number -> Pandas DataFrame of results
+        """
+        results = {}
+        for n, qid, status in zip(df_times.query_n, df_times.qid, df_times.status):
+            if status != "ok":
+                continue
+            with tracing.span("qc", system="sf", query_n=n, job_id=qid):
+                df_result = self.sfc.query_result(qid).fetch_pandas_all()
+                results[n] = df_result
+                if save:
+                    self.write_results_csv(df=df_result, query_n=n)
+        return results
+
     def query_history(self, t0, t1):
         """Get the time bound query history for the current Snowflake context, as set
         by connector cursor - project, warehouse and database - using the
@@ -932,7 +1917,8 @@ class SFTPC:
         query_result = self.sfc.query(query_text)
         return query_result
 
-    def query_seq(self, seq, seq_n=None, qual=None, save=False, verbose_iter=False):
+    def query_seq(self, seq, seq_n=None, qual=None, save=False, verbose_iter=False,
+                  plan=None, resume=False):
         """Query Snowflake with TPC-DS or TPC-H query template number n
 
         Parameters
@@ -943,6 +1929,13 @@ class SFTPC:
         qual : None, or True to use qualifying values (to test 1GB qualification db)
         save : bool, save data about this query sequence to disk
         verbose_iter : bool, print per iteration status statements
+        plan : plan.Plan, precompiled query text for stream seq_n, if None
+            query text is generated before each query
+        resume : bool, continue an interrupted stream from the timing rows
+            already written to self.results_dir, skipping queries that
+            finished or timed out, with the same labels and seq_n.
+            self.results_dir must be the interrupted stream's folder,
+            i.e. construct with the same timestamp
 
         Returns
         -------
@@ -960,80 +1953,147 @@ class SFTPC:
             qid : str, database system under test query id for the query run
         """
 
+        if plan is not None and seq_n is None:
+            raise ValueError("seq_n is required to run from a plan")
+
+        if plan is None:
+            with tracing.span("validate", system="sf", test=self.test):
+                failures = dialect.validate(db="sf", test=self.test, verbose=self.verbose)
+            if len(failures) > 0:
+                raise ValueError("Query templates failed validation: {}".format(failures))
+
         self.test_stage = "start"
-        metadata_fp = self.results_dir + config.sep + "metadata_sf_initial.json"
+        metadata_name = "metadata_sf_resume.json" if resume else "metadata_sf_initial.json"
+        metadata_fp = self.results_dir + config.sep + metadata_name
         tools.mkdir_safe(self.results_dir)
         with open(metadata_fp, "w") as f:
             f.write(self.to_json(indent="  "))
 
+        plan_stream = seq_n
+
         if seq_n is None:
             seq_n = "sNA"
         else:
             seq_n = str(seq_n)
         n_time_data = []
         columns = ["db", "test", "scale", "source", "cid", "desc",
-                   "query_n", "seq_n", "driver_t0", "driver_t1", "qid"]
-
-        t0_seq = pd.Timestamp.now("UTC")
-        i_total = len(seq)
-        for i, n in enumerate(seq):
-            qn_label = self.database + "-q" + str(n) + "-" + seq_n + "-" + self.desc
-            qn_label = qn_label.lower()
-
-            if verbose_iter:
-                print("="*40)
-                print("Snowflake Start Query:", n)
-                print("-"*20)
-                print("Stream Completion: {} / {}".format(i+1, i_total))
-                print("Query Label:", qn_label)
-                print("-"*20)
-                print()
-
-            self.set_query_label(qn_label)
-
-            (t0, t1,
-             df_result, query_text, qid) = self.query_n(n=n,
-                                                        qual=qual,
-                                                        std_out=False
-                                                        )
-
-            _d = ["sf", self.test, self.scale, self.database, self.cid, self.desc,
-                  n, seq_n, t0, t1, qid]
-            n_time_data.append(_d)
-
-            # write results as collected by each query
-            if save:
-                self.write_query_text(query_text=query_text, query_n=n)
-
-                if len(df_result) > 0:
-                    self.write_results_csv(df=df_result, query_n=n)
-                else:
-                    # filler for statistics when the query returns no values
-                    df_result.loc[0, :] = ["filler"] * df_result.shape[1]
-                    if verbose_iter:
-                        print("No result rows, FILLER DataFrame created.")
-                    self.write_results_csv(df=df_result, query_n=n)
+                   "query_n", "seq_n", "driver_t0", "driver_t1", "qid", "rows",
+                   "fingerprint", "status"]
+
+        # timing rows are appended to disk after each query, see resume
+        done = set()
+        fp = None
+        if resume:
+            fp, n_time_data, done = tools.read_times_checkpoint("sf", self.results_dir,
+                                                                columns, seq_n)
+        self.results_csv_fp = fp if fp is not None else self.times_csv_fp()
+
+        sampler = None
+        if self.sample_utilisation:
+            import utilisation
+            sampler = utilisation.Sampler(db="sf",
+                                          fp=self.results_dir + config.sep + "utilisation_sf.csv",
+                                          warehouse=self.warehouse, database=self.database,
+                                          verbose=self.verbose)
+            sampler.start()
+
+        try:
+            t0_seq = pd.Timestamp.now("UTC")
+            i_total = len(seq)
+            for i, n in enumerate(seq):
+                if n in done:
+                    continue
+
+                timeout = tools.query_timeout(self.test, self.scale, n)
+                if self.stream_timeout is not None:
+                    remaining = self.stream_timeout - (pd.Timestamp.now("UTC") - t0_seq).total_seconds()
+                    if remaining <= 0:
+                        # stream over its time limit, record the rest as skipped
+                        t_skip = pd.Timestamp.now("UTC")
+                        _d = ["sf", self.test, self.scale, self.database, self.cid,
+                              self.desc, n, seq_n, t_skip, t_skip, None, None, None, "skipped"]
+                        n_time_data.append(_d)
+                        tools.append_csv_row(self.results_csv_fp, _d, columns)
+                        continue
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+
+                qn_label = self.database + "-q" + str(n) + "-" + seq_n + "-" + self.desc
+                qn_label = qn_label.lower()
+
+                if verbose_iter:
+                    print("="*40)
+                    print("Snowflake Start Query:", n)
+                    print("-"*20)
+                    print("Stream Completion: {} / {}".format(i+1, i_total))
+                    print("Query Label:", qn_label)
+                    print("-"*20)
+                    print()
 
-            if verbose_iter:
-                dt = t1 - t0
-                print("Query ID: {}".format(qid))
-                print("Total Time Elapsed: {}".format(dt))
-                print("-"*40)
-                print()
+                self.set_query_label(qn_label)
 
-            if self.verbose:
-                if len(df_result) < 25:
-                    print("Result:")
-                    print("-------")
-                    print(df_result)
-                    print()
+                if plan is not None:
+                    plan_text = plan.query_text(plan_stream, n)
                 else:
-                    print("Head of Result:")
-                    print("---------------")
-                    print(df_result.head())
+                    plan_text = None
+
+                with tracing.span("query", system="sf", test=self.test, scale=self.scale,
+                                  cid=self.cid, stream=seq_n, query_n=n) as query_span:
+                    (t0, t1,
+                     df_result, query_text, qid) = self.query_n(n=n,
+                                                                qual=qual,
+                                                                std_out=False,
+                                                                query_text=plan_text,
+                                                                timeout=timeout
+                                                                )
+
+                    _d = ["sf", self.test, self.scale, self.database, self.cid, self.desc,
+                          n, seq_n, t0, t1, qid, self.last_rows, self.last_fingerprint,
+                          self.last_status]
+                    n_time_data.append(_d)
+                    tools.append_csv_row(self.results_csv_fp, _d, columns)
+                    query_span.set(job_id=qid, status=self.last_status)
+
+                    # write results as collected by each query
+                    if save:
+                        with tracing.span("write"):
+                            self.write_query_text(query_text=query_text, query_n=n)
+
+                            if not self.fetch or self.last_status == "timeout":
+                                # timing only, results are written by self.qc_pass,
+                                # or aborted with no result
+                                pass
+                            elif len(df_result) > 0:
+                                self.write_results_csv(df=df_result, query_n=n)
+                            else:
+                                # filler for statistics when the query returns no values
+                                df_result.loc[0, :] = ["filler"] * df_result.shape[1]
+                                if verbose_iter:
+                                    print("No result rows, FILLER DataFrame created.")
+                                self.write_results_csv(df=df_result, query_n=n)
+
+                if verbose_iter:
+                    dt = t1 - t0
+                    print("Query ID: {}".format(qid))
+                    print("Total Time Elapsed: {}".format(dt))
+                    print("-"*40)
                     print()
 
-        t1_seq = pd.Timestamp.now("UTC")
+                if self.verbose:
+                    if len(df_result) < 25:
+                        print("Result:")
+                        print("-------")
+                        print(df_result)
+                        print()
+                    else:
+                        print("Head of Result:")
+                        print("---------------")
+                        print(df_result.head())
+                        print()
+
+            t1_seq = pd.Timestamp.now("UTC")
+        finally:
+            if sampler is not None:
+                sampler.stop()
 
         #if self.verbose:
         dt_seq = t1_seq - t0_seq
@@ -1083,20 +2143,26 @@ class SFTPC:
         df = tools.to_consistent(df, n=config.float_precision)
         df.to_csv(fp, index=False, float_format="%.3f")
 
+    def times_csv_fp(self):
+        """Absolute path of a new timing data CSV file in self.results_dir"""
+        _, fp = tools.make_name(db="sf", test=self.test, cid=self.cid,
+                                kind="times",
+                                datasource=self.database, desc=self.desc,
+                                ext=".csv",
+                                timestamp=self.timestamp)
+        return self.results_dir + config.sep + fp
+
     def write_times_csv(self, results_list, columns):
-        """Write a list of results from queries to a CSV file
+        """Write a list of results from queries to a CSV file, replacing
+        the rows appended during query_seq
 
         Parameters
         ----------
         results_list : list, data as recorded on the local machine
         columns : list, column names for output CSV
         """
-        _, fp = tools.make_name(db="sf", test=self.test, cid=self.cid,
-                                kind="times",
-                                datasource=self.database, desc=self.desc,
-                                ext=".csv",
-                                timestamp=self.timestamp)
-        self.results_csv_fp = self.results_dir + config.sep + fp
+        if self.results_csv_fp is None:
+            self.results_csv_fp = self.times_csv_fp()
         df = pd.DataFrame(results_list, columns=columns)
         tools.mkdir_safe(self.results_dir)
         df.to_csv(self.results_csv_fp, index=False)
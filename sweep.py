@@ -0,0 +1,467 @@
+"""Compute size sweeps with cost and performance curves
+
+Runs the same compiled query stream once per compute size and writes
+all timing data, per step billing and speedup and cost curves to one
+results folder.  Speedup and cost are relative to the first size in
+the list.
+
+WarehouseSweep : Snowflake warehouse sizes, resizing one warehouse or
+    selecting an existing warehouse per size, suspended between steps
+    so each step starts cold and is billed from its own resume.
+SlotSweep : BigQuery flex slot counts, each bought, reserved and
+    assigned to the project, run once the assignment is serving
+    queries, then released.
+
+Snowflake step cost is estimated from billed time, per second with a
+60 second minimum per resume at 2 ** i credits per hour for the i-th
+size in sf_tpc.Warehouse().size_options.  BigQuery step cost is the
+flex commitment's lifetime, from when it became active to its
+deletion, at config.bq_slot_flex_cost per 100 slots per hour.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import abc
+import json
+import time
+
+import pandas as pd
+from google.cloud import bigquery
+
+import config, tools, plan, bq_tpc
+
+try:
+    import sf_tpc
+except ModuleNotFoundError:
+    print("Failed to Load Snowflake driver.")
+
+
+def sf_credits_per_hour(size):
+    """Credits per hour of a standard warehouse, doubling with each size
+
+    Parameters
+    ----------
+    size : str, one of sf_tpc.Warehouse().size_options
+
+    Returns
+    -------
+    int
+    """
+    return 2 ** sf_tpc.Warehouse().size_options.index(size)
+
+
+def sf_billed_seconds(t_resume, t_suspend):
+    """Seconds billed for one warehouse resume, per second with a minimum"""
+    return max(config.sf_min_billed_seconds, (t_suspend - t_resume).total_seconds())
+
+
+def bq_flex_cost(slots, seconds):
+    """Dollars for a flex slot commitment held for a number of seconds"""
+    return slots / 100 * config.bq_slot_flex_cost * seconds / 3600
+
+
+def scaling_curves(df_times, df_steps, key):
+    """Per query and total speedup and cost against the first step
+
+    Parameters
+    ----------
+    df_times : Pandas DataFrame, timing data of all steps with a key
+        column, query_n, driver_t0, driver_t1 and status
+    df_steps : Pandas DataFrame, one row per step in run order with a key
+        column, stream_s, cost and dollars_per_second
+    key : str, column identifying the step, i.e. 'size' or 'slots'
+
+    Returns
+    -------
+    df_query : Pandas DataFrame, one row per step and query with dt_s,
+        speedup and cost, the running rate times dt_s
+    df_total : Pandas DataFrame, one row per step with stream_s, cost,
+        speedup and cost_ratio
+    """
+    base = df_steps[key].iloc[0]
+
+    df = df_times.loc[df_times.status == "ok", [key, "query_n", "driver_t0", "driver_t1"]].copy()
+    df["dt_s"] = (pd.to_datetime(df.driver_t1, utc=True) -
+                  pd.to_datetime(df.driver_t0, utc=True)).dt.total_seconds()
+    df = df.merge(df_steps[[key, "dollars_per_second"]], on=key)
+    df["cost"] = df.dt_s * df.dollars_per_second
+    df_base = df.loc[df[key] == base, ["query_n", "dt_s"]].rename(columns={"dt_s": "dt_s_base"})
+    df = df.merge(df_base, on="query_n", how="left")
+    df["speedup"] = df.dt_s_base / df.dt_s
+    df_query = df[[key, "query_n", "dt_s", "speedup", "cost"]]
+
+    df_total = df_steps[[key, "stream_s", "cost"]].copy()
+    r = df_total.iloc[0]
+    df_total["speedup"] = r.stream_s / df_total.stream_s
+    df_total["cost_ratio"] = df_total.cost / r.cost
+    return df_query, df_total
+
+
+def stream_seconds(df):
+    """First query start to last query end of a timing DataFrame"""
+    t0 = pd.to_datetime(df.driver_t0, utc=True).min()
+    t1 = pd.to_datetime(df.driver_t1, utc=True).max()
+    return (t1 - t0).total_seconds()
+
+
+class Sweep(abc.ABC):
+    def __init__(self, db, key, points, test, scale, cid, stream=0, plan=None,
+                 desc="", qual=None, save=False, verbose=False, verbose_iter=False):
+        """Common steps of a compute size sweep, see WarehouseSweep and SlotSweep
+
+        Parameters
+        ----------
+        db : str, database system under test, either 'bq' or 'sf'
+        key : str, name of the swept setting, i.e. 'size' or 'slots'
+        points : list, settings in run order, the first is the baseline
+        test : str, TPC test being executed, either "ds" or "h"
+        scale : int, database scale factor (i.e. 1, 100, 1000 etc)
+        cid : str, config identifier, i.e. "01" or "03A"
+        stream : int, query stream to run
+        plan : plan.Plan, precompiled query text including stream, if
+            None the stream is compiled once before the first step
+        desc : str, description of current data collection effort
+        qual : None, or True to use qualifying values
+        save : bool, save query text and results to disk
+        verbose : bool, print debug statements
+        verbose_iter : bool, print per query status statements
+        """
+        self.db = db
+        self.key = key
+        self.points = list(points)
+        self.test = test
+        self.scale = scale
+        self.cid = cid
+        self.stream = stream
+        self.plan = plan
+        self.desc = desc
+        self.qual = qual
+        self.save = save
+        self.verbose = verbose
+        self.verbose_iter = verbose_iter
+
+        self.timestamp = str(pd.Timestamp.now("UTC")).replace(" ", "_")
+        self.data_source = f"{self.test}_{self.scale}GB_{self.cid}"
+        self.results_dir, _ = tools.make_name(db=self.db, test=self.test, cid=self.cid,
+                                              kind="sweep", datasource=self.data_source,
+                                              desc=self.desc, ext="",
+                                              timestamp=self.timestamp)
+
+        self.steps = []
+        self.df_times = None
+        self.df_steps = None
+        self.df_query = None
+        self.df_total = None
+
+    def compile(self):
+        """Compile the stream once so every step runs the same query text"""
+        if self.plan is None:
+            self.plan = plan.compile_plan(db=self.db, test=self.test, scale=self.scale,
+                                          streams=[self.stream], qual=self.qual,
+                                          verbose=self.verbose)
+
+    def step_desc(self, point):
+        point = str(point).lower()
+        return point if self.desc == "" else f"{self.desc}-{point}"
+
+    def step_dir(self, point):
+        return self.results_dir + config.sep + f"{self.key}_{point}"
+
+    def run_stream(self, tpc):
+        """Run the compiled stream on a configured BQTPC or SFTPC instance"""
+        return tpc.query_seq(seq=self.plan.order(self.stream), seq_n=self.stream,
+                             qual=self.qual, save=self.save,
+                             verbose_iter=self.verbose_iter, plan=self.plan)
+
+    @abc.abstractmethod
+    def run_step(self, point):
+        """Run the stream at one setting, returning query_seq timing data"""
+
+    def run(self):
+        """Run every step in order and compute the curves
+
+        Returns
+        -------
+        Pandas DataFrame, total speedup and cost per step, see scaling_curves
+        """
+        self.compile()
+        tools.mkdir_safe(self.results_dir)
+        with open(self.results_dir + config.sep + "metadata_sweep_initial.json", "w") as f:
+            f.write(self.to_json(indent="  "))
+
+        dfs = []
+        for point in self.points:
+            df = self.run_step(point)
+            df[self.key] = point
+            dfs.append(df)
+            if self.verbose:
+                step = self.steps[-1]
+                print("{} {}: {:.1f} s stream, ${:.4f}".format(
+                    self.key, point, step["stream_s"], step["cost"]))
+
+        self.df_times = pd.concat(dfs, ignore_index=True)
+        self.df_steps = pd.DataFrame(self.steps)
+        self.df_query, self.df_total = scaling_curves(self.df_times, self.df_steps, key=self.key)
+        self.write()
+        return self.df_total
+
+    def write(self):
+        """Write timing data, steps and curves to self.results_dir"""
+        fp = self.results_dir + config.sep
+        self.df_times.to_csv(fp + "sweep_times.csv", index=False)
+        self.df_steps.to_csv(fp + "sweep_steps.csv", index=False)
+        self.df_query.to_csv(fp + "sweep_query_curve.csv", index=False)
+        self.df_total.to_csv(fp + "sweep_curve.csv", index=False)
+        with open(fp + "metadata_sweep_final.json", "w") as f:
+            f.write(self.to_json(indent="  "))
+
+    def values(self):
+        """Get all class attributes from __dict__ attribute
+        except those prefixed with underscore ('_')
+
+        Returns
+        -------
+        dict, of (attribute: value) pairs
+        """
+        skip_attributes = ["plan", "df_times", "df_steps", "df_query", "df_total", "bqr"]
+        d = {}
+        for k, v in self.__dict__.items():
+            if (k[0] != "_") and (k not in skip_attributes):
+                d[k] = v
+        return d
+
+    def to_json(self, indent=None):
+        """Return all class attributes as JSON, see values
+
+        Returns
+        -------
+        str, JSON formatted (attribute: value) pairs
+        """
+        return json.dumps(self.values(), default=str, sort_keys=True, indent=indent)
+
+
+class WarehouseSweep(Sweep):
+    def __init__(self, test, scale, cid, sizes, warehouse=None, warehouses=None,
+                 stream=0, plan=None, desc="", qual=None, save=False,
+                 verbose=False, verbose_iter=False):
+        """Run one compiled stream on Snowflake at each warehouse size
+
+        Parameters
+        ----------
+        sizes : list of str, sizes in sf_tpc.Warehouse().size_options in
+            run order, the first is the baseline for speedup and cost
+        warehouse : str, warehouse resized for each step, if None
+            config.sf_warehouse_benchmark
+        warehouses : dict, size -> name of an existing warehouse of that
+            size to select instead of resizing one warehouse
+
+        For the other parameters see Sweep
+        """
+        options = sf_tpc.Warehouse().size_options
+        for size in sizes:
+            assert size in options, "size must be one of {}".format(options)
+        if warehouses is not None:
+            assert set(sizes) <= set(warehouses), "warehouses must name a warehouse for every size"
+
+        super().__init__(db="sf", key="size", points=sizes, test=test, scale=scale,
+                         cid=cid, stream=stream, plan=plan, desc=desc, qual=qual,
+                         save=save, verbose=verbose, verbose_iter=verbose_iter)
+        self.warehouse = config.sf_warehouse_benchmark if warehouse is None else warehouse
+        self.warehouses = warehouses
+
+    def _suspend(self, tpc):
+        try:
+            tpc.warehouse_suspend()
+        except Exception as e:
+            # already suspended
+            if self.verbose:
+                print("Suspend {}: {}".format(tpc.warehouse, e))
+
+    def run_step(self, size):
+        """Suspend, size and resume the warehouse, run the stream and
+        suspend again
+
+        Parameters
+        ----------
+        size : str, warehouse size
+
+        Returns
+        -------
+        Pandas DataFrame, timing data as returned by query_seq
+        """
+        name = self.warehouse if self.warehouses is None else self.warehouses[size]
+        tpc = sf_tpc.SFTPC(test=self.test, scale=self.scale, cid=self.cid,
+                           warehouse=name, desc=self.step_desc(size),
+                           timestamp=self.timestamp, verbose=self.verbose)
+        tpc.results_dir = self.step_dir(size)
+
+        tpc.connect()
+        try:
+            self._suspend(tpc)
+            if self.warehouses is None:
+                tpc.warehouse_size(size)
+            t_resume = pd.Timestamp.now("UTC")
+            tpc.warehouse_resume()
+            try:
+                df = self.run_stream(tpc)
+            finally:
+                self._suspend(tpc)
+                t_suspend = pd.Timestamp.now("UTC")
+        finally:
+            tpc.close()
+
+        billed_s = sf_billed_seconds(t_resume, t_suspend)
+        rate = sf_credits_per_hour(size)
+        self.steps.append({"size": size,
+                           "warehouse": name,
+                           "credits_per_hour": rate,
+                           "resumed": t_resume,
+                           "suspended": t_suspend,
+                           "billed_s": billed_s,
+                           "credits": rate * billed_s / 3600,
+                           "cost": rate * billed_s / 3600 * config.sf_credit_cost,
+                           "dollars_per_second": rate / 3600 * config.sf_credit_cost,
+                           "stream_s": stream_seconds(df),
+                           "queries_ok": int((df.status == "ok").sum())})
+        return df
+
+
+class SlotSweep(Sweep):
+    def __init__(self, test, scale, cid, slots, stream=0, plan=None, desc="",
+                 qual=None, save=False, verbose=False, verbose_iter=False):
+        """Run one compiled stream on BigQuery with each flex slot count
+
+        Each step buys a flex commitment, reserves its slots and assigns
+        the reservation to config.gcp_project, waits until a probe query
+        runs in the reservation, runs the stream and deletes assignment,
+        reservation and commitment again.  Any other reservation already
+        assigned to the project must be removed first.
+
+        Parameters
+        ----------
+        slots : list of int, slot counts in multiples of 100 in run
+            order, the first is the baseline for speedup and cost
+
+        For the other parameters see Sweep
+        """
+        for s in slots:
+            assert s % 100 == 0, "slots must be multiples of 100"
+
+        super().__init__(db="bq", key="slots", points=slots, test=test, scale=scale,
+                         cid=cid, stream=stream, plan=plan, desc=desc, qual=qual,
+                         save=save, verbose=verbose, verbose_iter=verbose_iter)
+
+        import bq_reservations
+        self.bqr = bq_reservations.BQR(fp_service_account_key=config.gcp_cred_file,
+                                       project=config.gcp_project,
+                                       location=config.gcp_location)
+
+    def reservation_name(self, slots):
+        name = f"{self.data_source}-{self.step_desc(slots)}-{slots}-slots"
+        return name.replace("_", "-").lower()[:64]
+
+    def _wait(self, ready, what):
+        """Poll ready() until True or config.bq_slot_wait_timeout"""
+        t0 = time.monotonic()
+        while not ready():
+            if time.monotonic() - t0 > config.bq_slot_wait_timeout:
+                raise TimeoutError("{} not active after {} s".format(
+                    what, config.bq_slot_wait_timeout))
+            time.sleep(config.bq_slot_wait_poll)
+
+    def _probe(self, reservation_id):
+        """True if a query job now runs in the reservation"""
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_query_cache = False
+        job = bq_tpc.get_client().query("SELECT COUNT(*) FROM UNNEST(GENERATE_ARRAY(1, 1000))",
+                                        job_config=job_config)
+        job.result()
+        used = job._properties.get("statistics", {}).get("reservation_id", "")
+        return used.split(".")[-1] == reservation_id.split("/")[-1]
+
+    def acquire(self, slots, step):
+        """Buy, reserve and assign slots and wait until they serve queries,
+        recording each timestamp in step"""
+        res = self.bqr
+        name = self.reservation_name(slots)
+
+        step["commitment_id"] = res.commitment(slots=slots, plan="FLEX")
+        step["commitment_created"] = pd.Timestamp.now("UTC")
+        self._wait(lambda: res.commitment_info(step["commitment_id"]).state.name == "ACTIVE",
+                   "Commitment")
+        step["commitment_active"] = pd.Timestamp.now("UTC")
+        start = res.commitment_info(step["commitment_id"]).commitment_start_time
+        step["commitment_start"] = None if start is None else pd.Timestamp(start).tz_convert("UTC")
+
+        step["reservation_id"] = res.reservation(slots=slots, name=name)
+        step["reservation_created"] = pd.Timestamp.now("UTC")
+
+        step["assignment_id"] = res.assignment(reservation_id=step["reservation_id"],
+                                               project=config.gcp_project)
+        step["assignment_created"] = pd.Timestamp.now("UTC")
+
+        def _active():
+            # the assignment may not be listed yet
+            info = res.assignment_info(step["assignment_id"])
+            return info is not None and info.state.name == "ACTIVE"
+
+        self._wait(_active, "Assignment")
+        step["assignment_active"] = pd.Timestamp.now("UTC")
+
+        # an active assignment can take minutes to reach the query scheduler
+        self._wait(lambda: self._probe(step["reservation_id"]), "Reservation")
+        step["reservation_serving"] = pd.Timestamp.now("UTC")
+
+    def release(self, step):
+        """Delete whatever acquire created, newest first, recording each
+        timestamp in step.  A flex commitment can not be deleted in its
+        first config.bq_flex_min_seconds."""
+        res = self.bqr
+        if step.get("assignment_id") is not None:
+            res.delete_assignment(step["assignment_id"])
+            step["assignment_deleted"] = pd.Timestamp.now("UTC")
+        if step.get("reservation_id") is not None:
+            res.delete_reservation(step["reservation_id"])
+            step["reservation_deleted"] = pd.Timestamp.now("UTC")
+        if step.get("commitment_id") is not None:
+            held = (pd.Timestamp.now("UTC") - step["commitment_created"]).total_seconds()
+            if held < config.bq_flex_min_seconds:
+                time.sleep(config.bq_flex_min_seconds - held)
+            res.delete_commitment(step["commitment_id"])
+            step["commitment_deleted"] = pd.Timestamp.now("UTC")
+
+    def run_step(self, slots):
+        """Acquire slots, run the stream and release the slots
+
+        Parameters
+        ----------
+        slots : int, flex slots to buy
+
+        Returns
+        -------
+        Pandas DataFrame, timing data as returned by query_seq
+        """
+        step = {"slots": slots}
+        try:
+            self.acquire(slots, step)
+            tpc = bq_tpc.BQTPC(test=self.test, scale=self.scale, cid=self.cid,
+                               desc=self.step_desc(slots), timestamp=self.timestamp,
+                               verbose=self.verbose)
+            tpc.results_dir = self.step_dir(slots)
+            df = self.run_stream(tpc)
+        finally:
+            self.release(step)
+
+        start = step["commitment_start"]
+        if start is None:
+            start = step["commitment_created"]
+        billed_s = max(config.bq_flex_min_seconds,
+                       (step["commitment_deleted"] - start).total_seconds())
+        step["billed_s"] = billed_s
+        step["cost"] = bq_flex_cost(slots, billed_s)
+        step["dollars_per_second"] = bq_flex_cost(slots, 1)
+        step["stream_s"] = stream_seconds(df)
+        step["queries_ok"] = int((df.status == "ok").sum())
+        self.steps.append(step)
+        return df
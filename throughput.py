@@ -0,0 +1,264 @@
+"""TPC throughput test runner
+
+Runs S query streams at the same time, one BQTPC or SFTPC instance
+and session per stream, then computes the throughput metrics of the
+TPC-H and TPC-DS specifications.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import json
+import concurrent.futures
+
+import pandas as pd
+
+import config, tools, bq_tpc, estimate
+
+try:
+    import sf_tpc
+except ModuleNotFoundError:
+    print("Failed to Load Snowflake driver.")
+
+
+def throughput_metrics(test, scale, n_streams, n_queries, ts):
+    """Throughput test metrics
+
+    TPC-H Throughput@Size = (S * 22 * 3600) / Ts * SF, see TPC-H
+    specification 5.4.2.  TPC-DS reports the throughput run time T_TT
+    in hours, which with a second throughput run, the power run and
+    the load enters QphDS, see TPC-DS specification 7.6.
+
+    Parameters
+    ----------
+    test : str, TPC test, either 'ds' or 'h'
+    scale : int, database scale factor (i.e. 1, 100, 1000 etc)
+    n_streams : int, number of concurrent query streams, S
+    n_queries : int, total queries executed over all streams
+    ts : float, elapsed seconds from first query start to last query end
+
+    Returns
+    -------
+    dict of metrics
+    """
+    d = {"test": test,
+         "scale": scale,
+         "streams": n_streams,
+         "queries": n_queries,
+         "ts_seconds": ts,
+         "queries_per_hour": n_queries * 3600 / ts}
+    if test == "h":
+        d["throughput_at_size"] = n_streams * 22 * 3600 / ts * scale
+    elif test == "ds":
+        d["t_tt_hours"] = ts / 3600
+    return d
+
+
+class ThroughputTest:
+    def __init__(self, db, test, scale, cid, streams, desc="",
+                 warehouse=None, qual=None, save=False, plan=None,
+                 fetch=True, verbose=False, verbose_iter=False):
+        """Concurrent multi stream TPC throughput test
+
+        Parameters
+        ----------
+        db : str, database system under test, either 'bq' or 'sf'
+        test : str, TPC test being executed, either "ds" or "h"
+        scale : int, database scale factor (i.e. 1, 100, 1000 etc)
+        cid : str, config identifier, i.e. "01" or "03A"
+        streams : int or list of int, if int the number of streams S and
+            streams 1 through S are run, otherwise the stream numbers
+        desc : str, description of current data collection effort
+        warehouse : str, Snowflake warehouse to run the queries on, if None
+            config.sf_warehouse_benchmark
+        qual : None, or True to use qualifying values
+        save : bool, save query text and results to disk
+        plan : plan.Plan, precompiled query text including these streams
+        fetch : bool, if False queries are timed without downloading results
+        verbose : bool, print debug statements
+        verbose_iter : bool, print per query status statements
+        """
+        self.db = db
+        self.test = test
+        self.scale = scale
+        self.cid = cid
+        if isinstance(streams, int):
+            streams = list(range(1, streams+1))
+        self.streams = list(streams)
+        self.desc = desc
+
+        self.warehouse = warehouse
+        if self.warehouse is None:
+            self.warehouse = config.sf_warehouse_benchmark
+
+        self.qual = qual
+        self.save = save
+        self.plan = plan
+        self.fetch = fetch
+        self.budget = config.bq_cost_budget  # dollars, BigQuery dry run all streams first if not None
+
+        self.verbose = verbose
+        self.verbose_iter = verbose_iter
+
+        self.timestamp = str(pd.Timestamp.now("UTC")).replace(" ", "_")
+        self.data_source = f"{self.test}_{self.scale}GB_{self.cid}"
+        self.results_dir, _ = tools.make_name(db=self.db, test=self.test, cid=self.cid,
+                                              kind="throughput",
+                                              datasource=self.data_source,
+                                              desc=self.desc, ext="",
+                                              timestamp=self.timestamp)
+
+        self.t0 = None
+        self.t1 = None
+        self.df_times = None
+        self.metrics = None
+
+    def stream_instance(self, stream):
+        """BQTPC or SFTPC instance writing to this stream's subfolder"""
+        if self.db == "bq":
+            tpc = bq_tpc.BQTPC(test=self.test, scale=self.scale, cid=self.cid,
+                               desc=self.desc, timestamp=self.timestamp,
+                               verbose=self.verbose)
+        else:
+            tpc = sf_tpc.SFTPC(test=self.test, scale=self.scale, cid=self.cid,
+                               warehouse=self.warehouse, desc=self.desc,
+                               timestamp=self.timestamp, verbose=self.verbose)
+        tpc.results_dir = self.results_dir + config.sep + "stream_{}".format(stream)
+        tpc.fetch = self.fetch
+        if self.db == "bq":
+            # the budget is checked once for all streams in self.run
+            tpc.budget = None
+        return tpc
+
+    def run_stream(self, stream):
+        """Run one query stream in its own session
+
+        Parameters
+        ----------
+        stream : int, query stream number
+
+        Returns
+        -------
+        Pandas DataFrame, timing data as returned by query_seq
+        """
+        if self.plan is not None:
+            seq = self.plan.order(stream)
+        else:
+            seq = tools.tpc_stream(self.test, stream)
+
+        tpc = self.stream_instance(stream)
+        if self.db == "sf":
+            tpc.connect()
+        try:
+            df = tpc.query_seq(seq=seq, seq_n=stream, qual=self.qual,
+                               save=self.save, verbose_iter=self.verbose_iter,
+                               plan=self.plan)
+        finally:
+            if self.db == "sf":
+                tpc.close()
+        return df
+
+    def check_budget(self):
+        """Dry run all streams on BigQuery and raise ValueError if the
+        predicted on-demand cost of the run is over self.budget or a
+        dry run failed, see estimate.check_budget
+
+        Returns
+        -------
+        Pandas DataFrame, dry run estimate per query
+        """
+        if self.plan is not None:
+            queries = estimate.plan_queries(self.plan, self.streams)
+        else:
+            tpc = self.stream_instance(self.streams[0])
+            queries = []
+            for s in self.streams:
+                queries += estimate.tpc_queries(tpc, tools.tpc_stream(self.test, s), s,
+                                                qual=self.qual)
+        df_estimate = estimate.bq_estimate(queries, dataset=self.data_source,
+                                           verbose=self.verbose)
+        if self.verbose:
+            _, total = estimate.bq_summary(df_estimate)
+            print("Estimated on-demand cost: ${:.2f} ({:.3f} TB)".format(total["cost"], total["TB"]))
+        estimate.check_budget(df_estimate, self.budget)
+        return df_estimate
+
+    def run(self):
+        """Run all streams concurrently and compute throughput metrics
+
+        Returns
+        -------
+        dict of metrics, see throughput_metrics
+        """
+        n = len(self.streams)
+
+        if self.db == "sf":
+            # one session per stream, so the pool must not queue streams
+            pool = sf_tpc.connection_pool()
+            pool.size = max(pool.size, n)
+
+        if self.db == "bq" and self.budget is not None:
+            self.check_budget()
+
+        tools.mkdir_safe(self.results_dir)
+        with open(self.results_dir + config.sep + "metadata_throughput_initial.json", "w") as f:
+            f.write(self.to_json(indent="  "))
+
+        self.t0 = pd.Timestamp.now("UTC")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n) as executor:
+            futures = {s: executor.submit(self.run_stream, s) for s in self.streams}
+        self.t1 = pd.Timestamp.now("UTC")
+
+        dfs = [futures[s].result() for s in self.streams]
+        self.df_times = pd.concat(dfs, ignore_index=True)
+
+        # Ts is measured from the first query start to the last query end
+        ts = (self.df_times.driver_t1.max() - self.df_times.driver_t0.min()).total_seconds()
+        self.metrics = throughput_metrics(test=self.test, scale=self.scale,
+                                          n_streams=n, n_queries=len(self.df_times),
+                                          ts=ts)
+
+        _, fp = tools.make_name(db=self.db, test=self.test, cid=self.cid,
+                                kind="times", datasource=self.data_source,
+                                desc=self.desc, ext=".csv", timestamp=self.timestamp)
+        self.df_times.to_csv(self.results_dir + config.sep + fp, index=False)
+
+        with open(self.results_dir + config.sep + "throughput_metrics.json", "w") as f:
+            json.dump(self.metrics, f, indent="  ")
+
+        with open(self.results_dir + config.sep + "metadata_throughput_final.json", "w") as f:
+            f.write(self.to_json(indent="  "))
+
+        if self.verbose:
+            print("Throughput Test Done!")
+            print("=====================")
+            for k, v in self.metrics.items():
+                print("{}: {}".format(k, v))
+            print()
+
+        return self.metrics
+
+    def values(self):
+        """Get all class attributes from __dict__ attribute
+        except those prefixed with underscore ('_')
+
+        Returns
+        -------
+        dict, of (attribute: value) pairs
+        """
+        skip_attributes = ["df_times", "plan"]
+        d = {}
+        for k, v in self.__dict__.items():
+            if (k[0] != "_") and (k not in skip_attributes):
+                d[k] = v
+        return d
+
+    def to_json(self, indent=None):
+        """Return all class attributes as JSON, see values
+
+        Returns
+        -------
+        str, JSON formatted (attribute: value) pairs
+        """
+        return json.dumps(self.values(), default=str,
+                          sort_keys=True, indent=indent)
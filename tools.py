@@ -7,6 +7,7 @@ Copyright (c) 2020 SADA Systems, Inc.
 import os
 import re
 import math
+import functools
 import zipfile
 import shutil
 import glob
@@ -256,12 +257,15 @@ def regex_replace(text, replace_mapper):
     """
     
     for k, v in replace_mapper.items():
-        regex = re.compile(k)
+        regex = _compile(k)
         text = regex.sub(v, text)
     
     return text
 
 
+_compile = functools.lru_cache(maxsize=None)(re.compile)
+
+
 def regex_file(filepath_in, filepath_out, replace_mapper):
     """Apply regex_replace to a file.  If filepath_in == filepath_out,
     replaces the file's contents.
@@ -366,13 +370,104 @@ def tpc_stream(test, n):
     """
     
     assert test in ["ds", "h"], "Must be valid TPC test name"
-    
+
+    return list(_tpc_stream_orders(test)[n])
+
+
+@functools.lru_cache(maxsize=None)
+def _tpc_stream_orders(test):
+    """Parse a TPC stream order file once per process
+
+    Returns
+    -------
+    dict, stream number -> tuple of int query numbers
+    """
     if test == "h":
         _df = parse_h_stream_seq()
     if test == "ds":
         _df = parse_ds_seq_stream()
-    query_sequence = [int(str(v)) for v in _df.loc[n].values]
-    return list(query_sequence)
+    return {k: tuple(int(str(v)) for v in _df.loc[k].values) for k in _df.index}
+
+
+def query_timeout(test, scale, n):
+    """Time limit for one query, see config.query_timeouts
+
+    Parameters
+    ----------
+    test : str, TPC test name, either 'ds' or 'h'
+    scale : int, database scale factor
+    n : int, query number
+
+    Returns
+    -------
+    float seconds, or None for no limit
+    """
+    for key in [(test, scale, int(n)), (test, None, int(n))]:
+        if key in config.query_timeouts:
+            return config.query_timeouts[key]
+    return config.query_timeout
+
+
+def append_csv_row(fp, row, columns):
+    """Append one row to a CSV file and force it to disk, writing the
+    header first if the file does not exist
+
+    Parameters
+    ----------
+    fp : str, absolute path to CSV file
+    row : list, values in column order
+    columns : list of str, column names
+    """
+    new_file = not os.path.exists(fp)
+    df = pd.DataFrame([row], columns=columns)
+    with open(fp, "a") as f:
+        df.to_csv(f, header=new_file, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_times_checkpoint(db, results_dir, columns, seq_n):
+    """Timing rows already written by an interrupted query stream, see
+    append_csv_row.  Queries that finished or timed out are kept, rows of
+    queries that failed or were skipped are dropped so they run again,
+    and the file is rewritten with only the kept rows.
+
+    Parameters
+    ----------
+    db : str, system of the interrupted stream, either 'bq' or 'sf'
+    results_dir : str, results folder of the interrupted stream
+    columns : list of str, timing data column names
+    seq_n : str, stream sequence number, must match the checkpoint
+
+    Returns
+    -------
+    fp : str, absolute path to the timing CSV, None if there is none
+    rows : list of lists, kept timing rows in column order
+    done : set of int, query numbers not to run again
+    """
+    # compare runs write both systems' timing files to one folder
+    fps = sorted(glob.glob(results_dir + config.sep + f"benchmark_times_{db}_*.csv"))
+    if len(fps) == 0:
+        return None, [], set()
+    fp = fps[-1]
+
+    df = pd.read_csv(fp)
+    if len(df) > 0:
+        seq_ns = set(df.seq_n.astype(str))
+        assert seq_ns == {seq_n}, "Checkpoint is for stream {}, not {}".format(seq_ns, seq_n)
+    if "status" in df.columns:
+        df = df.loc[df.status.isin(["ok", "timeout"])]
+    df = df.reindex(columns=columns)
+    df["driver_t0"] = pd.to_datetime(df.driver_t0, utc=True)
+    df["driver_t1"] = pd.to_datetime(df.driver_t1, utc=True)
+
+    with open(fp, "w") as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+    df = df.astype(object).where(df.notnull(), None)
+    return fp, df.values.tolist(), set(int(n) for n in df.query_n)
 
 
 def make_name(db, test, cid, kind, datasource, desc, ext, timestamp=None):
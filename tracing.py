@@ -0,0 +1,286 @@
+"""Per-query lifecycle tracing
+
+Records nested spans, i.e. query > generate, submit, execute, fetch,
+write, with attributes such as test, scale, cid, stream, query_n,
+system and job id.  Span times come from the monotonic high resolution
+clock time.perf_counter_ns, anchored to wall clock time once per tracer
+so spans line up with warehouse timestamps.  Spans recorded from
+warehouse timestamps (queue and run time on the server) are marked with
+the attribute clock='server'.
+
+Spans are written as JSON lines with OpenTelemetry field names and can
+also be sent to an OTLP/HTTP collector as JSON.  Tracing is off unless
+a Tracer is set with set_tracer, and then costs one function call per
+span.
+
+    tracing.set_tracer(tracing.Tracer(fp="/tmp/spans.jsonl"))
+    with tracing.span("query", query_n=5):
+        ...
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+import config
+
+
+class Span:
+    def __init__(self, tracer, name, trace_id, parent_id, attributes):
+        """One timed operation, see Tracer.span"""
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.events = []
+        self.status = "OK"
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+
+    def set(self, **attributes):
+        """Add attributes, i.e. a job id known only after submit"""
+        self.attributes.update(attributes)
+
+    def event(self, name, **attributes):
+        """Record a point in time inside the span, i.e. first result row"""
+        self.events.append((name, time.perf_counter_ns(), attributes))
+
+    def to_dict(self):
+        """Span with OpenTelemetry field names, times in Unix nanoseconds"""
+        t = self.tracer
+        return {"traceId": self.trace_id,
+                "spanId": self.span_id,
+                "parentSpanId": self.parent_id,
+                "name": self.name,
+                "startTimeUnixNano": t.unix_ns(self.start_ns),
+                "endTimeUnixNano": t.unix_ns(self.end_ns),
+                "durationNano": self.end_ns - self.start_ns,
+                "attributes": self.attributes,
+                "events": [{"name": n, "timeUnixNano": t.unix_ns(ns), "attributes": a}
+                           for n, ns, a in self.events],
+                "status": self.status}
+
+
+class Tracer:
+    def __init__(self, fp=None, otlp_endpoint=None, attributes=None, service_name="tpc"):
+        """Span recorder and exporter
+
+        Parameters
+        ----------
+        fp : str, JSON lines file to append finished spans to, if None
+            config.fp_trace
+        otlp_endpoint : str, OTLP/HTTP collector base URL, i.e.
+            'http://localhost:4318', spans are posted on flush, if None
+            config.otlp_endpoint, which may also be None
+        attributes : dict, attributes added to every span
+        service_name : str, OpenTelemetry service.name resource attribute
+        """
+        self.fp = config.fp_trace if fp is None else fp
+        self.otlp_endpoint = config.otlp_endpoint if otlp_endpoint is None else otlp_endpoint
+        self.attributes = {} if attributes is None else dict(attributes)
+        self.service_name = service_name
+
+        # wall clock anchor for the monotonic clock
+        self._anchor_unix_ns = time.time_ns()
+        self._anchor_perf_ns = time.perf_counter_ns()
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def unix_ns(self, perf_ns):
+        return self._anchor_unix_ns + (perf_ns - self._anchor_perf_ns)
+
+    def perf_ns(self, timestamp):
+        """Monotonic clock value of a datetime, for server side spans"""
+        unix_ns = int(timestamp.timestamp() * 1e9)
+        return self._anchor_perf_ns + (unix_ns - self._anchor_unix_ns)
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """Innermost open span of this thread, or None"""
+        stack = self._stack()
+        return stack[-1] if len(stack) > 0 else None
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Context manager timing a span nested in this thread's open span"""
+        parent = self.current()
+        trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        attrs = dict(self.attributes)
+        if parent is not None:
+            # children inherit the query identifiers of their parent
+            attrs.update(parent.attributes)
+        attrs.update(attributes)
+        s = Span(self, name, trace_id, None if parent is None else parent.span_id, attrs)
+        stack = self._stack()
+        stack.append(s)
+        try:
+            yield s
+        except BaseException as e:
+            s.status = "ERROR"
+            s.attributes["exception"] = e.__class__.__name__
+            raise
+        finally:
+            s.end_ns = time.perf_counter_ns()
+            stack.pop()
+            self._finish(s)
+
+    def record(self, name, t0, t1, **attributes):
+        """Record a finished span from datetimes, i.e. warehouse reported
+        queue and run times, as a child of this thread's open span"""
+        if t0 is None or t1 is None:
+            return
+        parent = self.current()
+        trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        attrs = dict(self.attributes)
+        if parent is not None:
+            attrs.update(parent.attributes)
+        attrs.update(attributes)
+        attrs["clock"] = "server"
+        s = Span(self, name, trace_id, None if parent is None else parent.span_id, attrs)
+        s.start_ns = self.perf_ns(t0)
+        s.end_ns = self.perf_ns(t1)
+        self._finish(s)
+
+    def _finish(self, s):
+        with self._lock:
+            self._pending.append(s.to_dict())
+            if s.parent_id is None:
+                self.flush_locked()
+
+    def flush(self):
+        """Write pending spans, called automatically when a root span ends"""
+        with self._lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if len(self._pending) == 0:
+            return
+        spans, self._pending = self._pending, []
+        with open(self.fp, "a") as f:
+            for d in spans:
+                f.write(json.dumps(d, default=str) + "\n")
+        if self.otlp_endpoint is not None:
+            try:
+                self.export_otlp(spans)
+            except Exception as e:
+                print("OTLP export failed:", e)
+
+    def export_otlp(self, spans):
+        """Post spans to an OTLP/HTTP collector in the OTLP JSON encoding"""
+        import requests
+
+        def _attrs(d):
+            out = []
+            for k, v in d.items():
+                if isinstance(v, bool):
+                    value = {"boolValue": v}
+                elif isinstance(v, int):
+                    value = {"intValue": str(v)}
+                elif isinstance(v, float):
+                    value = {"doubleValue": v}
+                else:
+                    value = {"stringValue": str(v)}
+                out.append({"key": k, "value": value})
+            return out
+
+        otlp_spans = []
+        for d in spans:
+            otlp_spans.append({"traceId": d["traceId"],
+                               "spanId": d["spanId"],
+                               "parentSpanId": d["parentSpanId"] or "",
+                               "name": d["name"],
+                               "kind": 1,
+                               "startTimeUnixNano": str(d["startTimeUnixNano"]),
+                               "endTimeUnixNano": str(d["endTimeUnixNano"]),
+                               "attributes": _attrs(d["attributes"]),
+                               "events": [{"name": e["name"],
+                                           "timeUnixNano": str(e["timeUnixNano"]),
+                                           "attributes": _attrs(e["attributes"])}
+                                          for e in d["events"]],
+                               "status": {"code": 1 if d["status"] == "OK" else 2}})
+        body = {"resourceSpans": [{
+            "resource": {"attributes": _attrs({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "tpc"}, "spans": otlp_spans}]}]}
+        r = requests.post(self.otlp_endpoint.rstrip("/") + "/v1/traces", json=body, timeout=10)
+        r.raise_for_status()
+
+
+class _NullSpan:
+    def set(self, **attributes):
+        pass
+
+    def event(self, name, **attributes):
+        pass
+
+
+_null_span = _NullSpan()
+
+_tracer = None
+
+
+def set_tracer(tracer):
+    """Set the process wide tracer, None turns tracing off"""
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextlib.contextmanager
+def _null_context():
+    yield _null_span
+
+
+def span(name, **attributes):
+    """Span context manager of the process wide tracer, a no-op if
+    tracing is off
+
+    Parameters
+    ----------
+    name : str, span name
+    attributes : span attributes, inherited by nested spans
+    """
+    if _tracer is None:
+        return _null_context()
+    return _tracer.span(name, **attributes)
+
+
+def record(name, t0, t1, **attributes):
+    """Record a span from datetimes with the process wide tracer"""
+    if _tracer is not None:
+        _tracer.record(name, t0, t1, **attributes)
+
+
+def read(fp=None):
+    """Spans from a JSON lines file as a Pandas DataFrame, with start
+    and end times and duration in seconds
+
+    Parameters
+    ----------
+    fp : str, JSON lines file, if None config.fp_trace
+    """
+    import pandas as pd
+
+    fp = config.fp_trace if fp is None else fp
+    with open(fp, "r") as f:
+        spans = [json.loads(line) for line in f if len(line.strip()) > 0]
+    df = pd.json_normalize(spans)
+    df["start"] = pd.to_datetime(df.startTimeUnixNano, unit="ns", utc=True)
+    df["end"] = pd.to_datetime(df.endTimeUnixNano, unit="ns", utc=True)
+    df["duration_s"] = df.durationNano / 1e9
+    return df
@@ -0,0 +1,226 @@
+"""Server side utilisation sampling during benchmark runs
+
+A background thread pulls warehouse load while a query stream runs:
+
+    BigQuery : INFORMATION_SCHEMA.JOBS_TIMELINE_BY_PROJECT, slots used,
+        running and pending jobs per second
+    Snowflake : INFORMATION_SCHEMA.WAREHOUSE_LOAD_HISTORY, average
+        running, queued and blocked load per interval
+
+Each pull rewrites one CSV beside the stream's benchmark_times file with
+UTC period timestamps, the same clock as driver_t0 and driver_t1, so a
+slow query can be placed against slot starvation or queueing, see
+analysis.MultiResult.utilisation_overlay.
+
+Both views lag the warehouse by seconds to minutes, so recent periods
+are pulled again until they are older than the settle time, and a final
+pull is made when sampling stops.  Snowflake samples run on
+config.sf_warehouse_util so they do not add load to the warehouse
+being measured.
+
+MIT License, see LICENSE file for complete text.
+Copyright (c) 2020 SADA Systems, Inc.
+"""
+
+import threading
+
+import pandas as pd
+from google.cloud import bigquery
+
+import config, bq_tpc
+
+try:
+    import sf_tpc
+except ModuleNotFoundError:
+    print("Failed to Load Snowflake driver.")
+
+
+bq_columns = ["period_start", "slots", "running_jobs", "pending_jobs"]
+sf_columns = ["period_start", "period_end", "avg_running", "avg_queued_load",
+              "avg_queued_provisioning", "avg_blocked"]
+
+# default metric plotted per system
+overlay_metric = {"bq": "slots", "sf": "avg_running"}
+
+
+def bq_timeline(t0, t1, project=None):
+    """Slot usage per second of all query jobs in the project
+
+    Parameters
+    ----------
+    t0 : pd.Timestamp, UTC start of periods to return
+    t1 : pd.Timestamp, UTC end of periods to return
+    project : str, GCP project, if None config.gcp_project
+
+    Returns
+    -------
+    Pandas DataFrame, with bq_columns
+    """
+    if project is None:
+        project = config.gcp_project.lower()
+    # jobs still running at t0 may have been created well before it,
+    # the view is partitioned on job_creation_time
+    c0 = (t0 - pd.Timedelta(config.util_bq_job_lookback)).strftime("%Y-%m-%d %H:%M:%S")
+    t0 = t0.strftime("%Y-%m-%d %H:%M:%S")
+    t1 = t1.strftime("%Y-%m-%d %H:%M:%S")
+    region = "region-" + config.gcp_location.lower()
+
+    query_text = ("select period_start, " +
+                  "sum(period_slot_ms) / 1000 as slots, " +
+                  "countif(state = 'RUNNING') as running_jobs, " +
+                  "countif(state = 'PENDING') as pending_jobs " +
+                  f"from `{project}`.`{region}`.INFORMATION_SCHEMA.JOBS_TIMELINE_BY_PROJECT " +
+                  "where job_type = 'QUERY' " +
+                  f"and job_creation_time >= '{c0}' " +
+                  f"and period_start between '{t0}' and '{t1}' " +
+                  "group by period_start order by period_start")
+
+    job_config = bigquery.QueryJobConfig()
+    job_config.use_query_cache = False
+    job_config.labels = {"label": "utilisation-sampler"}
+    df = bq_tpc.get_client().query(query_text, job_config=job_config).result().to_dataframe()
+    return df[bq_columns]
+
+
+def sf_load_history(sfc, warehouse, t0, t1):
+    """Running and queued load of a Snowflake warehouse
+
+    Parameters
+    ----------
+    sfc : sf_tpc.Connector class instance, with a database in use
+    warehouse : str, warehouse to report on
+    t0 : pd.Timestamp, UTC start of intervals to return
+    t1 : pd.Timestamp, UTC end of intervals to return
+
+    Returns
+    -------
+    Pandas DataFrame, with sf_columns
+    """
+    t0 = t0.strftime("%Y-%m-%d %H:%M:%S")
+    t1 = t1.strftime("%Y-%m-%d %H:%M:%S")
+    query_text = ("select start_time as period_start, end_time as period_end, " +
+                  "avg_running, avg_queued_load, avg_queued_provisioning, avg_blocked " +
+                  "from table(information_schema.warehouse_load_history(" +
+                  f"date_range_start=>to_timestamp_ltz('{t0}'), " +
+                  f"date_range_end=>to_timestamp_ltz('{t1}'), " +
+                  f"warehouse_name=>'{warehouse}')) " +
+                  "order by start_time;")
+    df = sfc.query(query_text).fetch_pandas_all()
+    df.columns = [c.lower() for c in df.columns]
+    return df[sf_columns]
+
+
+class Sampler:
+    def __init__(self, db, fp, warehouse=None, database=None,
+                 interval=None, settle=None, verbose=False):
+        """Background sampler of warehouse utilisation
+
+        Parameters
+        ----------
+        db : str, system sampled, either 'bq' or 'sf'
+        fp : str, absolute path of the CSV file samples are written to
+        warehouse : str, Snowflake warehouse to report on, if None
+            config.sf_warehouse_benchmark
+        database : str, Snowflake database whose information schema is
+            queried, i.e. SFTPC.database
+        interval : float, seconds between pulls, if None config.util_interval
+        settle : float, seconds after which a period is no longer pulled
+            again, if None config.util_settle
+        verbose : bool, print debug statements
+        """
+        assert db in ["bq", "sf"], "db must be 'bq' or 'sf'"
+        self.db = db
+        self.fp = fp
+        self.warehouse = config.sf_warehouse_benchmark if warehouse is None else warehouse
+        self.database = database
+        self.interval = config.util_interval if interval is None else interval
+        self.settle = config.util_settle if settle is None else settle
+        self.verbose = verbose
+
+        self.t0 = None
+        self.t1 = None
+        self.df = None
+        self.errors = []
+
+        self._watermark = None  # periods before this are settled
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pull(self, t0, t1):
+        if self.db == "bq":
+            return bq_timeline(t0, t1)
+        template = sf_tpc.SessionTemplate(warehouse=config.sf_warehouse_util,
+                                          database=self.database,
+                                          timezone="UTC",
+                                          query_tag="utilisation-sampler")
+        with sf_tpc.connection_pool().session(template) as sfc:
+            return sf_load_history(sfc, self.warehouse, t0, t1)
+
+    def sample_once(self, t1=None):
+        """Pull periods since the last settled one and rewrite self.fp
+
+        Parameters
+        ----------
+        t1 : pd.Timestamp, UTC end of periods to pull, if None now
+        """
+        now = pd.Timestamp.now("UTC")
+        t1 = now if t1 is None else t1
+        try:
+            df = self.pull(self._watermark, t1)
+        except Exception as e:
+            self.errors.append(str(e))
+            if self.verbose:
+                print("Utilisation sample failed:", e)
+            return
+
+        df["period_start"] = pd.to_datetime(df.period_start, utc=True)
+        if "period_end" in df.columns:
+            df["period_end"] = pd.to_datetime(df.period_end, utc=True)
+        df.insert(0, "db", self.db)
+        df["sampled"] = now
+
+        if self.df is not None:
+            # periods pulled again replace the earlier, possibly partial, pull
+            df = pd.concat([self.df.loc[self.df.period_start < self._watermark], df],
+                           ignore_index=True)
+        self.df = df.drop_duplicates(subset="period_start", keep="last")
+        self.df.to_csv(self.fp, index=False)
+
+        self._watermark = max(self._watermark, now - pd.Timedelta(seconds=self.settle))
+        if self.verbose:
+            print("Utilisation: {} periods to {}".format(len(self.df), t1))
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample_once()
+
+    def start(self):
+        """Start sampling from now in a daemon thread"""
+        self.t0 = pd.Timestamp.now("UTC")
+        self._watermark = self.t0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and make a final pull up to now
+
+        Returns
+        -------
+        Pandas DataFrame, all samples
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.t1 = pd.Timestamp.now("UTC")
+        self.sample_once(t1=self.t1)
+        return self.df
+
+
+def read(fp):
+    """Utilisation samples from a CSV file with UTC timestamps"""
+    df = pd.read_csv(fp)
+    for c in ["period_start", "period_end", "sampled"]:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], utc=True)
+    return df